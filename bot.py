@@ -12,8 +12,14 @@ import psutil
 import random
 import string
 import re
-from datetime import datetime, timedelta
-from telethon import TelegramClient, Button, events
+import functools
+import itertools
+import bisect
+import contextlib
+import contextvars
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, deque
+from telethon import TelegramClient, Button, events, utils
 from telethon.sessions import StringSession
 from telethon.tl.functions.account import UpdateProfileRequest
 from telethon.errors import (
@@ -27,23 +33,157 @@ from telethon.errors import (
     ChatWriteForbiddenError,
     UserBannedInChannelError,
     MessageNotModifiedError,
-    UserNotParticipantError
+    UserNotParticipantError,
+    UserIsBlockedError,
+    InputUserDeactivatedError,
+    PeerIdInvalidError,
+    FileReferenceExpiredError,
+    FileReferenceInvalidError,
+    FileReferenceEmptyError,
+    MediaEmptyError
 )
 from telethon.tl.functions.channels import GetParticipantRequest
 from telethon.tl.functions.messages import ForwardMessagesRequest
 from telethon.tl.types import Channel, Chat, User, InputPeerChannel, InputPeerChat
+from telethon.tl.types import UpdateChannelParticipant, ChannelParticipantLeft, ChannelParticipantBanned, PeerChannel
 from cryptography.fernet import Fernet
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, CursorNotFound
+from pymongo import monitoring
 import time
 import requests
+import urllib3
+import json
+import logging
+import logging.handlers
+import queue
+import atexit
+import threading
+import traceback
+import html
+import io
+import hmac
+import hashlib
+from requests.adapters import HTTPAdapter
 import qrcode
 import random
 
-from config import BOT_CONFIG, FREE_TIER, PREMIUM_TIER, MESSAGES, ADMIN_SETTINGS, TOPICS, INTERVAL_PRESETS, PROXIES, FORCE_JOIN, PLANS, PLAN_IMAGE_URL, OXAPAY_CONFIG
+from config import BOT_CONFIG, FREE_TIER, PREMIUM_TIER, MESSAGES, ADMIN_SETTINGS, TOPICS, INTERVAL_PRESETS, PROXIES, FORCE_JOIN, PLANS, PLAN_IMAGE_URL, OXAPAY_CONFIG, PROXY_POOL, LOGIN_SESSIONS, BROADCAST, HTTP_CLIENT, HTTP_SERVER, CALLBACK_JOBS, ROUTE_STATS, LOGGING, PREMIUM_EXPIRY, METRICS, TARGET_HEALTH
 import python_socks
+from python_socks.async_.asyncio import Proxy as SocksProxy
 
 CONFIG = BOT_CONFIG
 
+# ===================== Logging =====================
+# Log calls only enqueue the record (QueueHandler); a QueueListener thread formats and writes
+# it, so a slow stdout/log collector never blocks the event loop. Records carry structured
+# fields (user_id, account_id, job_id via extra= or a LoggerAdapter; route is filled in from
+# the handler being measured). Use %-style arguments so disabled levels cost nothing.
+# Per-send forwarding lines go to send_log_sampled, which keeps 1 in LOGGING['send_sample'].
+
+LOG_FIELDS = ('route', 'user_id', 'account_id', 'job_id', 'sample')
+
+log = logging.getLogger('adsye')
+login_log = log.getChild('login')
+payment_log = log.getChild('payment')
+http_log = log.getChild('http')
+forcejoin_log = log.getChild('forcejoin')
+proxy_log = log.getChild('proxy')
+forwarding_log = log.getChild('forwarding')
+send_log_sampled = forwarding_log.getChild('send')
+autoreply_log = log.getChild('autoreply')
+broadcast_log = log.getChild('broadcast')
+ads_log = log.getChild('ads')
+account_log = log.getChild('account')
+callback_log = log.getChild('callback')
+
+
+class FieldsFormatter(logging.Formatter):
+    """Text lines with trailing key=value fields, or one JSON object per record."""
+
+    def __init__(self, as_json=False):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {k: getattr(record, k) for k in LOG_FIELDS if getattr(record, k, None) is not None}
+        if self.as_json:
+            entry = {
+                'ts': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'msg': record.getMessage(),
+                **fields,
+            }
+            if record.exc_text:
+                entry['exc'] = record.exc_text
+            return json.dumps(entry, default=str, ensure_ascii=False)
+        line = super().format(record)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class RouteFilter(logging.Filter):
+    """Tags records with the main-bot route being handled (runs before the record is queued)."""
+
+    def filter(self, record):
+        if getattr(record, 'route', None) is None:
+            stats = route_stats_ctx.get()
+            if stats is not None:
+                record.route = stats['route']
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Keeps the first of every `every` records (warnings and above always pass)."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.seen = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.every <= 1:
+            return True
+        self.seen += 1
+        if (self.seen - 1) % self.every:
+            return False
+        record.sample = f"1/{self.every}"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records are dropped (and counted) while the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def setup_logging():
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(FieldsFormatter(as_json=LOGGING['format'] == 'json'))
+    handler = DroppingQueueHandler(queue.Queue(LOGGING['queue_size']))
+    handler.addFilter(RouteFilter())
+    listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=True)
+
+    log.setLevel(LOGGING['level'])
+    log.addHandler(handler)
+    log.propagate = False
+    send_log_sampled.addFilter(SampleFilter(LOGGING['send_sample']))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
+
 # Helper function to get username from user ID
 async def get_username_from_id(client, user_id: int):
     """Fetch username from Telegram using user ID"""
@@ -86,7 +226,192 @@ else:
         key = f.read().strip()
 cipher_suite = Fernet(key.encode())
 
-mongo_client = MongoClient(CONFIG['mongo_uri'])
+# ===================== Route Instrumentation =====================
+# Every main-bot handler runs with a fresh stats dict in route_stats_ctx. The Mongo command
+# listener and the patched client._call add their time and call counts to it, so one tap
+# yields (wall, mongo, rpc) for its route. The callback dispatcher renames the route to the
+# matched button ("cb:<data>"), commands are named after their /command. The last
+# ROUTE_STATS['samples'] calls per route are kept for p50/p95/p99 in /ping.
+
+route_stats_ctx = contextvars.ContextVar('route_stats', default=None)
+route_samples = {}  # {route: deque of (wall_ms, mongo_ms, mongo_calls, rpc_ms, rpc_calls)}
+route_totals = {}  # {route: calls since start}
+
+# Process-wide latency histograms (every Mongo command / Telegram RPC, in or out of a route)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def new_histogram():
+    return {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+
+
+def observe(histogram, seconds):
+    i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    if i < len(LATENCY_BUCKETS):
+        histogram['buckets'][i] += 1
+    histogram['sum'] += seconds
+    histogram['count'] += 1
+
+
+mongo_latency = new_histogram()
+rpc_latency = new_histogram()
+
+
+class MongoRouteTimer(monitoring.CommandListener):
+    """Charges each Mongo command to the route that issued it (also from asyncio.to_thread)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._charge(event)
+
+    def failed(self, event):
+        self._charge(event)
+
+    @staticmethod
+    def _charge(event):
+        observe(mongo_latency, event.duration_micros / 1e6)
+        stats = route_stats_ctx.get()
+        if stats is not None:
+            stats['mongo_ms'] += event.duration_micros / 1000
+            stats['mongo_calls'] += 1
+
+
+def name_current_route(name):
+    """Rename the route being measured; None drops the sample."""
+    stats = route_stats_ctx.get()
+    if stats is not None:
+        stats['route'] = name
+
+
+def record_route(stats, wall_ms):
+    route = stats['route']
+    if route is None:
+        return
+    samples = route_samples.get(route)
+    if samples is None:
+        samples = route_samples[route] = deque(maxlen=ROUTE_STATS['samples'])
+    samples.append((wall_ms, stats['mongo_ms'], stats['mongo_calls'], stats['rpc_ms'], stats['rpc_calls']))
+    route_totals[route] = route_totals.get(route, 0) + 1
+
+
+def _timed_handler(route, handler):
+    @functools.wraps(handler)
+    async def timed(event):
+        stats = {'route': route, 'mongo_ms': 0.0, 'mongo_calls': 0, 'rpc_ms': 0.0, 'rpc_calls': 0}
+        token = route_stats_ctx.set(stats)
+        memo_token = entitlements_memo.set({})
+        started = time.perf_counter()
+        try:
+            return await handler(event)
+        finally:
+            record_route(stats, (time.perf_counter() - started) * 1000)
+            entitlements_memo.reset(memo_token)
+            route_stats_ctx.reset(token)
+    return timed
+
+
+def spawn_detached(coro):
+    """Start a long-lived task (forwarder, broadcast) in an empty context.
+
+    create_task() copies the caller's context, so a loop started from a handler would keep
+    charging that tap's route stats and reusing its entitlements memo for its whole life.
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+
+def _handler_route_name(handler, event) -> str:
+    pattern = getattr(getattr(event, 'pattern', None), '__self__', None)
+    match = re.match(r'\^?(/\w+)', getattr(pattern, 'pattern', '') or '')
+    return match.group(1) if match else handler.__name__
+
+
+def _patch_client_route_timing(client):
+    """Time handlers registered with @client.on and the client's Telegram RPCs."""
+    def on(event):
+        def decorator(f):
+            client.add_event_handler(_timed_handler(_handler_route_name(f, event), f), event)
+            return f
+        return decorator
+    client.on = on
+    _patch_client_rpc_timing(client)
+
+
+def _patch_client_rpc_timing(client):
+    original_call = client._call
+
+    async def _call(sender, request, ordered=False, flood_sleep_threshold=None):
+        stats = route_stats_ctx.get()
+        started = time.perf_counter()
+        try:
+            return await original_call(sender, request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+        finally:
+            elapsed = time.perf_counter() - started
+            observe(rpc_latency, elapsed)
+            if stats is not None:
+                stats['rpc_ms'] += elapsed * 1000
+                stats['rpc_calls'] += 1
+
+    client._call = _call
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def route_summary():
+    """Per-route latency summary, slowest p95 first."""
+    rows = []
+    for route, samples in list(route_samples.items()):
+        samples = list(samples)
+        if not samples:
+            continue
+        walls = sorted(s[0] for s in samples)
+        n = len(samples)
+        rows.append({
+            'route': route,
+            'calls': route_totals.get(route, n),
+            'p50': _percentile(walls, 50),
+            'p95': _percentile(walls, 95),
+            'p99': _percentile(walls, 99),
+            'mongo_ms': sum(s[1] for s in samples) / n,
+            'mongo_calls': sum(s[2] for s in samples) / n,
+            'rpc_ms': sum(s[3] for s in samples) / n,
+            'rpc_calls': sum(s[4] for s in samples) / n,
+        })
+    rows.sort(key=lambda r: r['p95'], reverse=True)
+    return rows
+
+
+TELEGRAM_TEXT_LIMIT = 4096  # characters per message; admin reports budget against it
+
+
+def render_route_stats(limit=None, max_chars=None) -> str:
+    """Slowest routes first; stops before the text would exceed max_chars."""
+    rows = route_summary()
+    if not rows:
+        return "<code>No handler calls recorded yet.</code>"
+    rows = rows[:limit] if limit else rows
+    lines = []
+    used = len("<code></code>")
+    for i, r in enumerate(rows):
+        line = html.escape(
+            f"{r['route']} ×{r['calls']}\n"
+            f"  p50 {r['p50']:.0f} / p95 {r['p95']:.0f} / p99 {r['p99']:.0f} ms\n"
+            f"  db {r['mongo_calls']:.1f}× {r['mongo_ms']:.0f}ms · rpc {r['rpc_calls']:.1f}× {r['rpc_ms']:.0f}ms"
+        )
+        more = f"\n<i>… {len(rows) - i} more</i>"
+        if max_chars is not None and used + len(line) + len(more) + 1 > max_chars:
+            return "<code>" + "\n".join(lines) + "</code>" + more
+        lines.append(line)
+        used += len(line) + 1
+    return "<code>" + "\n".join(lines) + "</code>"
+
+
+mongo_client = MongoClient(CONFIG['mongo_uri'], event_listeners=[MongoRouteTimer()])
 db = mongo_client[CONFIG['db_name']]
 
 users_col = db['users']
@@ -99,6 +424,10 @@ account_failed_groups_col = db['account_failed_groups']
 account_flood_waits_col = db['account_flood_waits']
 logger_tokens_col = db['logger_tokens']
 admins_col = db['admins']
+broadcast_jobs_col = db['broadcast_jobs']
+invoices_col = db['invoices']
+delivery_metrics_col = db['delivery_metrics']
+target_health_col = db['target_health']
 
 # --- Session directory setup ---
 # Always store Telethon sqlite session files inside ./session/
@@ -121,6 +450,7 @@ for _name in ('main_bot', 'logger_bot'):
 # Point Telethon at the session base path (Telethon adds .session)
 main_bot = TelegramClient(os.path.join(SESSION_DIR, 'main_bot'), CONFIG['api_id'], CONFIG['api_hash'])
 logger_bot = TelegramClient(os.path.join(SESSION_DIR, 'logger_bot'), CONFIG['api_id'], CONFIG['api_hash'])
+_patch_client_route_timing(main_bot)
 
 # ===================== Custom Font Styling (font.txt) =====================
 # font.txt contains sample text using Unicode "Mathematical Monospace" letters/digits.
@@ -163,17 +493,37 @@ def _from_monospace_char(ch: str) -> str:
     return ch
 
 
+# str.translate tables built from the char mappings above (one C-level pass per chunk)
+_MONOSPACE_TABLE = {
+    o: _to_monospace_char(chr(o))
+    for o in (*range(0x30, 0x3A), *range(0x41, 0x5B), *range(0x61, 0x7B))
+}
+_ASCII_TABLE = {ord(v): chr(k) for k, v in _MONOSPACE_TABLE.items()}
+
+# HTML tokens left as-is: tags (re-normalized to ASCII) and character entities
+_HTML_TOKEN_RE = re.compile(r'<[^>]*>|&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);')
+
+# Markdown tokens: pre blocks, inline code, [text](url) links, bare URLs
+_MD_TOKEN_RE = re.compile(
+    r'(?P<pre>```.*?```)'
+    r'|(?P<code>`[^`\n]+`)'
+    r'|\[(?P<label>[^\]]*)\]\((?P<href>[^)\s]+)\)'
+    r'|(?P<url>(?:https?|tg)://\S+|\bt\.me/\S+)',
+    re.DOTALL,
+)
+
+
 def _normalize_html_tag(tag_text: str) -> str:
     """Normalize a single <...> tag by converting any monospace letters back to ASCII."""
     # Example: "<𝚋𝚕𝚘𝚌𝚔𝚚𝚞𝚘𝚝𝚎>" -> "<blockquote>"
-    return ''.join(_from_monospace_char(c) for c in tag_text)
+    return tag_text.translate(_ASCII_TABLE)
 
 
 def _stylize_plain(text: str) -> str:
     if not text:
         return text
     # Only transform basic latin letters/digits. Keep emojis, punctuation, RTL, etc.
-    return ''.join(_to_monospace_char(c) for c in str(text))
+    return str(text).translate(_MONOSPACE_TABLE)
 
 
 def _stylize_html(html: str) -> str:
@@ -186,67 +536,146 @@ def _stylize_html(html: str) -> str:
 
     s = str(html)
     out = []
-
-    in_entity = False
     in_code = False
-
-    i = 0
-    while i < len(s):
-        ch = s[i]
-
-        # Capture full HTML tag and normalize it (important if tag letters were stylized)
-        if ch == '<':
-            j = s.find('>', i + 1)
-            if j == -1:
-                # malformed tag; treat as plain text
-                out.append(_to_monospace_char(ch) if not in_code else ch)
-                i += 1
-                continue
-
-            tag = s[i:j + 1]
-            norm_tag = _normalize_html_tag(tag)
-
+    pos = 0
+
+    for m in _HTML_TOKEN_RE.finditer(s):
+        if m.start() > pos:
+            chunk = s[pos:m.start()]
+            out.append(chunk if in_code else chunk.translate(_MONOSPACE_TABLE))
+        token = m.group()
+        if token[0] == '<':
+            token = _normalize_html_tag(token)
             # Track <code>/<pre> blocks based on normalized tag
-            lower = norm_tag.lower()
-            if lower.startswith('<code'):
+            lower = token.lower()
+            if lower.startswith(('<code', '<pre')):
                 in_code = True
-            elif lower.startswith('</code'):
-                in_code = False
-            elif lower.startswith('<pre'):
-                in_code = True
-            elif lower.startswith('</pre'):
+            elif lower.startswith(('</code', '</pre')):
                 in_code = False
+        out.append(token)
+        pos = m.end()
 
-            out.append(norm_tag)
-            i = j + 1
-            continue
+    if pos < len(s):
+        tail = s[pos:]
+        out.append(tail if in_code else tail.translate(_MONOSPACE_TABLE))
+    return ''.join(out)
 
-        # Track HTML entities (&amp; etc.) so we don't corrupt them
-        if ch == '&':
-            in_entity = True
-            out.append(ch)
-            i += 1
-            continue
 
-        if in_entity:
-            out.append(ch)
-            if ch == ';':
-                in_entity = False
-            i += 1
-            continue
+def _stylize_markdown(text: str) -> str:
+    """Stylize Markdown text, keeping code spans, link targets and bare URLs intact."""
+    if not text:
+        return text
 
-        # Stylize only when not inside <code>/<pre>
-        out.append(_to_monospace_char(ch) if not in_code else ch)
-        i += 1
+    s = str(text)
+    out = []
+    pos = 0
+
+    for m in _MD_TOKEN_RE.finditer(s):
+        if m.start() > pos:
+            out.append(s[pos:m.start()].translate(_MONOSPACE_TABLE))
+        if m.group('label') is not None:
+            out.append(f"[{m.group('label').translate(_MONOSPACE_TABLE)}]({m.group('href')})")
+        else:
+            out.append(m.group())
+        pos = m.end()
 
+    if pos < len(s):
+        out.append(s[pos:].translate(_MONOSPACE_TABLE))
     return ''.join(out)
 
 
+# ===================== Render Cache =====================
+# Most outgoing texts and keyboards repeat (menus, static screens), so stylized results are
+# memoized: a bounded LRU keyed by the text / button spec, plus pinned entries for static
+# templates pre-rendered at import (see prestylize_static_ui()).
+
+RENDER_CACHE_SIZE = 2048
+_PINNED_TEXT_RENDERS = {}  # {(text, is_html): stylized text}
+_PINNED_KEYBOARD_RENDERS = {}  # {keyboard spec: rendered rows}
+
+
+def _is_html(parse_mode) -> bool:
+    return str(parse_mode).lower() == 'html'
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_text_cached(text: str, is_html: bool) -> str:
+    return _stylize_html(text) if is_html else _stylize_markdown(text)
+
+
+def _render_text(text: str, parse_mode=None) -> str:
+    """Stylize outgoing text, served from the pinned/LRU render caches."""
+    is_html = _is_html(parse_mode)
+    pinned = _PINNED_TEXT_RENDERS.get((text, is_html))
+    if pinned is not None:
+        return pinned
+    return _render_text_cached(text, is_html)
+
+
+def _button_spec(btn):
+    url = getattr(btn, 'url', None)
+    if url is not None:
+        return ('url', getattr(btn, 'text', None), url)
+    data = getattr(btn, 'data', None)
+    if data is not None:
+        return ('inline', getattr(btn, 'text', None), data)
+    return None
+
+
+def _keyboard_spec(buttons):
+    """Hashable description of a keyboard, or None if it has buttons we don't rebuild."""
+    spec = []
+    for row in buttons:
+        if isinstance(row, list):
+            row_spec = tuple(_button_spec(b) for b in row)
+            if None in row_spec:
+                return None
+            spec.append((True, row_spec))
+        else:
+            btn_spec = _button_spec(row)
+            if btn_spec is None:
+                return None
+            spec.append((False, btn_spec))
+    return tuple(spec)
+
+
+def _build_button(btn_spec):
+    kind, txt, target = btn_spec
+    if kind == 'url':
+        return Button.url(_stylize_plain(txt), target)
+    return Button.inline(_stylize_plain(txt), target)
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE // 4)
+def _render_keyboard_cached(spec):
+    return tuple(
+        tuple(_build_button(b) for b in item) if is_row else _build_button(item)
+        for is_row, item in spec
+    )
+
+
+def _render_keyboard(spec):
+    rendered = _PINNED_KEYBOARD_RENDERS.get(spec)
+    if rendered is None:
+        rendered = _render_keyboard_cached(spec)
+    # Fresh lists each time; the (immutable) button objects themselves are shared
+    return [list(item) if isinstance(item, tuple) else item for item in rendered]
+
+
 def _stylize_buttons(buttons):
-    """Recursively rebuild Telethon Button structures with stylized labels."""
+    """Return Telethon Button structures with stylized labels (memoized by button spec)."""
     if not buttons:
         return buttons
 
+    if isinstance(buttons, list):
+        try:
+            spec = _keyboard_spec(buttons)
+            if spec is not None:
+                return _render_keyboard(spec)
+        except TypeError:
+            # Unhashable label/data - fall back to rebuilding without the cache
+            pass
+
     def rebuild(btn):
         # Telethon buttons are lightweight objects created by telethon.Button
         try:
@@ -278,6 +707,22 @@ def _stylize_buttons(buttons):
     return buttons
 
 
+def prestylize(text: str, parse_mode=None) -> str:
+    """Pin the stylized form of a static template so sending it never re-stylizes."""
+    if text:
+        is_html = _is_html(parse_mode)
+        _PINNED_TEXT_RENDERS[(text, is_html)] = _render_text_cached.__wrapped__(text, is_html)
+    return text
+
+
+def prestylize_keyboard(buttons):
+    """Pin the rendered form of a static keyboard."""
+    spec = _keyboard_spec(buttons) if isinstance(buttons, list) else None
+    if spec is not None:
+        _PINNED_KEYBOARD_RENDERS[spec] = _render_keyboard_cached(spec)
+    return buttons
+
+
 def _patch_client_text_methods(client: TelegramClient):
     """Patch send_message/send_file/edit_message to stylize outgoing text/captions + button labels."""
     orig_send_message = client.send_message
@@ -291,12 +736,10 @@ def _patch_client_text_methods(client: TelegramClient):
         
         if not no_style:
             if len(args) >= 2 and isinstance(args[1], str) and 'message' not in kwargs:
-                parse_mode = kwargs.get('parse_mode')
                 args = list(args)
-                args[1] = _stylize_html(args[1]) if str(parse_mode).lower() == 'html' else _stylize_plain(args[1])
+                args[1] = _render_text(args[1], kwargs.get('parse_mode'))
             elif isinstance(kwargs.get('message'), str):
-                parse_mode = kwargs.get('parse_mode')
-                kwargs['message'] = _stylize_html(kwargs['message']) if str(parse_mode).lower() == 'html' else _stylize_plain(kwargs['message'])
+                kwargs['message'] = _render_text(kwargs['message'], kwargs.get('parse_mode'))
 
             if 'buttons' in kwargs:
                 kwargs['buttons'] = _stylize_buttons(kwargs['buttons'])
@@ -306,8 +749,7 @@ def _patch_client_text_methods(client: TelegramClient):
     async def send_file_wrapped(*args, **kwargs):
         # send_file(entity, file, caption=..., ...)
         if isinstance(kwargs.get('caption'), str):
-            parse_mode = kwargs.get('parse_mode')
-            kwargs['caption'] = _stylize_html(kwargs['caption']) if str(parse_mode).lower() == 'html' else _stylize_plain(kwargs['caption'])
+            kwargs['caption'] = _render_text(kwargs['caption'], kwargs.get('parse_mode'))
 
         if 'buttons' in kwargs:
             kwargs['buttons'] = _stylize_buttons(kwargs['buttons'])
@@ -321,11 +763,11 @@ def _patch_client_text_methods(client: TelegramClient):
         # Handle positional text argument (common when calling client.edit_message(entity, msg_id, text, ...))
         if len(args) >= 3 and isinstance(args[2], str) and 'text' not in kwargs:
             args = list(args)
-            args[2] = _stylize_html(args[2]) if str(parse_mode).lower() == 'html' else _stylize_plain(args[2])
+            args[2] = _render_text(args[2], parse_mode)
 
         # Handle keyword text
         if isinstance(kwargs.get('text'), str):
-            kwargs['text'] = _stylize_html(kwargs['text']) if str(parse_mode).lower() == 'html' else _stylize_plain(kwargs['text'])
+            kwargs['text'] = _render_text(kwargs['text'], parse_mode)
 
         if 'buttons' in kwargs:
             kwargs['buttons'] = _stylize_buttons(kwargs['buttons'])
@@ -341,29 +783,385 @@ def _patch_client_text_methods(client: TelegramClient):
 _patch_client_text_methods(main_bot)
 _patch_client_text_methods(logger_bot)
 
+
+# ===================== Static Media =====================
+# Static images are configured as URLs, which makes Telegram fetch the remote file on every
+# send. The photo from the first send is cached and reused by reference afterwards; if that
+# reference goes stale, the URL is sent again and the new reference cached.
+
+STATIC_MEDIA_URLS = {
+    url.strip() for url in (MESSAGES.get('welcome_image'), PLAN_IMAGE_URL, FORCE_JOIN.get('image_url'))
+    if url and url.strip()
+}
+static_media_cache = {}  # {url: Photo/Document from a previous send}
+_STALE_MEDIA_ERRORS = (FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError, MediaEmptyError)
+
+
+def render_qr_png(data: str) -> io.BytesIO:
+    """Render a QR code to an in-memory PNG (CPU-bound; run it via asyncio.to_thread)."""
+    buf = io.BytesIO()
+    qrcode.make(data).save(buf, format='PNG')
+    buf.seek(0)
+    buf.name = 'qr.png'  # lets Telethon send it as a photo
+    return buf
+
+
+def _patch_client_static_media(client: TelegramClient):
+    """Patch send_file so static image URLs are served from static_media_cache."""
+    orig_send_file = client.send_file
+
+    async def send_file_cached(*args, **kwargs):
+        # send_file(entity, file, ...); event.respond(file=...) ends up here too
+        args = list(args)
+        positional = len(args) >= 2
+        file = args[1] if positional else kwargs.get('file')
+        url = file.strip() if isinstance(file, str) else None
+        if url not in STATIC_MEDIA_URLS:
+            return await orig_send_file(*args, **kwargs)
+
+        def use(media):
+            if positional:
+                args[1] = media
+            else:
+                kwargs['file'] = media
+
+        cached = static_media_cache.get(url)
+        if cached is not None:
+            use(cached)
+            try:
+                return await orig_send_file(*args, **kwargs)
+            except _STALE_MEDIA_ERRORS:
+                static_media_cache.pop(url, None)
+            use(url)
+
+        msg = await orig_send_file(*args, **kwargs)
+        media = getattr(msg, 'photo', None) or getattr(msg, 'document', None)
+        if media is not None:
+            static_media_cache[url] = media
+        return msg
+
+    client.send_file = send_file_cached
+
+
+_patch_client_static_media(main_bot)
+
 user_states = {}
 forwarding_tasks = {}
 auto_reply_clients = {}
 last_replied = {}
 
+# ===================== Login Sessions =====================
+# The /add flow keeps a live, connected TelegramClient between the phone, OTP and 2FA steps.
+# Track those clients here so each user has at most one, the total is capped, and abandoned
+# logins are disconnected by login_reaper_loop() after LOGIN_SESSIONS['ttl'].
+
+LOGIN_ACTIONS = ('phone', 'otp', '2fa')
+pending_logins = {}  # {user_id: {'client': TelegramClient, 'started_at': float}}
+
+def login_capacity_reached(uid):
+    return uid not in pending_logins and len(pending_logins) >= LOGIN_SESSIONS['max_pending']
+
+def new_login_state(**fields):
+    """user_states entry for a login step (timestamped so the reaper can expire it)."""
+    return {**fields, 'started_at': time.time()}
+
+async def _disconnect_login_client(uid):
+    entry = pending_logins.pop(uid, None)
+    if entry:
+        try:
+            await entry['client'].disconnect()
+        except Exception:
+            pass
+
+async def begin_login(uid, client):
+    """Register a user's login client, replacing (and disconnecting) any previous one."""
+    previous = pending_logins.get(uid)
+    if previous and previous['client'] is not client:
+        await _disconnect_login_client(uid)
+    pending_logins[uid] = {'client': client, 'started_at': time.time()}
+
+async def end_login(uid):
+    """Disconnect the user's pending login client and drop their login state."""
+    await _disconnect_login_client(uid)
+    state = user_states.get(uid)
+    if isinstance(state, dict) and state.get('action') in LOGIN_ACTIONS:
+        del user_states[uid]
+
+async def reap_expired_logins():
+    cutoff = time.time() - LOGIN_SESSIONS['ttl']
+    
+    expired = [uid for uid, entry in pending_logins.items() if entry['started_at'] < cutoff]
+    for uid, state in list(user_states.items()):
+        if (isinstance(state, dict) and state.get('action') in LOGIN_ACTIONS
+                and state.get('started_at', 0) < cutoff and uid not in expired):
+            expired.append(uid)
+    
+    for uid in expired:
+        had_client = uid in pending_logins
+        await end_login(uid)
+        if had_client:
+            try:
+                await main_bot.send_message(uid, "Login timed out. Use /add to try again.")
+            except Exception:
+                pass
+    
+    if expired:
+        login_log.info("Reaped %d expired login(s), %d pending", len(expired), len(pending_logins))
+
+async def login_reaper_loop():
+    while True:
+        await asyncio.sleep(LOGIN_SESSIONS['reap_interval'])
+        try:
+            await reap_expired_logins()
+        except Exception as e:
+            login_log.warning("Reaper error: %s", e)
+
 # Payment tracking (gateway.py integration)
-active_invoices = {}
+# Invoices live in invoices_col (pay_id unique). The Verify button treats pending invoices
+# older than INVOICE_TTL as expired, but signed gateway callbacks may still settle them until
+# their expires_at (INVOICE_RETENTION), when a TTL index drops them. The atomic pending ->
+# paid transition makes grants idempotent; a grant that fails releases the claim again.
+INVOICE_TTL = timedelta(minutes=30)
+INVOICE_RETENTION = timedelta(days=1)
+INVOICE_CACHE_SIZE = 256
+invoice_cache = OrderedDict()  # small front cache {pay_id: invoice}
 payment_verify_cooldown = {}  # {user_id: timestamp} for rate limiting
+VERIFY_COOLDOWN = 10  # seconds between verify taps
+
+
+def _cache_invoice(invoice):
+    invoice_cache[invoice['pay_id']] = invoice
+    invoice_cache.move_to_end(invoice['pay_id'])
+    while len(invoice_cache) > INVOICE_CACHE_SIZE:
+        invoice_cache.popitem(last=False)
+
+
+def create_invoice(pay_id, user_id, plan, amount, **extra):
+    now = datetime.now()
+    invoice = {
+        'pay_id': pay_id,
+        'user_id': user_id,
+        'plan': plan,
+        'amount': amount,
+        'status': 'pending',
+        'created_at': now,
+        # TTL index compares against UTC
+        'expires_at': datetime.now(timezone.utc) + INVOICE_RETENTION,
+        **extra
+    }
+    invoices_col.insert_one(invoice)
+    _cache_invoice(invoice)
+    return invoice
+
+
+def get_invoice(pay_id, include_stale=False):
+    """Pending/paid invoice by pay_id, or None if unknown or expired.
+
+    include_stale keeps pending invoices past INVOICE_TTL (for signed gateway callbacks).
+    """
+    invoice = invoice_cache.get(pay_id)
+    if invoice is None:
+        invoice = invoices_col.find_one({'pay_id': pay_id})
+        if invoice is None:
+            return None
+        _cache_invoice(invoice)
+    if include_stale:
+        return invoice
+    if invoice.get('status') == 'pending' and datetime.now() - invoice['created_at'] > INVOICE_TTL:
+        invoice_cache.pop(pay_id, None)
+        return None
+    return invoice
+
+
+def claim_invoice(pay_id, **fields):
+    """Atomically mark a pending invoice paid. Returns the invoice only for the first caller."""
+    invoice = invoices_col.find_one_and_update(
+        {'pay_id': pay_id, 'status': 'pending'},
+        {'$set': {'status': 'paid', 'paid_at': datetime.now(), **fields}, '$unset': {'expires_at': ''}},
+        return_document=ReturnDocument.AFTER
+    )
+    invoice_cache.pop(pay_id, None)
+    return invoice
+
+
+def release_invoice(pay_id):
+    """Undo claim_invoice() after a failed grant, so a retry (webhook or Verify) can claim it."""
+    invoices_col.update_one(
+        {'pay_id': pay_id, 'status': 'paid'},
+        {'$set': {'status': 'pending', 'expires_at': datetime.now(timezone.utc) + INVOICE_RETENTION},
+         '$unset': {'paid_at': '', 'paid_via': ''}}
+    )
+    invoice_cache.pop(pay_id, None)
+
+
+def cancel_invoice(pay_id, user_id):
+    invoices_col.delete_one({'pay_id': pay_id, 'user_id': user_id, 'status': 'pending'})
+    invoice_cache.pop(pay_id, None)
+
+
+def apply_invoice_plan(invoice):
+    """Grant a claimed invoice's plan. On failure the claim is released and the error re-raised.
+
+    Callers must have claimed the invoice first (claim_invoice) so a payment is granted
+    exactly once.
+    """
+    plan_name = invoice['plan']
+    # Grant premium with plan name (for 30-day expiry tracking)
+    plan_display_name = plan_name.replace('plan_', '').capitalize() if 'plan_' in plan_name else plan_name.capitalize()
+    try:
+        set_user_premium(invoice['user_id'], PLANS[plan_name]['max_accounts'], plan_display_name)
+    except Exception:
+        release_invoice(invoice['pay_id'])
+        raise
+
+
+async def announce_invoice_plan(invoice) -> bool:
+    """Confirm a granted plan to the buyer and open the dashboard.
+
+    Returns False if the confirmation UI could not be sent (premium stays granted).
+    """
+    uid = invoice['user_id']
+    plan = PLANS[invoice['plan']]
+
+    # Notify + open dashboard (best effort). If user has blocked bot / chat issues,
+    # we still keep premium granted and show a fallback message.
+    try:
+        welcome_image = MESSAGES.get('welcome_image', '')
+        notify_text = (
+            "<b>🎉 Payment Confirmed!</b>\n\n"
+            f"<b>Plan:</b> {plan['name']}\n"
+            f"<b>Accounts:</b> {plan['max_accounts']}\n"
+            "<b>Validity:</b> 30 days\n\n"
+            "<i>Your premium features are now active!</i>\n"
+            "<i>Opening dashboard...</i>"
+        )
+
+        if welcome_image:
+            await main_bot.send_file(uid, welcome_image, caption=notify_text, parse_mode='html')
+        else:
+            await main_bot.send_message(uid, notify_text, parse_mode='html')
+
+        # Wait a moment for user to see the success message
+        await asyncio.sleep(2)
+
+        # Automatically redirect to dashboard
+        accounts = get_user_accounts(uid)
+        dashboard_text = (
+            f"<b>🏠 Dashboard</b>\n\n"
+            f"<b>👤 User ID:</b> <code>{uid}</code>\n"
+            f"<b>📊 Plan:</b> {plan['name']} {plan.get('emoji', '✨')}\n"
+            f"<b>🔢 Max Accounts:</b> {plan['max_accounts']}\n"
+            f"<b>📱 Current Accounts:</b> {len(accounts)}/{plan['max_accounts']}\n"
+            f"<b>📅 Expires:</b> {(datetime.now() + timedelta(days=30)).strftime('%d %b %Y')}\n\n"
+            "<i>Start by adding your Telegram accounts!</i>"
+        )
+        dashboard_buttons = [
+            [Button.inline("➕ Add Account", b"add_account")],
+            [Button.inline("📋 My Accounts", b"list_accounts")],
+            [Button.inline("📦 Plans", b"back_plans"), Button.inline("ℹ️ Help", b"help")]
+        ]
+        await main_bot.send_message(uid, dashboard_text, parse_mode='html', buttons=dashboard_buttons)
+        return True
+    except Exception as e:
+        payment_log.warning("Post-upgrade UI send failed: %s", e, extra={'user_id': uid})
+        try:
+            await main_bot.send_message(
+                uid,
+                "✅ Premium activated. Type /start to open dashboard.",
+            )
+        except Exception:
+            pass
+        return False
+
+
+def check_verify_cooldown(user_id):
+    """Seconds left before user_id may verify again (0 = allowed, and starts a new window)."""
+    now = time.time()
+    remaining = VERIFY_COOLDOWN - (now - payment_verify_cooldown.get(user_id, 0))
+    if remaining > 0:
+        return int(remaining) + 1
+    payment_verify_cooldown[user_id] = now
+    if len(payment_verify_cooldown) > 1000:
+        for key in [k for k, t in payment_verify_cooldown.items() if now - t >= VERIFY_COOLDOWN]:
+            del payment_verify_cooldown[key]
+    return 0
 
 ACCOUNTS_PER_PAGE = 7
 
 # Gateway settings (from gateway.py)
-GATEWAY_URL = "https://oddus-gateway.vercel.app"
+GATEWAY_URL = os.getenv('GATEWAY_URL', "https://oddus-gateway.vercel.app")
 CLIENT_ID = "ADSYE"
-NOTIFICATION_URL = "ADSYEads.site"
+NOTIFICATION_URL = HTTP_SERVER['upi_notification_url']
+
+# ===================== HTTP Client =====================
+# Payment providers are called through one pooled keep-alive session. Each request runs in a
+# worker thread so a slow provider never blocks the event loop (and with it, ad delivery).
+# Every provider has its own circuit: after repeated failures calls fail fast for a while.
+
+_http_session = requests.Session()
+_http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_CLIENT['pool_size']))
+_http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_CLIENT['pool_size']))
+http_circuits = {}  # {service: {'failures': int, 'open_until': monotonic}}
+
+
+def _request_not_sent(exc) -> bool:
+    """True if the request provably never reached the server (safe to retry any call)."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _record_http_result(service, ok):
+    circuit = http_circuits.setdefault(service, {'failures': 0, 'open_until': 0.0})
+    if ok:
+        circuit['failures'] = 0
+        return
+    circuit['failures'] += 1
+    if circuit['failures'] >= HTTP_CLIENT['breaker_failures']:
+        circuit['open_until'] = time.monotonic() + HTTP_CLIENT['breaker_cooldown']
+        http_log.warning("%s circuit open for %ss", service, HTTP_CLIENT['breaker_cooldown'])
+
+
+async def http_post_json(service, endpoint, url, payload, idempotent=False):
+    """POST JSON without blocking the loop; returns the requests.Response.
+
+    Retries with jittered exponential backoff. Non-idempotent calls are only retried
+    when the request never reached the server. Raises if the provider's circuit is open.
+    """
+    circuit = http_circuits.get(service)
+    if circuit and circuit['open_until'] > time.monotonic():
+        raise RuntimeError(f"{service} temporarily unavailable, try again shortly")
+
+    timeout = (HTTP_CLIENT['connect_timeout'], HTTP_CLIENT['timeouts'].get(endpoint, 15))
+    attempts = HTTP_CLIENT['retries'] + 1
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            resp = await asyncio.to_thread(
+                _http_session.post, url, json=payload, timeout=timeout,
+                headers={'Content-Type': 'application/json'}
+            )
+        except requests.RequestException as e:
+            if last or not (idempotent or _request_not_sent(e)):
+                _record_http_result(service, False)
+                raise
+        else:
+            if resp.status_code < 500 or last or not idempotent:
+                _record_http_result(service, resp.status_code < 500)
+                return resp
+        await asyncio.sleep(HTTP_CLIENT['backoff'] * (2 ** attempt) * random.uniform(0.5, 1.5))
 
 # ===================== Gateway Helper Functions =====================
 
+# Gateway endpoints that are safe to repeat (status lookups)
+GATEWAY_IDEMPOTENT = ('upi/verify',)
+
 async def call_gateway(endpoint, payload):
     """Call gateway API (from gateway.py logic)."""
     try:
         url = f"{GATEWAY_URL}/api/v1/{endpoint}"
-        resp = requests.post(url, json=payload, timeout=15, headers={'Content-Type': 'application/json'})
+        resp = await http_post_json('gateway', endpoint, url, payload, idempotent=endpoint in GATEWAY_IDEMPOTENT)
         
         if resp.status_code == 200:
             data = resp.json()
@@ -371,7 +1169,7 @@ async def call_gateway(endpoint, payload):
         
         return False, f"Gateway Error: {resp.status_code}"
     except Exception as e:
-        print(f"[GATEWAY] Error: {e}")
+        payment_log.warning("Gateway error: %s", e)
         return False, str(e)
 
 # ===================== Oxapay Crypto Payment Helper =====================
@@ -398,16 +1196,14 @@ async def create_oxapay_invoice(amount_usd, plan_name, user_id):
             "orderId": order_id
         }
         
-        resp = requests.post(
-            OXAPAY_CONFIG['api_url'],
-            json=payload,
-            timeout=15,
-            headers={'Content-Type': 'application/json'}
-        )
+        resp = await http_post_json('oxapay', 'oxapay/invoice', OXAPAY_CONFIG['api_url'], payload)
         
         if resp.status_code == 200:
             data = resp.json()
             if data.get('result') == 100:  # Success
+                # Tracked like UPI invoices; the Oxapay webhook settles it by trackId
+                create_invoice(str(data.get('trackId')), user_id, plan_name, amount_usd,
+                               provider='oxapay', order_id=order_id)
                 return True, {
                     'trackId': data.get('trackId'),
                     'payLink': data.get('payLink'),
@@ -419,48 +1215,498 @@ async def create_oxapay_invoice(amount_usd, plan_name, user_id):
         
         return False, f"HTTP {resp.status_code}"
     except Exception as e:
-        print(f"[OXAPAY] Error: {e}")
+        payment_log.warning("Oxapay error: %s", e)
         return False, str(e)
 
-# ===================== Force Join (Config-based: Channel + Group) =====================
+# ===================== HTTP Server (payment webhooks) =====================
+# Minimal asyncio HTTP/1.1 endpoint running inside the bot's event loop. Routes are registered
+# with @http_route; handlers get (headers, raw_body) and return (status, text[, content_type]).
 
-def _forcejoin_usernames():
-    ch = (FORCE_JOIN.get('channel_username') or '').strip().lstrip('@')
-    gp = (FORCE_JOIN.get('group_username') or '').strip().lstrip('@')
-    return ch, gp
+http_routes = {}  # {(method, path): handler}
 
-async def _is_member_of(username: str, user_id: int) -> bool:
-    if not username:
-        return True
+_HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+
+def http_route(method, path):
+    def register(handler):
+        http_routes[(method, path)] = handler
+        return handler
+    return register
+
+
+async def _read_http_request(reader):
+    request_line = await asyncio.wait_for(reader.readline(), 10)
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), 10)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > HTTP_SERVER['max_body']:
+        return method, target, headers, None
+    body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b''
+    return method, target, headers, body
+
+
+async def _handle_http(reader, writer):
+    content_type = 'text/plain; charset=utf-8'
     try:
-        entity = await main_bot.get_entity(username)
-        await main_bot(GetParticipantRequest(entity, user_id))
-        return True
-    except (UserNotParticipantError, ChannelPrivateError, ValueError):
-        return False
+        method, target, headers, body = await _read_http_request(reader)
+        handler = http_routes.get((method, target.split('?', 1)[0]))
+        if body is None:
+            status, text = 413, 'payload too large'
+        elif handler is None:
+            status, text = 404, 'not found'
+        else:
+            result = await handler(headers, body)
+            status, text = result[0], result[1]
+            if len(result) > 2:
+                content_type = result[2]
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        status, text = 400, 'bad request'
+    except Exception as e:
+        http_log.exception("Handler error: %s", e)
+        status, text = 500, 'error'
+
+    payload = text.encode('utf-8')
+    try:
+        writer.write(
+            f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + payload
+        )
+        await writer.drain()
     except Exception:
-        # Fail-open to avoid locking everyone out if Telegram errors
-        return True
+        pass
+    finally:
+        writer.close()
 
-async def is_user_passed_forcejoin(user_id: int) -> bool:
-    if is_admin(user_id):
-        return True
-    if not FORCE_JOIN.get('enabled', False):
-        return True
 
-    channel_username, group_username = _forcejoin_usernames()
-    # If misconfigured (missing usernames), don't block
-    if not channel_username and not group_username:
-        return True
+async def start_http_server():
+    if not HTTP_SERVER['upi_secret'] and http_routes.pop(('POST', '/upi/webhook'), None):
+        http_log.warning("UPI_WEBHOOK_SECRET is not set - /upi/webhook is disabled")
+    if not OXAPAY_CONFIG.get('merchant_api_key') and http_routes.pop(('POST', '/oxapay/webhook'), None):
+        http_log.warning("OXAPAY_MERCHANT_KEY is not set - /oxapay/webhook is disabled")
+    server = await asyncio.start_server(_handle_http, HTTP_SERVER['host'], HTTP_SERVER['port'])
+    http_log.info("Listening on %s:%s", HTTP_SERVER['host'], HTTP_SERVER['port'])
+    return server
 
-    ok_channel = await _is_member_of(channel_username, user_id)
-    ok_group = await _is_member_of(group_username, user_id)
-    return ok_channel and ok_group
 
-def forcejoin_keyboard():
-    channel_username, group_username = _forcejoin_usernames()
-    buttons = []
-    if channel_username:
+def _valid_signature(secret, body, signature, digest) -> bool:
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, digest).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+async def _settle_invoice(pay_id, amount=None, via='webhook'):
+    """Claim a paid invoice from a gateway callback and grant its plan (exactly once)."""
+    invoice = get_invoice(pay_id, include_stale=True) if pay_id else None
+    if not invoice:
+        return 404, 'unknown invoice'
+    if amount is not None and invoice.get('amount') is not None:
+        try:
+            if abs(float(amount) - float(invoice['amount'])) > 0.001:
+                payment_log.warning("Amount mismatch for %s: expected %s, got %s", pay_id, invoice['amount'], amount)
+                return 400, 'amount mismatch'
+        except (TypeError, ValueError):
+            pass
+    claimed = claim_invoice(pay_id, paid_via=via)
+    if claimed:
+        payment_log.info("%s paid via %s, granting %s", pay_id, via, claimed['plan'], extra={'user_id': claimed['user_id']})
+        try:
+            apply_invoice_plan(claimed)
+        except Exception as e:
+            # Claim released: the gateway's retry of this callback grants it
+            payment_log.error("Grant failed for %s: %s", pay_id, e, extra={'user_id': claimed['user_id']})
+            return 500, 'grant failed'
+        asyncio.create_task(announce_invoice_plan(claimed))
+    return 200, 'ok'
+
+
+def _json_object(body):
+    """Parse a callback body; None unless it is a JSON object."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@http_route('POST', '/upi/webhook')
+async def upi_webhook(headers, body):
+    # No fallback secret: start_http_server() drops this route when UPI_WEBHOOK_SECRET is unset
+    if not _valid_signature(HTTP_SERVER['upi_secret'], body, headers.get('x-signature'), hashlib.sha256):
+        return 401, 'invalid signature'
+    data = _json_object(body)
+    if data is None:
+        return 400, 'bad request'
+    status = str(data.get('status', '')).lower().strip()
+    if not (status in {'paid', 'already_paid', 'success'} or data.get('paid') is True):
+        return 200, 'ignored'
+    return await _settle_invoice(data.get('pay_id'), data.get('amount'), via='upi_webhook')
+
+
+@http_route('POST', '/oxapay/webhook')
+async def oxapay_webhook(headers, body):
+    if not _valid_signature(OXAPAY_CONFIG.get('merchant_api_key'), body, headers.get('hmac'), hashlib.sha512):
+        return 401, 'invalid signature'
+    data = _json_object(body)
+    if data is None:
+        return 400, 'bad request'
+    if str(data.get('status', '')).lower() != 'paid':
+        return 200, 'ignored'
+    return await _settle_invoice(str(data.get('trackId')), data.get('amount'), via='oxapay_webhook')
+
+
+# ===================== Metrics Export =====================
+# GET /metrics serves Prometheus text format from in-process state only (no Mongo or Telegram
+# calls), so scraping stays cheap while the loop is busy. Every series carries a shard label
+# (METRICS['shard']) so several bot processes can be scraped into one dashboard.
+
+# lag in seconds (window = worst since the last system sample); beat = last probe wake-up
+loop_lag = {'last': 0.0, 'max': 0.0, 'window': 0.0, 'beat': time.monotonic()}
+
+
+async def loop_lag_probe():
+    interval = METRICS['loop_lag_interval']
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        loop_lag['beat'] = time.monotonic()
+        lag = max(0.0, loop_lag['beat'] - started - interval)
+        loop_lag['last'] = lag
+        loop_lag['max'] = max(loop_lag['max'], lag)
+        loop_lag['window'] = max(loop_lag['window'], lag)
+
+
+# The probe above only sees a stall after it ends. A daemon thread watches its heartbeat and,
+# while the loop is stuck past METRICS['block_threshold'], samples the loop thread's stack.
+# Samples are grouped by the innermost bot.py frame and the leaf call it was blocked in.
+# Only the last few frames of the worst sample are kept, as "name (file:line)" lines, so
+# /blocking fits in one Telegram message.
+STALL_FRAMES = 4
+loop_stalls = {}  # {(bot frame, leaf frame): {'stalls', 'samples', 'worst', 'total', 'stack'}}
+loop_stalls_lock = threading.Lock()
+
+
+def _frame_label(f):
+    return f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+
+
+def _stall_key(stack):
+    own = [f for f in stack if os.path.basename(f.filename) == 'bot.py']
+    culprit = own[-1] if own else stack[-1]
+    leaf = stack[-1]
+    return _frame_label(culprit), _frame_label(leaf)
+
+
+def _record_stall(stack, stalled, new_stall):
+    key = _stall_key(stack)
+    with loop_stalls_lock:
+        entry = loop_stalls.setdefault(key, {'stalls': 0, 'samples': 0, 'worst': 0.0, 'total': 0.0, 'stack': ''})
+        entry['samples'] += 1
+        if new_stall:
+            entry['stalls'] += 1
+        # first sample covers the stall so far, later ones the watchdog's poll interval
+        entry['total'] += stalled if new_stall else METRICS['block_threshold'] / 2
+        if stalled >= entry['worst']:
+            entry['worst'] = stalled
+            entry['stack'] = '\n'.join(_frame_label(f) for f in stack[-STALL_FRAMES:])
+
+
+def _loop_watchdog(loop_thread_id):
+    threshold = METRICS['block_threshold']
+    interval = METRICS['loop_lag_interval']
+    sampled_beat = None
+    while True:
+        time.sleep(threshold / 2)
+        beat = loop_lag['beat']
+        stalled = time.monotonic() - beat - interval
+        if stalled < threshold:
+            continue
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            continue
+        stack = traceback.extract_stack(frame)
+        del frame
+        _record_stall(stack, stalled, new_stall=beat != sampled_beat)
+        sampled_beat = beat
+
+
+def start_loop_watchdog():
+    """Call from the event loop thread, right after scheduling loop_lag_probe()."""
+    loop_lag['beat'] = time.monotonic()
+    threading.Thread(target=_loop_watchdog, args=(threading.get_ident(),),
+                     name='loop-watchdog', daemon=True).start()
+
+
+def render_loop_stalls(limit=None, max_chars=None) -> str:
+    """Worst stall sites first; stops before the text would exceed max_chars."""
+    with loop_stalls_lock:
+        ranked = sorted(loop_stalls.items(), key=lambda kv: kv[1]['total'], reverse=True)
+    if not ranked:
+        return f"<i>No stalls over {METRICS['block_threshold']:g}s recorded.</i>"
+    ranked = ranked[:limit]
+    lines = []
+    used = 0
+    for i, ((culprit, leaf), e) in enumerate(ranked):
+        entry = (
+            f"<b>{html.escape(culprit)}</b> → <code>{html.escape(leaf)}</code>\n"
+            f"<code>{e['stalls']} stalls · worst {e['worst']:.2f}s · ~{e['total']:.1f}s blocked</code>\n"
+            f"<pre>{html.escape(e['stack'])}</pre>"
+        )
+        more = f"<i>… {len(ranked) - i} more</i>"
+        if max_chars is not None and used + len(entry) + len(more) + 2 > max_chars:
+            lines.append(more)
+            break
+        lines.append(entry)
+        used += len(entry) + 1
+    return '\n'.join(lines)
+
+
+def _prom_labels(**labels):
+    labels = {'shard': METRICS['shard'], **labels}
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+def _prom_metric(lines, name, kind, help_text, samples):
+    """samples: iterable of (labels dict, value)."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_prom_labels(**labels)} {value}")
+
+
+def _prom_histogram(lines, name, help_text, histogram):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+        cumulative += count
+        lines.append(f"{name}_bucket{_prom_labels(le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_prom_labels(le='+Inf')} {histogram['count']}")
+    lines.append(f"{name}_sum{_prom_labels()} {histogram['sum']:.6f}")
+    lines.append(f"{name}_count{_prom_labels()} {histogram['count']}")
+
+
+def render_prometheus() -> str:
+    lines = []
+
+    running = {}
+    for account_id, task in list(forwarding_tasks.items()):
+        if not task.done():
+            tier = account_tiers.get(str(account_id), 'unknown')
+            running[tier] = running.get(tier, 0) + 1
+    _prom_metric(lines, 'adsye_forwarding_tasks', 'gauge', 'Running forwarding loops by plan.',
+                 [({'tier': tier}, n) for tier, n in sorted(running.items())])
+
+    for field, name, help_text in (
+        ('sent', 'adsye_sends_total', 'Messages delivered to target groups.'),
+        ('failed', 'adsye_send_failures_total', 'Failed deliveries (including FloodWait).'),
+        ('flood_wait_s', 'adsye_floodwait_seconds_total', 'Seconds of FloodWait imposed by Telegram.'),
+    ):
+        _prom_metric(lines, name, 'counter', help_text,
+                     [({'tier': tier}, value) for (tier, f), value in sorted(delivery_counters.items()) if f == field])
+
+    _prom_metric(lines, 'adsye_asyncio_tasks', 'gauge', 'Tasks alive on the event loop.',
+                 [({}, len(asyncio.all_tasks()))])
+    _prom_metric(lines, 'adsye_callback_jobs', 'gauge', 'Background button actions in flight.',
+                 [({}, sum(len(jobs) for jobs in callback_jobs.values()))])
+    _prom_metric(lines, 'adsye_queue_depth', 'gauge', 'Items waiting in internal queues.', [
+        ({'queue': 'expiry_notices'}, expiry_notices.qsize()),
+        ({'queue': 'log'}, log_listener.queue.qsize()),
+    ])
+    _prom_metric(lines, 'adsye_log_records_dropped_total', 'counter', 'Log records dropped while the log queue was full.',
+                 [({}, DroppingQueueHandler.dropped)])
+    _prom_metric(lines, 'adsye_pending_logins', 'gauge', 'Login clients held between /add steps.',
+                 [({}, len(pending_logins))])
+    _prom_metric(lines, 'adsye_event_loop_lag_seconds', 'gauge', 'Event loop wake-up delay (last probe and max since start).', [
+        ({'stat': 'last'}, f"{loop_lag['last']:.6f}"),
+        ({'stat': 'max'}, f"{loop_lag['max']:.6f}"),
+    ])
+    with loop_stalls_lock:
+        stalls = sum(e['stalls'] for e in loop_stalls.values())
+    _prom_metric(lines, 'adsye_event_loop_stalls_total', 'counter', 'Stalls longer than the watchdog threshold.',
+                 [({}, stalls)])
+    _prom_metric(lines, 'adsye_process_resident_memory_bytes', 'gauge', 'Resident set size of the bot process.',
+                 [({}, _process.memory_info().rss)])
+
+    _prom_histogram(lines, 'adsye_mongo_command_seconds', 'Mongo command latency.', mongo_latency)
+    _prom_histogram(lines, 'adsye_telegram_rpc_seconds', 'Telegram RPC latency (bot and user clients).', rpc_latency)
+    return '\n'.join(lines) + '\n'
+
+
+@http_route('GET', '/metrics')
+async def metrics_endpoint(headers, body):
+    token = HTTP_SERVER['metrics_token']
+    if token and not hmac.compare_digest(headers.get('authorization', ''), f"Bearer {token}"):
+        return 401, 'unauthorized'
+    return 200, render_prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ===================== System Sampler =====================
+# /ping and the admin stats screens read from here instead of probing on demand: a background
+# task records one sample every METRICS['system_interval'] seconds into a ring buffer, and the
+# Mongo counts are refreshed off the loop every METRICS['counts_interval'] seconds.
+# cpu_percent(None) compares against the previous call, so it never sleeps.
+
+system_samples = deque(maxlen=METRICS['system_samples'])
+system_counts = {'users': 0, 'active_accounts': 0, 'accounts': 0, 'at': None}
+_process = psutil.Process()
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def take_system_sample():
+    mem = psutil.virtual_memory()
+    disk = psutil.disk_usage(os.path.abspath(os.sep))
+    fds = _process.num_fds() if hasattr(_process, 'num_fds') else _process.num_handles()
+    sample = {
+        'at': time.time(),
+        'cpu': psutil.cpu_percent(None),
+        'proc_cpu': _process.cpu_percent(None),
+        'rss': _process.memory_info().rss,
+        'fds': fds,
+        'ram_percent': mem.percent, 'ram_used': mem.used, 'ram_total': mem.total,
+        'disk_percent': disk.percent, 'disk_used': disk.used, 'disk_total': disk.total,
+        'tasks': len(asyncio.all_tasks()),
+        'forwarders': sum(1 for t in list(forwarding_tasks.values()) if not t.done()),
+        'loop_lag': loop_lag['window'],
+    }
+    loop_lag['window'] = 0.0
+    system_samples.append(sample)
+    return sample
+
+
+def latest_system_sample():
+    return system_samples[-1] if system_samples else take_system_sample()
+
+
+def refresh_system_counts():
+    system_counts.update(
+        users=users_col.count_documents({}),
+        active_accounts=accounts_col.count_documents({'is_forwarding': True}),
+        accounts=accounts_col.count_documents({}),
+        at=datetime.now(),
+    )
+
+
+async def system_sampler_loop():
+    last_counts = 0.0
+    while True:
+        try:
+            take_system_sample()
+            if time.monotonic() - last_counts >= METRICS['counts_interval']:
+                last_counts = time.monotonic()
+                await asyncio.to_thread(refresh_system_counts)
+        except Exception as e:
+            log.warning("System sample failed: %s", e)
+        await asyncio.sleep(METRICS['system_interval'])
+
+
+def sparkline(values) -> str:
+    values = list(values)
+    if not values:
+        return ''
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    return ''.join(SPARK_CHARS[int((v - low) / span * (len(SPARK_CHARS) - 1))] for v in values)
+
+
+def system_trend(field, points=24) -> str:
+    """Sparkline of the last `points` samples of one field."""
+    return sparkline(s[field] for s in list(system_samples)[-points:])
+
+
+# ===================== Force Join (Config-based: Channel + Group) =====================
+
+def _forcejoin_usernames():
+    ch = (FORCE_JOIN.get('channel_username') or '').strip().lstrip('@')
+    gp = (FORCE_JOIN.get('group_username') or '').strip().lstrip('@')
+    return ch, gp
+
+# Required chats are resolved once at startup; positive membership checks are cached per
+# user for FORCE_JOIN['member_ttl'] seconds and dropped when a leave/kick update arrives.
+_forcejoin_entities = {}  # {username: InputPeer}
+_forcejoin_chat_ids = set()  # marked peer ids of the required chats
+forcejoin_passed_until = {}  # {user_id: monotonic expiry}
+
+async def resolve_forcejoin_entities():
+    for username in _forcejoin_usernames():
+        if not username:
+            continue
+        try:
+            entity = await main_bot.get_input_entity(username)
+            _forcejoin_entities[username] = entity
+            _forcejoin_chat_ids.add(utils.get_peer_id(entity))
+        except Exception as e:
+            forcejoin_log.warning("Could not resolve @%s: %s", username, e)
+
+async def _forcejoin_entity(username: str):
+    entity = _forcejoin_entities.get(username)
+    if entity is None:
+        entity = await main_bot.get_input_entity(username)
+        _forcejoin_entities[username] = entity
+        _forcejoin_chat_ids.add(utils.get_peer_id(entity))
+    return entity
+
+def _remember_forcejoin_pass(user_id: int):
+    now = time.monotonic()
+    if len(forcejoin_passed_until) > 10000:
+        for key in [k for k, until in forcejoin_passed_until.items() if until <= now]:
+            del forcejoin_passed_until[key]
+    forcejoin_passed_until[user_id] = now + FORCE_JOIN['member_ttl']
+
+def invalidate_forcejoin(user_id: int):
+    forcejoin_passed_until.pop(user_id, None)
+
+async def _is_member_of(username: str, user_id: int) -> bool:
+    if not username:
+        return True
+    try:
+        entity = await _forcejoin_entity(username)
+        await main_bot(GetParticipantRequest(entity, user_id))
+        return True
+    except (UserNotParticipantError, ChannelPrivateError, ValueError):
+        return False
+    except Exception:
+        # Fail-open to avoid locking everyone out if Telegram errors
+        return True
+
+async def is_user_passed_forcejoin(user_id: int) -> bool:
+    if is_admin(user_id):
+        return True
+    if not FORCE_JOIN.get('enabled', False):
+        return True
+
+    channel_username, group_username = _forcejoin_usernames()
+    # If misconfigured (missing usernames), don't block
+    if not channel_username and not group_username:
+        return True
+
+    until = forcejoin_passed_until.get(user_id)
+    if until and until > time.monotonic():
+        return True
+
+    ok_channel = await _is_member_of(channel_username, user_id)
+    ok_group = await _is_member_of(group_username, user_id)
+    if ok_channel and ok_group:
+        _remember_forcejoin_pass(user_id)
+        return True
+    return False
+
+def forcejoin_keyboard():
+    channel_username, group_username = _forcejoin_usernames()
+    buttons = []
+    if channel_username:
         buttons.append([Button.url("Join Channel", f"https://t.me/{channel_username}")])
     if group_username:
         buttons.append([Button.url("Join Group", f"https://t.me/{group_username}")])
@@ -488,20 +1734,126 @@ async def enforce_forcejoin_or_prompt(event, edit=False) -> bool:
     await send_forcejoin_prompt(event, edit=edit)
     return False
 
-def is_admin(user_id):
+@main_bot.on(events.ChatAction(func=lambda e: e.user_left or e.user_kicked))
+async def forcejoin_on_leave(event):
+    """Drop cached membership when a user leaves/is removed from a required chat."""
+    if event.chat_id in _forcejoin_chat_ids:
+        for user_id in event.user_ids:
+            invalidate_forcejoin(user_id)
+
+@main_bot.on(events.Raw(UpdateChannelParticipant))
+async def forcejoin_on_participant_update(update):
+    # Channel leaves don't produce service messages; admins get participant updates instead
+    if utils.get_peer_id(PeerChannel(update.channel_id)) not in _forcejoin_chat_ids:
+        return
+    if update.new_participant is None or isinstance(update.new_participant, (ChannelParticipantLeft, ChannelParticipantBanned)):
+        invalidate_forcejoin(update.user_id)
+
+# ===================== Entitlements =====================
+# What a user may do (admin flag, plan, limits, delays) is resolved once per incoming update
+# by resolve_entitlements() and memoised in entitlements_memo for the rest of that update
+# (main-bot handlers get a fresh memo from _timed_handler). Outside an update, e.g. in the
+# forwarding loops (started with spawn_detached, so they don't inherit a handler's memo),
+# every call resolves again so plan changes and expiry apply per round.
+# Expired premium resolves to Scout even before the sweeper downgrades the user document.
+
+entitlements_memo = contextvars.ContextVar('entitlements_memo', default=None)
+
+PREMIUM_PLAN_KEYS = ('grow', 'prime', 'dominion', 'test')
+
+
+def _lookup_admin(user_id):
     # Owner is always admin
     try:
         if int(user_id) == int(CONFIG['owner_id']):
-            print(f"[DEBUG] User {user_id} is OWNER - Admin access granted")
             return True
         # Check if user is in admins collection
-        is_db_admin = admins_col.find_one({'user_id': int(user_id)}) is not None
-        print(f"[DEBUG] User {user_id} DB admin check: {is_db_admin}")
-        return is_db_admin
+        return admins_col.find_one({'user_id': int(user_id)}, {'_id': 1}) is not None
     except Exception as e:
-        print(f"[ERROR] is_admin check failed for {user_id}: {e}")
+        log.error("is_admin check failed: %s", e, extra={'user_id': user_id})
         return False
 
+
+def _premium_plan_key(user):
+    plan_key = str(user.get('plan_name') or '').lower()
+    if plan_key in PREMIUM_PLAN_KEYS:
+        return plan_key
+    # Backward compatibility: derive from max_accounts
+    max_acc = user.get('max_accounts', 1)
+    if max_acc >= 15:
+        return 'dominion'
+    if max_acc >= 7:
+        return 'prime'
+    return 'grow'
+
+
+def resolve_entitlements(user_id):
+    """Return the user's entitlements dict (memoised for the current update)."""
+    user_id = int(user_id)
+    memo = entitlements_memo.get()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+
+    admin = _lookup_admin(user_id)
+    user = users_col.find_one(
+        {'user_id': user_id},
+        {'_id': 0, 'tier': 1, 'plan_name': 1, 'max_accounts': 1, 'premium_expires_at': 1, 'approved': 1}
+    ) or {}
+
+    expires_at = user.get('premium_expires_at')
+    expired = isinstance(expires_at, datetime) and expires_at < datetime.now()
+    premium = user.get('tier') == 'premium' and not expired
+
+    if admin:
+        plan = 'dominion'
+    elif premium:
+        plan = _premium_plan_key(user)
+    else:
+        plan = 'scout'
+    limits = PLANS[plan]
+
+    if admin:
+        max_accounts = 999  # Admins get unlimited accounts
+    elif premium:
+        max_accounts = user.get('max_accounts', limits['max_accounts'])
+    else:
+        max_accounts = FREE_TIER['max_accounts']
+
+    ent = {
+        'user_id': user_id,
+        'admin': admin,
+        'premium': admin or premium,
+        'approved': admin or user.get('approved', False),
+        'plan': plan,
+        'plan_name': limits['name'],
+        'expires_at': expires_at if premium else None,
+        'expired': expired,
+        'max_accounts': max_accounts,
+        'max_topics': limits['max_topics'],
+        'max_groups_per_topic': limits['max_groups_per_topic'],
+        'msg_delay': limits['msg_delay'],
+        'group_delay': limits['group_delay'],
+        'round_delay': limits['round_delay'],
+        'auto_reply_enabled': limits['auto_reply_enabled'],
+        'logs_enabled': limits['logs_enabled'],
+        # Per-account config is a Prime/Dominion feature (custom grants of 7+ accounts count)
+        'per_account_config': admin or (premium and max_accounts >= 7),
+    }
+    if memo is not None:
+        memo[user_id] = ent
+    return ent
+
+
+def forget_entitlements(user_id):
+    """Drop a memoised entitlement after changing the user's plan/admin state mid-update."""
+    memo = entitlements_memo.get()
+    if memo is not None:
+        memo.pop(int(user_id), None)
+
+
+def is_admin(user_id):
+    return resolve_entitlements(user_id)['admin']
+
 def get_user(user_id):
     user = users_col.find_one({'user_id': int(user_id)})
     if not user:
@@ -518,38 +1870,20 @@ def get_user(user_id):
     return user
 
 def is_premium(user_id):
-    if is_admin(user_id):
-        return True
-    user = get_user(user_id)
-    return user.get('tier') == 'premium'
+    return resolve_entitlements(user_id)['premium']
 
 def has_per_account_config_access(user_id):
     """Check if user can access per-account config (Prime/Dominion only)."""
-    if is_admin(user_id):
-        return True
-    user = get_user(user_id)
-    # Check if user has enough accounts granted (Prime=7+, Dominion=15+)
-    max_accs = user.get('max_accounts', 1)
-    return max_accs >= 7  # Prime tier or higher
+    return resolve_entitlements(user_id)['per_account_config']
 
 def get_user_tier_settings(user_id):
-    if is_premium(user_id):
-        return PREMIUM_TIER.copy()
-    return FREE_TIER.copy()
+    return resolve_entitlements(user_id)
 
 def get_user_max_accounts(user_id):
-    if is_admin(user_id):
-        return 999  # Admins get unlimited accounts
-    user = get_user(user_id)
-    if user.get('tier') == 'premium':
-        return user.get('max_accounts', PREMIUM_TIER['max_accounts'])
-    return FREE_TIER['max_accounts']
+    return resolve_entitlements(user_id)['max_accounts']
 
 def is_approved(user_id):
-    if is_admin(user_id):
-        return True
-    user = get_user(user_id)
-    return user.get('approved', False)
+    return resolve_entitlements(user_id)['approved']
 
 def approve_user(user_id):
     users_col.update_one(
@@ -557,6 +1891,7 @@ def approve_user(user_id):
         {'$set': {'approved': True, 'approved_at': datetime.now()}},
         upsert=True
     )
+    forget_entitlements(user_id)
 
 def set_user_premium(user_id, max_accounts, plan_name='premium'):
     """Grant premium with 30-day expiry (monthly subscription)."""
@@ -573,18 +1908,98 @@ def set_user_premium(user_id, max_accounts, plan_name='premium'):
         }},
         upsert=True
     )
+    forget_entitlements(user_id)
 
 def remove_user_premium(user_id):
     users_col.update_one(
         {'user_id': int(user_id)},
         {'$set': {'tier': 'free', 'max_accounts': FREE_TIER['max_accounts']}}
     )
+    forget_entitlements(user_id)
+
+# Fields needed by admin user listings (skips heavy fields such as recent_logs)
+USER_LIST_PROJECTION = {'_id': 0, 'user_id': 1, 'username': 1, 'tier': 1, 'max_accounts': 1}
+
+def get_all_users(limit=0):
+    return list(users_col.find({}, USER_LIST_PROJECTION).limit(limit))
+
+def get_premium_users(limit=0):
+    return list(users_col.find({'tier': 'premium'}, USER_LIST_PROJECTION).limit(limit))
+
+def _next_user_ids(cursor, n):
+    return [u['user_id'] for u in itertools.islice(cursor, n) if u.get('user_id') is not None]
+
+async def iter_user_id_batches(query=None, after=None, batch_size=500):
+    """Stream user_ids (ascending) from a server-side cursor, one batch at a time.
 
-def get_all_users():
-    return list(users_col.find({}))
+    Only {user_id: 1} is projected, so memory stays flat regardless of user count. Each
+    getMore runs in a worker thread. If the cursor times out during a long pause (e.g. a
+    FloodWait), it is reopened after the last id yielded.
+    """
+    base = dict(query or {})
+
+    def open_cursor(last):
+        q = dict(base)
+        if last is not None:
+            q['user_id'] = {'$gt': last}
+        return users_col.find(q, {'_id': 0, 'user_id': 1}, batch_size=batch_size).sort('user_id', 1)
+
+    cursor = open_cursor(after)
+    try:
+        while True:
+            try:
+                ids = await asyncio.to_thread(_next_user_ids, cursor, batch_size)
+            except CursorNotFound:
+                cursor = open_cursor(after)
+                continue
+            if not ids:
+                return
+            after = ids[-1]
+            yield ids
+    finally:
+        cursor.close()
+
+# Errors meaning the bot can't reach the user until they /start it again
+UNDELIVERABLE_ERRORS = (UserIsBlockedError, InputUserDeactivatedError, PeerIdInvalidError)
+DELIVERABLE_QUERY = {'deliverable': {'$ne': False}}
+
+def mark_undeliverable(reasons):
+    """Flag users as unreachable ({user_id: error name}) so bulk sends skip them."""
+    if not reasons:
+        return
+    now = datetime.now()
+    users_col.bulk_write([
+        UpdateOne({'user_id': user_id}, {'$set': {
+            'deliverable': False,
+            'undeliverable_reason': reason,
+            'undeliverable_at': now
+        }})
+        for user_id, reason in reasons.items()
+    ], ordered=False)
+
+def revive_user(user_id):
+    """Clear the unreachable flag once the user talks to the bot again."""
+    users_col.update_one(
+        {'user_id': int(user_id), 'deliverable': False},
+        {'$unset': {'deliverable': '', 'undeliverable_reason': '', 'undeliverable_at': ''}}
+    )
 
-def get_premium_users():
-    return list(users_col.find({'tier': 'premium'}))
+def ensure_indexes():
+    """Create the indexes the bulk/streaming paths rely on (idempotent)."""
+    users_col.create_index('user_id')
+    users_col.create_index('tier')
+    # Proxy pool: pick_proxy() counts pinned accounts per proxy
+    accounts_col.create_index('proxy_key')
+    # Premium expiry sweep: one range scan over premium users by expiry date
+    users_col.create_index([('tier', 1), ('premium_expires_at', 1)])
+    broadcast_jobs_col.create_index('status')
+    invoices_col.create_index('pay_id', unique=True)
+    # Pending invoices expire via TTL; paid ones have expires_at unset and are kept
+    invoices_col.create_index('expires_at', expireAfterSeconds=0)
+    delivery_metrics_col.create_index([('account_id', 1), ('group_key', 1), ('hour', 1)], unique=True)
+    delivery_metrics_col.create_index([('owner_id', 1), ('hour', 1)])
+    delivery_metrics_col.create_index('hour', expireAfterSeconds=METRICS['retention_days'] * 86400)
+    target_health_col.create_index([('account_id', 1), ('group_key', 1)], unique=True)
 
 def get_user_accounts(user_id):
     return list(accounts_col.find({'owner_id': user_id}).sort('added_at', 1))
@@ -636,10 +2051,6 @@ def update_account_stats(account_id, sent=0, failed=0):
         upsert=True
     )
 
-def is_group_failed(account_id, group_key):
-    failed = account_failed_groups_col.find_one({'account_id': account_id, 'group_key': group_key})
-    return failed is not None
-
 def mark_group_failed(account_id, group_key, error):
     account_failed_groups_col.update_one(
         {'account_id': account_id, 'group_key': group_key},
@@ -649,6 +2060,7 @@ def mark_group_failed(account_id, group_key, error):
 
 def clear_failed_groups(account_id):
     account_failed_groups_col.delete_many({'account_id': account_id})
+    reset_target_health(account_id)
 
 def get_flood_wait(account_id, group_key):
     doc = account_flood_waits_col.find_one({'account_id': account_id, 'group_key': group_key})
@@ -687,15 +2099,337 @@ def get_active_flood_waits(account_id):
 def generate_token(length=16):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
-proxy_index = 0
+# ===================== Delivery Metrics =====================
+# Pre-aggregated hourly buckets in delivery_metrics_col, one document per
+# (account_id, group_key, hour); group_key None is the account-level total. Forwarders call
+# record_delivery(), which only bumps counters in memory; metrics_flush_loop() turns the
+# buffer into one $inc upsert per bucket every METRICS['flush_interval'] seconds. Analytics
+# read bounded ranges through the (owner_id, hour) index, so cost tracks the window, not
+# history.
+
+METRIC_FIELDS = ('sent', 'failed', 'flood_wait_s', 'permanent_fail', 'auto_replies')
+metrics_buffer = {}  # {(account_id, group_key, hour): {'owner_id', 'title', <METRIC_FIELDS>}}
+delivery_counters = {}  # {(plan, field): total since start}, exported at /metrics
+account_tiers = {}  # {account_id: plan}, refreshed by the forwarding loops every round
+
+
+def _metric_hour(when=None):
+    return (when or datetime.now()).replace(minute=0, second=0, microsecond=0)
+
+
+def _bump_metrics(key, owner_id, title, counts):
+    bucket = metrics_buffer.get(key)
+    if bucket is None:
+        bucket = metrics_buffer[key] = {'owner_id': owner_id, 'title': title}
+    elif title:
+        bucket['title'] = title
+    for field, value in counts.items():
+        if value:
+            bucket[field] = bucket.get(field, 0) + value
+
+
+def record_delivery(account_id, owner_id, group_key=None, title=None, **counts):
+    """Count one outcome (sent=1, failed=1, flood_wait_s=..., ...) for the current hour."""
+    hour = _metric_hour()
+    account_id = str(account_id)
+    tier = account_tiers.get(account_id, 'unknown')
+    for field, value in counts.items():
+        delivery_counters[(tier, field)] = delivery_counters.get((tier, field), 0) + value
+    _bump_metrics((account_id, None, hour), owner_id, None, counts)
+    if group_key is not None:
+        _bump_metrics((account_id, str(group_key), hour), owner_id, title, counts)
+
+
+def _take_metric_batch():
+    """Swap the buffer out and build one $inc upsert per bucket (call on the loop thread)."""
+    global metrics_buffer
+    pending, metrics_buffer = metrics_buffer, {}
+    batch = []
+    for key, bucket in pending.items():
+        account_id, group_key, hour = key
+        inc = {f: bucket[f] for f in METRIC_FIELDS if bucket.get(f)}
+        if not inc:
+            continue
+        update = {'$inc': inc, '$setOnInsert': {'owner_id': bucket['owner_id']}}
+        if bucket.get('title'):
+            update['$set'] = {'title': bucket['title']}
+        batch.append((key, bucket, UpdateOne({'account_id': account_id, 'group_key': group_key, 'hour': hour}, update, upsert=True)))
+    return batch
 
-def get_next_proxy():
-    global proxy_index
-    if not PROXIES:
-        return None
-    proxy = PROXIES[proxy_index % len(PROXIES)]
-    proxy_index += 1
-    
+
+def _write_metric_batch(batch):
+    """Bulk-write a batch (safe off the loop thread). Returns the entries that were not applied."""
+    if not batch:
+        return []
+    try:
+        delivery_metrics_col.bulk_write([op for _, _, op in batch], ordered=False)
+    except BulkWriteError as e:
+        # Unordered: everything but the reported write errors was applied
+        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+        log.warning("Metrics flush: %d of %d bucket(s) failed", len(failed), len(batch))
+        return [batch[i] for i in sorted(failed)]
+    except Exception as e:
+        log.warning("Metrics flush failed: %s", e)
+        return batch
+    return []
+
+
+def _requeue_metrics(failed):
+    for key, bucket, _ in failed:
+        _bump_metrics(key, bucket['owner_id'], bucket.get('title'), {f: bucket.get(f, 0) for f in METRIC_FIELDS})
+
+
+def flush_metrics():
+    """Write the buffered counters now, on the calling thread; failed buckets are re-queued."""
+    batch = _take_metric_batch()
+    failed = _write_metric_batch(batch)
+    _requeue_metrics(failed)
+    return len(batch) - len(failed)
+
+
+async def metrics_flush_loop():
+    # The buffer is only touched on the loop thread; the worker thread just gets the ops
+    while True:
+        await asyncio.sleep(METRICS['flush_interval'])
+        batch = _take_metric_batch()
+        _requeue_metrics(await asyncio.to_thread(_write_metric_batch, batch))
+
+
+def delivery_totals(owner_id, since):
+    """Account-level totals for a user since `since`."""
+    rows = list(delivery_metrics_col.aggregate([
+        {'$match': {'owner_id': owner_id, 'hour': {'$gte': _metric_hour(since)}, 'group_key': None}},
+        {'$group': {'_id': None, **{f: {'$sum': f'${f}'} for f in METRIC_FIELDS}}},
+    ]))
+    totals = rows[0] if rows else {}
+    return {f: totals.get(f, 0) for f in METRIC_FIELDS}
+
+
+def group_leaderboard(owner_id, since, limit=3, min_attempts=3):
+    """(best, worst) target groups since `since`, by delivery rate then volume."""
+    rows = list(delivery_metrics_col.aggregate([
+        {'$match': {'owner_id': owner_id, 'hour': {'$gte': _metric_hour(since)}, 'group_key': {'$ne': None}}},
+        {'$sort': {'hour': 1}},
+        {'$group': {
+            '_id': {'account_id': '$account_id', 'group_key': '$group_key'},
+            'title': {'$last': '$title'},
+            'sent': {'$sum': '$sent'},
+            'failed': {'$sum': '$failed'},
+            'flood_wait_s': {'$sum': '$flood_wait_s'},
+        }},
+    ]))
+    scored = []
+    for r in rows:
+        attempts = r.get('sent', 0) + r.get('failed', 0)
+        if attempts >= min_attempts:
+            r['rate'] = r['sent'] / attempts
+            r['attempts'] = attempts
+            scored.append(r)
+    # With few groups, split them so one group is never listed as both best and worst
+    n = min(limit, max(1, len(scored) // 2))
+    ranked = sorted(scored, key=lambda r: (r['rate'], r['attempts']), reverse=True)
+    best = ranked[:n]
+    worst = [r for r in reversed(ranked[n:]) if r['failed']][:n]
+    return best, worst
+
+
+# ===================== Target Health =====================
+# Each (account, group) pair has a health score: an exponential moving average of recent
+# outcomes (sent = 1, errors and flood waits = 0). Rounds send to the healthiest groups first.
+# Repeated errors put a group in backoff (retry_at) that doubles with every further failure,
+# replacing the old permanent exclusion; one successful send clears it. Scores live in memory
+# (loaded per account on first use) and changed entries are written to target_health_col
+# every TARGET_HEALTH['flush_interval'] seconds. Deleting an account drops its entries from both.
+
+target_health = {}  # {(account_id, group_key): {'score', 'streak', 'retry_at', 'title', 'dirty'}}
+_target_health_loaded = set()  # account_ids whose entries were read from Mongo
+
+
+def load_target_health(account_id):
+    account_id = str(account_id)
+    if account_id in _target_health_loaded:
+        return
+    for doc in target_health_col.find({'account_id': account_id}):
+        target_health.setdefault((account_id, doc['group_key']), {
+            'score': doc.get('score', TARGET_HEALTH['initial']),
+            'streak': doc.get('streak', 0),
+            'retry_at': doc.get('retry_at'),
+            'title': doc.get('title'),
+            'dirty': False,
+        })
+    _target_health_loaded.add(account_id)
+
+
+def _target_entry(account_id, group_key):
+    key = (str(account_id), str(group_key))
+    entry = target_health.get(key)
+    if entry is None:
+        entry = target_health[key] = {
+            'score': TARGET_HEALTH['initial'], 'streak': 0, 'retry_at': None, 'title': None, 'dirty': False,
+        }
+    return entry
+
+
+def target_score(account_id, group_key):
+    entry = target_health.get((str(account_id), str(group_key)))
+    return entry['score'] if entry else TARGET_HEALTH['initial']
+
+
+def target_backoff_remaining(account_id, group_key):
+    """Seconds until a backed-off group may be tried again (0 = ready)."""
+    entry = target_health.get((str(account_id), str(group_key)))
+    if not entry or not entry['retry_at']:
+        return 0
+    return max(0, int((entry['retry_at'] - datetime.now()).total_seconds()))
+
+
+def record_target_outcome(account_id, group_key, outcome, title=None):
+    """Update a group's health after a send: outcome is 'sent', 'flood', 'error' or 'blocked'."""
+    entry = _target_entry(account_id, group_key)
+    alpha = TARGET_HEALTH['alpha']
+    entry['score'] = (1 - alpha) * entry['score'] + alpha * (1.0 if outcome == 'sent' else 0.0)
+    if title:
+        entry['title'] = title
+    entry['dirty'] = True
+
+    if outcome == 'sent':
+        if entry['streak'] or entry['retry_at']:
+            account_failed_groups_col.delete_one({'account_id': str(account_id), 'group_key': str(group_key)})
+        entry['streak'] = 0
+        entry['retry_at'] = None
+    elif outcome == 'flood':
+        pass  # flood waits are skipped via account_flood_waits_col; only the score drops
+    else:
+        entry['streak'] += 1
+        if outcome == 'blocked':
+            delay = TARGET_HEALTH['permanent_backoff'] * 2 ** (entry['streak'] - 1)
+        elif entry['streak'] >= 2:
+            delay = TARGET_HEALTH['backoff_base'] * 2 ** (entry['streak'] - 2)
+        else:
+            return  # a single transient error only lowers the score
+        entry['retry_at'] = datetime.now() + timedelta(seconds=min(delay, TARGET_HEALTH['backoff_max']))
+
+
+def order_targets(account_id, targets, key='key'):
+    """Drop groups in backoff and sort the rest healthiest first. Returns (ready, backed_off)."""
+    ready = [t for t in targets if not target_backoff_remaining(account_id, t[key])]
+    ready.sort(key=lambda t: target_score(account_id, t[key]), reverse=True)
+    return ready, len(targets) - len(ready)
+
+
+def reset_target_health(account_id):
+    """Forget backoffs for an account (user cleared failed groups); scores are kept."""
+    account_id = str(account_id)
+    for (acc_id, _), entry in target_health.items():
+        if acc_id == account_id and (entry['streak'] or entry['retry_at']):
+            entry['streak'] = 0
+            entry['retry_at'] = None
+            entry['dirty'] = True
+
+
+def forget_target_health(account_id):
+    """Drop an account's entries from memory and Mongo (account deleted)."""
+    account_id = str(account_id)
+    for key in [k for k in target_health if k[0] == account_id]:
+        del target_health[key]
+    _target_health_loaded.discard(account_id)
+    target_health_col.delete_many({'account_id': account_id})
+
+
+def _take_target_health_batch():
+    """Build upserts for changed entries and clear their dirty flags (call on the loop thread)."""
+    batch = []
+    for key, entry in target_health.items():
+        if not entry['dirty']:
+            continue
+        entry['dirty'] = False
+        account_id, group_key = key
+        batch.append((key, UpdateOne(
+            {'account_id': account_id, 'group_key': group_key},
+            {'$set': {
+                'score': round(entry['score'], 4), 'streak': entry['streak'], 'retry_at': entry['retry_at'],
+                'title': entry['title'], 'updated_at': datetime.now(),
+            }},
+            upsert=True
+        )))
+    return batch
+
+
+def _write_target_health_batch(batch):
+    """Bulk-write a batch (safe off the loop thread). Returns the keys that were not applied."""
+    if not batch:
+        return []
+    try:
+        target_health_col.bulk_write([op for _, op in batch], ordered=False)
+    except BulkWriteError as e:
+        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+        log.warning("Target health flush: %d of %d entries failed", len(failed), len(batch))
+        return [batch[i][0] for i in sorted(failed)]
+    except Exception as e:
+        log.warning("Target health flush failed: %s", e)
+        return [key for key, _ in batch]
+    return []
+
+
+def _redirty_target_health(keys):
+    # Entries of accounts deleted meanwhile are gone and stay gone
+    for key in keys:
+        entry = target_health.get(key)
+        if entry is not None:
+            entry['dirty'] = True
+
+
+def flush_target_health():
+    """Write changed entries now, on the calling thread; failed ones stay dirty."""
+    batch = _take_target_health_batch()
+    failed = _write_target_health_batch(batch)
+    _redirty_target_health(failed)
+    return len(batch) - len(failed)
+
+
+async def target_health_flush_loop():
+    while True:
+        await asyncio.sleep(TARGET_HEALTH['flush_interval'])
+        batch = _take_target_health_batch()
+        failed = await asyncio.to_thread(_write_target_health_batch, batch)
+        _redirty_target_health(failed)
+
+
+def render_target_health(account_id, limit=5) -> str:
+    """Short health summary for an account's groups (weakest first)."""
+    load_target_health(account_id)
+    account_id = str(account_id)
+    entries = [(key, e) for (acc_id, key), e in target_health.items() if acc_id == account_id]
+    if not entries:
+        return "Health: no sends recorded yet"
+    healthy = sum(1 for _, e in entries if e['score'] >= 0.6 and not e['retry_at'])
+    backing_off = [(k, e) for k, e in entries if target_backoff_remaining(account_id, k)]
+    lines = [f"Health: {healthy}/{len(entries)} healthy, {len(backing_off)} backing off"]
+    for key, e in sorted(entries, key=lambda ke: ke[1]['score'])[:limit]:
+        wait = target_backoff_remaining(account_id, key)
+        status = f" (retry in {wait // 3600}h {wait % 3600 // 60}m)" if wait else ""
+        lines.append(f"• {(e['title'] or key)[:24]}: {e['score'] * 100:.0f}%{status}")
+    return "\n".join(lines)
+
+
+# ===================== Proxy Pool =====================
+# Every proxy in PROXIES is probed in the background (handshake through the proxy to a
+# Telegram DC). Each account is pinned to one healthy proxy (accounts.proxy_key) and is
+# moved to another one when its proxy degrades. Used for login, forwarding and refresh clients.
+
+proxy_health = {}  # {proxy_key: {'alive': bool, 'latency': float|None, 'failures': int, 'checked_at': datetime}}
+
+def _proxy_key(proxy):
+    return f"{proxy['host']}:{proxy['port']}"
+
+def _proxy_by_key(key):
+    for proxy in PROXIES:
+        if _proxy_key(proxy) == key:
+            return proxy
+    return None
+
+def _proxy_tuple(proxy):
+    """Convert a PROXIES entry into the tuple format Telethon expects."""
     proxy_type = python_socks.ProxyType.SOCKS5
     if proxy['type'].lower() == 'socks4':
         proxy_type = python_socks.ProxyType.SOCKS4
@@ -704,6 +2438,112 @@ def get_next_proxy():
     
     return (proxy_type, proxy['host'], proxy['port'], True, proxy.get('username'), proxy.get('password'))
 
+def is_proxy_healthy(key):
+    if _proxy_by_key(key) is None:
+        return False
+    health = proxy_health.get(key)
+    # Not probed yet: assume usable so startup isn't blocked on the first probe
+    return health is None or health['alive']
+
+def _proxy_loads(keys):
+    """Pinned account count per proxy key, in one indexed aggregate."""
+    rows = accounts_col.aggregate([
+        {'$match': {'proxy_key': {'$in': keys}}},
+        {'$group': {'_id': '$proxy_key', 'n': {'$sum': 1}}},
+    ])
+    return {row['_id']: row['n'] for row in rows}
+
+def pick_proxy(exclude=None):
+    """Pick a healthy proxy: fewest pinned accounts first, then lowest handshake latency.
+
+    Queries Mongo, so async code calls it (and get_account_proxy) through asyncio.to_thread.
+    """
+    if not PROXIES:
+        return None
+    
+    candidates = [p for p in PROXIES if _proxy_key(p) != exclude and is_proxy_healthy(_proxy_key(p))]
+    if not candidates:
+        # Everything is degraded - keep using the pool rather than silently going direct
+        candidates = [p for p in PROXIES if _proxy_key(p) != exclude] or list(PROXIES)
+    
+    loads = _proxy_loads([_proxy_key(p) for p in candidates])
+    
+    def score(proxy):
+        key = _proxy_key(proxy)
+        latency = (proxy_health.get(key) or {}).get('latency')
+        return (loads.get(key, 0), latency if latency is not None else float('inf'))
+    
+    return min(candidates, key=score)
+
+def get_account_proxy(acc):
+    """Return the Telethon proxy tuple for a stored account (sticky, re-pinned if degraded)."""
+    if not PROXIES or not acc:
+        return None
+    
+    key = acc.get('proxy_key')
+    if key and is_proxy_healthy(key):
+        return _proxy_tuple(_proxy_by_key(key))
+    
+    proxy = pick_proxy(exclude=key)
+    new_key = _proxy_key(proxy)
+    if new_key != key:
+        accounts_col.update_one({'_id': acc['_id']}, {'$set': {'proxy_key': new_key}})
+        acc['proxy_key'] = new_key
+        proxy_log.info("Pinned to %s%s", new_key, f" (was {key})" if key else "", extra={'account_id': acc['_id']})
+    return _proxy_tuple(proxy)
+
+async def account_client(acc, session=None):
+    """Create a TelegramClient for a stored account, routed through its pinned proxy."""
+    if session is None:
+        session = cipher_suite.decrypt(acc['session'].encode()).decode()
+    proxy = await asyncio.to_thread(get_account_proxy, acc)
+    client = TelegramClient(StringSession(session), CONFIG['api_id'], CONFIG['api_hash'], proxy=proxy)
+    _patch_client_rpc_timing(client)
+    return client
+
+async def _probe_proxy(proxy):
+    """Return handshake latency in seconds through the proxy, or None if it failed."""
+    proxy_type, host, port, rdns, username, password = _proxy_tuple(proxy)
+    started = time.monotonic()
+    try:
+        probe = SocksProxy.create(proxy_type, host, port, username=username, password=password, rdns=rdns)
+        sock = await probe.connect(PROXY_POOL['probe_host'], PROXY_POOL['probe_port'], timeout=PROXY_POOL['probe_timeout'])
+        sock.close()
+        return time.monotonic() - started
+    except Exception:
+        return None
+
+async def check_proxies():
+    latencies = await asyncio.gather(*(_probe_proxy(p) for p in PROXIES))
+    
+    for proxy, latency in zip(PROXIES, latencies):
+        key = _proxy_key(proxy)
+        health = proxy_health.setdefault(key, {'alive': True, 'latency': None, 'failures': 0})
+        
+        if latency is None or latency > PROXY_POOL['max_latency']:
+            health['failures'] += 1
+        else:
+            health['failures'] = 0
+        
+        was_alive = health['alive']
+        health['latency'] = latency
+        health['checked_at'] = datetime.now()
+        health['alive'] = health['failures'] < PROXY_POOL['max_failures']
+        
+        if was_alive and not health['alive']:
+            # Pinned accounts are moved lazily by get_account_proxy() on their next (re)connect
+            proxy_log.warning("%s degraded (latency: %s) - moving accounts off it", key, latency)
+        elif not was_alive and health['alive']:
+            proxy_log.info("%s recovered (%.2fs)", key, latency)
+
+async def proxy_health_loop():
+    while True:
+        try:
+            await check_proxies()
+        except Exception as e:
+            proxy_log.warning("Health check error: %s", e)
+        await asyncio.sleep(PROXY_POOL['probe_interval'])
+
 def parse_link(link):
     topic_id = None
     match = re.search(r'/(\d+)$', link)
@@ -748,7 +2588,7 @@ async def send_log(account_id, message, view_link=None, group_name=None):
             msg_text = str(message) if not isinstance(message, str) else message
             await logger_bot.send_message(int(chat_id), msg_text)
     except Exception as e:
-        print(f"[LOG ERROR] {e}")
+        log.warning("User log write failed: %s", e)
 
 async def add_user_log(user_id, log_msg):
     timestamp = datetime.now().strftime("%H:%M:%S")
@@ -759,24 +2599,27 @@ async def add_user_log(user_id, log_msg):
     )
 
 async def run_forwarding_loop(user_id, account_id):
-    print(f"[FORWARDING] Starting loop for account {account_id}")
+    fields = {'account_id': str(account_id), 'user_id': user_id}
+    flog = logging.LoggerAdapter(forwarding_log, fields)
+    slog = logging.LoggerAdapter(send_log_sampled, fields)
+    flog.info("Starting loop")
     client = None
     
     try:
         acc = accounts_col.find_one({'_id': account_id})
         if not acc:
-            print(f"[FORWARDING] Account {account_id} not found")
+            flog.warning("Account not found")
             return
         
-        session = cipher_suite.decrypt(acc['session'].encode()).decode()
-        client = TelegramClient(StringSession(session), CONFIG['api_id'], CONFIG['api_hash'])
+        client = await account_client(acc)
+        client_proxy_key = acc.get('proxy_key')
         await client.connect()
         
         if not await client.is_user_authorized():
-            print(f"[FORWARDING] Account {account_id} not authorized")
+            flog.warning("Account not authorized")
             return
         
-        print(f"[FORWARDING] Client connected for account {account_id}")
+        flog.info("Client connected")
         
         # Attach auto-reply handler to the SAME client (best practice)
         owner_id = acc.get('owner_id')
@@ -812,41 +2655,47 @@ async def run_forwarding_loop(user_id, account_id):
                             )
                         except Exception:
                             pass
+                        record_delivery(account_id, user_id, auto_replies=1)
                         
-                        print(f"[AUTO-REPLY] Replied to {event.sender_id} with: {reply_text[:30]}...")
+                        autoreply_log.info("Replied to %s", event.sender_id, extra=fields)
                     except Exception as e:
-                        print(f"[AUTO-REPLY ERROR] {e}")
+                        autoreply_log.warning("Reply failed: %s", e, extra=fields)
                 
-                print(f"[AUTO-REPLY] Attached to account {account_id} with message: {reply_text[:30]}...")
+                autoreply_log.info("Attached with message: %.30s...", reply_text, extra=fields)
         
         while True:
             try:
                 acc = accounts_col.find_one({'_id': account_id})
                 if not acc or not acc.get('is_forwarding'):
-                    print(f"[FORWARDING] Account {account_id} stopped")
+                    flog.info("Stopped")
                     break
                 
+                # Move off a proxy that degraded since the last round (keeps attached handlers)
+                if client_proxy_key and not is_proxy_healthy(client_proxy_key):
+                    flog.warning("Proxy %s degraded - reconnecting", client_proxy_key)
+                    client.set_proxy(await asyncio.to_thread(get_account_proxy, acc))
+                    client_proxy_key = acc.get('proxy_key')
+                    await client.disconnect()
+                    await client.connect()
+                
                 user = get_user(user_id)
-                tier_settings = get_user_tier_settings(user_id)
+                ent = resolve_entitlements(user_id)
+                account_tiers[str(account_id)] = ent['plan']
                 fwd_mode = user.get('forwarding_mode', 'topics')
                 
-                group_delay = tier_settings.get('group_delay', 120)
-                msg_delay = tier_settings.get('msg_delay', 45)
-                round_delay = tier_settings.get('round_delay', 7200)
+                group_delay = ent['group_delay']
+                msg_delay = ent['msg_delay']
+                round_delay = ent['round_delay']
                 
-                ads = []
-                async for msg in client.iter_messages('me', limit=10):
-                    if msg.text or msg.media:
-                        ads.append(msg)
-                ads.reverse()
+                ads = await load_ad_units(client)
                 
                 if not ads:
-                    print(f"[FORWARDING] No ads in Saved Messages for {account_id}")
+                    flog.info("No ads in Saved Messages")
                     await add_user_log(user_id, "No ads in Saved Messages - add messages to Saved Messages")
                     await asyncio.sleep(60)
                     continue
                 
-                print(f"[FORWARDING] Loaded {len(ads)} ads from Saved Messages")
+                flog.debug("Loaded %d ads from Saved Messages", len(ads))
                 
                 groups_to_forward = []
                 
@@ -864,16 +2713,15 @@ async def run_forwarding_loop(user_id, account_id):
                                 link = link.split('?')[0]
                             peer, url, topic_id = parse_link(link)
                             group_key = link
-                            if not is_group_failed(acc_id_str, group_key):
-                                groups_to_forward.append({
-                                    'peer': peer,
-                                    'url': url,
-                                    'topic_id': topic_id,
-                                    'title': tg.get('title', link.split('/')[-2] if '/' in link else 'Unknown'),
-                                    'type': 'topic',
-                                    'key': group_key
-                                })
-                    print(f"[FORWARDING] Added {len(groups_to_forward)} topic groups")
+                            groups_to_forward.append({
+                                'peer': peer,
+                                'url': url,
+                                'topic_id': topic_id,
+                                'title': tg.get('title', link.split('/')[-2] if '/' in link else 'Unknown'),
+                                'type': 'topic',
+                                'key': group_key
+                            })
+                    flog.debug("Added %d topic groups", len(groups_to_forward))
                 
                 if fwd_mode in ('auto', 'both'):
                     auto_groups = list(account_auto_groups_col.find({'account_id': acc_id_str}))
@@ -883,27 +2731,30 @@ async def run_forwarding_loop(user_id, account_id):
                     count = 0
                     for ag in auto_groups:
                         group_key = str(ag['group_id'])
-                        if not is_group_failed(acc_id_str, group_key):
-                            groups_to_forward.append({
-                                'group_id': ag['group_id'],
-                                'access_hash': ag.get('access_hash'),
-                                'username': ag.get('username'),
-                                'title': ag.get('title', 'Unknown'),
-                                'type': 'auto',
-                                'key': group_key
-                            })
-                            count += 1
-                    print(f"[FORWARDING] Added {count} auto groups")
+                        groups_to_forward.append({
+                            'group_id': ag['group_id'],
+                            'access_hash': ag.get('access_hash'),
+                            'username': ag.get('username'),
+                            'title': ag.get('title', 'Unknown'),
+                            'type': 'auto',
+                            'key': group_key
+                        })
+                        count += 1
+                    flog.debug("Added %d auto groups", count)
                 
                 if not groups_to_forward:
-                    print(f"[FORWARDING] No groups to forward to")
+                    flog.info("No groups to forward to")
                     await add_user_log(user_id, "No groups configured - waiting")
                     await asyncio.sleep(60)
                     continue
                 
+                # Healthiest groups first; groups in error backoff sit this round out
+                load_target_health(acc_id_str)
+                groups_to_forward, backed_off = order_targets(acc_id_str, groups_to_forward)
+                
                 sent = 0
                 failed = 0
-                skipped = 0
+                skipped = backed_off
                 
                 for i, group in enumerate(groups_to_forward):
                     acc = accounts_col.find_one({'_id': account_id})
@@ -914,10 +2765,10 @@ async def run_forwarding_loop(user_id, account_id):
                     wait_remaining = get_flood_wait(account_id, group_key)
                     if wait_remaining > 0:
                         skipped += 1
-                        print(f"[FORWARDING] Skipped {group['title']} (flood wait: {wait_remaining // 60}m)")
+                        flog.debug("Skipped %s (flood wait: %dm)", group['title'], wait_remaining // 60)
                         continue
                     
-                    msg = ads[i % len(ads)]
+                    unit = ads[i % len(ads)]
                     
                     try:
                         sent_msg_id = None
@@ -944,18 +2795,7 @@ async def run_forwarding_loop(user_id, account_id):
                             
                             group_name = getattr(current_entity, 'title', group['title'])[:30]
                             
-                            if current_topic_id:
-                                sent_msg_id = await forward_message(client, current_entity, msg.id, msg.peer_id, current_topic_id)
-                            else:
-                                result = await client.forward_messages(current_entity, msg.id, 'me')
-                                if result:
-                                        if isinstance(result, list):
-                                            sent_msg_id = result[0].id if len(result) > 0 else None
-
-                                        else:
-
-
-                                            sent_msg_id = result.id
+                            sent_msg_id = await forward_message(client, current_entity, [m.id for m in unit], 'me', current_topic_id)
                         else:
                             current_entity = None
                             group_id = group['group_id']
@@ -983,18 +2823,10 @@ async def run_forwarding_loop(user_id, account_id):
                                 raise Exception(f"Cannot resolve entity for group {group_id}")
                             
                             group_name = group['title'][:30]
-                            result = await client.forward_messages(current_entity, msg.id, 'me')
-                            if result:
-                                if result:
-                                    if isinstance(result, list):
-                                        sent_msg_id = result[0].id if len(result) > 0 else None
-                                    else:
-                                        sent_msg_id = result.id
-
-                                    sent_msg_id = result.id
+                            sent_msg_id = await forward_message(client, current_entity, [m.id for m in unit], 'me')
                         
                         sent += 1
-                        print(f"[FORWARDING] Sent to {group_name} ({i+1}/{len(groups_to_forward)})")
+                        slog.info("Sent to %s (%d/%d)", group_name, i + 1, len(groups_to_forward))
                         await add_user_log(user_id, f"Sent to {group_name}")
                         
                         # Send logs (now free for everyone)
@@ -1005,18 +2837,24 @@ async def run_forwarding_loop(user_id, account_id):
                         
                         # Update stats in correct collection
                         update_account_stats(str(account_id), sent=1)
+                        record_delivery(account_id, user_id, group_key, group['title'], sent=1)
+                        record_target_outcome(acc_id_str, group_key, 'sent', group['title'])
                         
                     except FloodWaitError as e:
                         wait_time = e.seconds
                         failed += 1
                         set_flood_wait(account_id, group_key, group['title'], wait_time)
-                        print(f"[FORWARDING] FloodWait {wait_time // 60}m for {group['title']} - will skip until expires")
+                        record_delivery(account_id, user_id, group_key, group['title'], failed=1, flood_wait_s=wait_time)
+                        record_target_outcome(acc_id_str, group_key, 'flood', group['title'])
+                        flog.warning("FloodWait %dm for %s - will skip until expires", wait_time // 60, group['title'])
                         await add_user_log(user_id, f"FloodWait {wait_time // 60}m in {group['title'][:20]}")
                         
                     except (ChannelPrivateError, ChatWriteForbiddenError, UserBannedInChannelError) as e:
                         failed += 1
-                        mark_group_failed(account_id, group_key, str(e))
-                        print(f"[FORWARDING] Permanent fail {group['title']}: {type(e).__name__}")
+                        mark_group_failed(acc_id_str, group_key, str(e))
+                        record_delivery(account_id, user_id, group_key, group['title'], failed=1, permanent_fail=1)
+                        record_target_outcome(acc_id_str, group_key, 'blocked', group['title'])
+                        flog.warning("Permanent fail %s: %s", group['title'], type(e).__name__)
                         
                     except Exception as e:
                         failed += 1
@@ -1025,8 +2863,12 @@ async def run_forwarding_loop(user_id, account_id):
                         if wait_match:
                             wait_time = int(wait_match.group(1))
                             set_flood_wait(account_id, group_key, group['title'], wait_time)
+                            record_delivery(account_id, user_id, group_key, group['title'], failed=1, flood_wait_s=wait_time)
+                            record_target_outcome(acc_id_str, group_key, 'flood', group['title'])
                         else:
-                            print(f"[FORWARDING] Error {group['title']}: {error_str[:50]}")
+                            flog.warning("Error %s: %.50s", group['title'], error_str)
+                            record_delivery(account_id, user_id, group_key, group['title'], failed=1)
+                            record_target_outcome(acc_id_str, group_key, 'error', group['title'])
                         # Update stats in correct collection
                         update_account_stats(str(account_id), failed=1)
                     
@@ -1035,46 +2877,81 @@ async def run_forwarding_loop(user_id, account_id):
                     if (i + 1) % 10 == 0:
                         await asyncio.sleep(group_delay)
                 
-                print(f"[FORWARDING] Round complete. Sent: {sent}, Failed: {failed}, Skipped: {skipped}")
+                flog.info("Round complete. Sent: %d, Failed: %d, Skipped: %d", sent, failed, skipped)
                 await add_user_log(user_id, f"Round: {sent} sent, {failed} failed, {skipped} skipped")
                 
-                print(f"[FORWARDING] Waiting {round_delay}s for next round...")
+                flog.debug("Waiting %ss for next round", round_delay)
                 await asyncio.sleep(round_delay)
                 
             except asyncio.CancelledError:
-                print(f"[FORWARDING] Task cancelled for account {account_id}")
+                flog.info("Task cancelled")
                 break
         
     except asyncio.CancelledError:
-        print(f"[FORWARDING] Task cancelled for account {account_id}")
+        flog.info("Task cancelled")
     except Exception as e:
-        print(f"[FORWARDING] Error in loop: {e}")
-        import traceback
-        traceback.print_exc()
+        flog.exception("Error in loop: %s", e)
     finally:
         if client:
             try:
                 await client.disconnect()
-                print(f"[FORWARDING] Client disconnected for account {account_id}")
+                flog.debug("Client disconnected")
             except:
                 pass
         if account_id in forwarding_tasks:
             del forwarding_tasks[account_id]
 
-async def forward_message(client, to_entity, msg_id, from_peer, topic_id=None):
-    random_id = random.randint(1, 2147483647)
+async def load_ad_units(client, max_units=10):
+    """Load ads from Saved Messages (oldest first) as units.
+
+    A unit is a list of messages forwarded together: a single message, or every
+    message of a media album (messages sharing one grouped_id), in id order.
+    """
+    units = []
+    albums = {}
+    async for msg in client.iter_messages('me', limit=100):
+        if not (msg.text or msg.media):
+            continue
+        
+        if msg.grouped_id and msg.grouped_id in albums:
+            albums[msg.grouped_id].append(msg)
+            continue
+        
+        # Newest first: a new unit starting past the cap means the newest max_units are complete
+        if len(units) >= max_units:
+            break
+        
+        unit = [msg]
+        units.append(unit)
+        if msg.grouped_id:
+            albums[msg.grouped_id] = unit
+    
+    for unit in units:
+        unit.reverse()
+    units.reverse()
+    return units
+
+async def forward_message(client, to_entity, msg_ids, from_peer, topic_id=None):
+    """Forward one ad unit (single message or whole album) with a single ForwardMessagesRequest.
+
+    Returns the id of the first forwarded message (for the View Message link), or None.
+    """
+    if isinstance(msg_ids, int):
+        msg_ids = [msg_ids]
+    
     result = await client(ForwardMessagesRequest(
         from_peer=from_peer,
-        id=[msg_id],
-        random_id=[random_id],
+        id=list(msg_ids),
+        random_id=[random.randint(1, 2147483647) for _ in msg_ids],
         to_peer=to_entity,
         top_msg_id=topic_id
     ))
-    if result.updates:
-        for update in result.updates:
-            if hasattr(update, 'message') and hasattr(update.message, 'id'):
-                return update.message.id
-    return None
+    sent_ids = [
+        update.message.id
+        for update in (getattr(result, 'updates', None) or [])
+        if hasattr(update, 'message') and hasattr(update.message, 'id')
+    ]
+    return min(sent_ids) if sent_ids else None
 
 def build_message_link(entity, msg_id, topic_id=None):
     username = getattr(entity, 'username', None)
@@ -1132,44 +3009,458 @@ async def fetch_groups(client, account_id, phone):
             account_auto_groups_col.insert_many(groups)
         return len(groups)
     except Exception as e:
-        print(f"Fetch groups error: {e}")
+        account_log.warning("Fetch groups error: %s", e, extra={'account_id': account_id})
         return 0
 
-# ===================== UI Helpers =====================
+# ===================== Broadcast Jobs =====================
+# Admin broadcasts run as background jobs stored in broadcast_jobs_col. Recipients are streamed
+# in user_id order (iter_user_id_batches). Every BROADCAST['checkpoint_every'] sends the job checkpoints
+# ('cursor') the highest user_id up to which every recipient is done, so a restart resumes there and
+# re-sends to at most a few dozen users. All jobs share one rate limiter (Bot API global limit).
+# Forward jobs check their source message before the first send; if it goes missing the job fails
+# rather than flagging recipients as unreachable.
 
-def _h(s: str) -> str:
-    """Basic HTML escape for user-provided strings."""
-    try:
-        return (
-            str(s)
-            .replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-        )
-    except Exception:
-        return ""
+broadcast_tasks = {}  # {job_id: asyncio.Task}
+broadcast_cancelled = set()  # job_ids the admin asked to stop
+_broadcast_limiter = {'next_at': 0.0}
+_broadcast_limiter_lock = asyncio.Lock()
 
 
-def ui_title(title: str) -> str:
-    return f"<b>{_h(title)}</b>"
+def _broadcast_cancel_keyboard(job_id):
+    return [[Button.inline("⛔ Cancel Broadcast", f"bcast_cancel_{job_id}")]]
 
 
-def ui_kv(key: str, val: str) -> str:
-    return f"<b>{_h(key)}:</b> {_h(val)}"
+async def _broadcast_throttle():
+    """Wait for the next global send slot."""
+    loop = asyncio.get_running_loop()
+    async with _broadcast_limiter_lock:
+        now = loop.time()
+        slot = max(now, _broadcast_limiter['next_at'])
+        _broadcast_limiter['next_at'] = slot + 1.0 / BROADCAST['rate']
+    if slot > now:
+        await asyncio.sleep(slot - now)
 
 
-def ui_section(title: str, lines: list[str]) -> str:
-    body = "\n".join(lines).strip()
-    return f"<b>{_h(title)}</b>\n{body}" if body else f"<b>{_h(title)}</b>"
+def _broadcast_flood_pause(seconds):
+    """Push the shared limiter back so every sender honours a FloodWait."""
+    loop = asyncio.get_running_loop()
+    _broadcast_limiter['next_at'] = max(_broadcast_limiter['next_at'], loop.time() + seconds)
 
 
-def ui_divider() -> str:
-    return "\n\n"
+async def _broadcast_deliver(job, user_id):
+    if job['kind'] == 'forward':
+        # Forward keeps media, buttons and formatting of the admin's message
+        await main_bot.forward_messages(user_id, job['msg_id'], from_peer=job['from_peer'])
+    else:
+        await main_bot.send_message(user_id, job['text'], buttons=job.get('buttons'))
 
 
-def render_plan_select_text() -> str:
-    return (
-        "<b>💎 Choose Your Plan</b>\n\n"
+async def _broadcast_source_ok(job):
+    """Forward jobs: is the admin's source message still there? One RPC."""
+    try:
+        return await main_bot.get_messages(job['from_peer'], ids=job['msg_id']) is not None
+    except Exception as e:
+        broadcast_log.warning("Source message unavailable: %s", e, extra={'job_id': job.get('_id')})
+        return False
+
+
+async def _broadcast_send(job, user_id):
+    """Deliver to one user: True on success, the error name if the user is unreachable, else False.
+
+    A forward whose source message is gone sets job['source_lost'] instead of blaming the user.
+    """
+    for _ in range(BROADCAST['max_retries'] + 1):
+        await _broadcast_throttle()
+        try:
+            await _broadcast_deliver(job, user_id)
+            return True
+        except FloodWaitError as e:
+            broadcast_log.warning("FloodWait %ss, pausing all senders", e.seconds)
+            _broadcast_flood_pause(e.seconds + 1)
+        except UNDELIVERABLE_ERRORS as e:
+            # On a forward, PeerIdInvalid can be about from_peer: only blame the user if the source still resolves
+            if isinstance(e, PeerIdInvalidError) and job['kind'] == 'forward' and not await _broadcast_source_ok(job):
+                job['source_lost'] = True
+                return False
+            return type(e).__name__
+        except Exception as e:
+            broadcast_log.debug("Failed to send: %s", e, extra={'user_id': user_id})
+            return False
+    return False
+
+
+def _flag_unreachable(unreachable):
+    # Blocked/deleted users are skipped by every later broadcast
+    try:
+        mark_undeliverable(unreachable)
+    except Exception as e:
+        broadcast_log.warning("Failed to flag unreachable users: %s", e)
+    unreachable.clear()
+
+
+def _checkpoint_broadcast(job, cursor, counters):
+    broadcast_jobs_col.update_one(
+        {'_id': job['_id']},
+        {'$set': {'cursor': cursor, **counters, 'updated_at': datetime.now()}}
+    )
+
+
+async def _broadcast_page(job, user_ids, counters):
+    """Send one cursor page with a small pool of concurrent senders.
+
+    Workers finish users out of order, so every BROADCAST['checkpoint_every'] sends the job
+    checkpoints the last user_id that every earlier user in the page is done before.
+    """
+    pending = iter(enumerate(user_ids))
+    unreachable = {}
+    done = [False] * len(user_ids)
+    frontier = {'next': 0, 'since_checkpoint': 0}
+
+    def settle(index):
+        done[index] = True
+        while frontier['next'] < len(done) and done[frontier['next']]:
+            frontier['next'] += 1
+        frontier['since_checkpoint'] += 1
+        if frontier['since_checkpoint'] >= BROADCAST['checkpoint_every'] and frontier['next']:
+            frontier['since_checkpoint'] = 0
+            _flag_unreachable(unreachable)
+            _checkpoint_broadcast(job, user_ids[frontier['next'] - 1], counters)
+
+    async def sender():
+        for index, user_id in pending:
+            if job['_id'] in broadcast_cancelled or job.get('source_lost'):
+                return
+            outcome = await _broadcast_send(job, user_id)
+            if outcome is True:
+                counters['sent'] += 1
+            else:
+                counters['failed'] += 1
+                if outcome:
+                    unreachable[user_id] = outcome
+                    counters['unreachable'] += 1
+            settle(index)
+
+    await asyncio.gather(*(sender() for _ in range(min(BROADCAST['workers'], len(user_ids)))))
+    _flag_unreachable(unreachable)
+
+
+def _broadcast_progress_text(job, counters):
+    done = counters['sent'] + counters['failed']
+    total = max(job.get('total', 0), done)
+    percent = int(done / total * 100) if total else 100
+    return (
+        f"📢 Broadcasting{job.get('label', '')}...\n{done}/{total} ({percent}%)\n\n"
+        f"✅ Sent: {counters['sent']}\n❌ Failed: {counters['failed']}\n"
+        f"🚫 Unreachable: {counters['unreachable']}"
+    )
+
+
+async def _broadcast_progress_loop(job, counters):
+    """Edit the admin's progress message on a fixed timer (only when counts moved)."""
+    last = None
+    while True:
+        await asyncio.sleep(BROADCAST['progress_interval'])
+        snapshot = (counters['sent'], counters['failed'])
+        if snapshot == last:
+            continue
+        last = snapshot
+        try:
+            await main_bot.edit_message(
+                job['chat_id'], job['progress_msg_id'],
+                _broadcast_progress_text(job, counters),
+                buttons=_broadcast_cancel_keyboard(job['_id'])
+            )
+        except FloodWaitError as e:
+            await asyncio.sleep(e.seconds)
+        except Exception:
+            pass
+
+
+async def run_broadcast_job(job_id):
+    """Run (or resume) a broadcast job until every page is sent or it is cancelled."""
+    job = broadcast_jobs_col.find_one({'_id': job_id})
+    if not job or job.get('status') != 'running':
+        return
+
+    counters = {'sent': job.get('sent', 0), 'failed': job.get('failed', 0), 'unreachable': job.get('unreachable', 0)}
+    reporter = asyncio.create_task(_broadcast_progress_loop(job, counters))
+    status = 'failed'
+    try:
+        # Check the forwarded message once up front: a bad source fails the job, not every recipient
+        if job['kind'] == 'forward' and not await _broadcast_source_ok(job):
+            job['source_lost'] = True
+        else:
+            # aclosing: breaking out closes the generator, and with it the Mongo cursor, right away
+            pages = iter_user_id_batches(DELIVERABLE_QUERY, after=job.get('cursor'), batch_size=BROADCAST['batch_size'])
+            async with contextlib.aclosing(pages):
+                async for user_ids in pages:
+                    await _broadcast_page(job, user_ids, counters)
+                    if job_id in broadcast_cancelled or job.get('source_lost'):
+                        break
+                    _checkpoint_broadcast(job, user_ids[-1], counters)
+        if job.get('source_lost'):
+            status = 'failed'
+        else:
+            status = 'cancelled' if job_id in broadcast_cancelled else 'done'
+    except Exception as e:
+        broadcast_log.exception("Job crashed: %s", e, extra={'job_id': job_id})
+    finally:
+        reporter.cancel()
+        broadcast_tasks.pop(job_id, None)
+        broadcast_cancelled.discard(job_id)
+
+    broadcast_jobs_col.update_one(
+        {'_id': job_id},
+        {'$set': {'status': status, **counters, 'finished_at': datetime.now()}}
+    )
+    title = {'done': "✅ <b>Broadcast Complete!</b>", 'cancelled': "⛔ <b>Broadcast Cancelled</b>"}.get(
+        status, "⚠️ <b>Broadcast Stopped (error)</b>")
+    if job.get('source_lost'):
+        title = "⚠️ <b>Broadcast Stopped (source message unavailable)</b>"
+    try:
+        await main_bot.edit_message(
+            job['chat_id'], job['progress_msg_id'],
+            f"{title}\n\n"
+            f"<b>From:</b> {_h(job.get('sender') or 'Admin')}\n"
+            f"<b>Total:</b> {max(job.get('total', 0), counters['sent'] + counters['failed'])}\n"
+            f"<b>Sent:</b> {counters['sent']}\n"
+            f"<b>Failed:</b> {counters['failed']}\n"
+            f"<b>Unreachable:</b> {counters['unreachable']}",
+            parse_mode='html'
+        )
+    except Exception:
+        pass
+
+
+async def start_broadcast(event, kind, sender=None, text=None, from_peer=None, msg_id=None):
+    """Create a broadcast job and run it in the background; returns immediately."""
+    from bson.objectid import ObjectId
+    job_id = ObjectId()
+    label = f" from {sender}" if sender else ""
+    total = await asyncio.to_thread(users_col.count_documents, DELIVERABLE_QUERY)
+    progress_msg = await event.respond(
+        f"📢 Broadcasting{label}...\n0/{total} (0%)",
+        buttons=_broadcast_cancel_keyboard(job_id)
+    )
+    broadcast_jobs_col.insert_one({
+        '_id': job_id,
+        'kind': kind,
+        'sender': sender,
+        'label': label,
+        'text': text,
+        'from_peer': from_peer,
+        'msg_id': msg_id,
+        'admin_id': event.sender_id,
+        'chat_id': event.chat_id,
+        'progress_msg_id': progress_msg.id,
+        'status': 'running',
+        'cursor': None,
+        'total': total,
+        'sent': 0,
+        'failed': 0,
+        'unreachable': 0,
+        'created_at': datetime.now(),
+    })
+    broadcast_tasks[job_id] = spawn_detached(run_broadcast_job(job_id))
+    return job_id
+
+
+def cancel_broadcast(job_id):
+    if job_id in broadcast_tasks:
+        broadcast_cancelled.add(job_id)
+        return True
+    return False
+
+
+async def resume_broadcast_jobs():
+    """Restart jobs that were still running when the bot went down."""
+    for job in broadcast_jobs_col.find({'status': 'running'}, {'_id': 1}):
+        if job['_id'] not in broadcast_tasks:
+            broadcast_log.info("Resuming job", extra={'job_id': job['_id']})
+            broadcast_tasks[job['_id']] = asyncio.create_task(run_broadcast_job(job['_id']))
+
+
+# ===================== Premium Expiry =====================
+# premium_expiry_loop() sweeps every PREMIUM_EXPIRY['sweep_interval'] with ONE query on the
+# (tier, premium_expires_at) index: premium users whose expiry is inside the reminder window
+# and who were not yet reminded for that expiry date, plus everyone already expired. Expired
+# users are downgraded with bulk_write (guarded on the expiry we read, so a renewal racing
+# the sweep wins); their forwarders beyond the Scout account limit are stopped and the rest
+# run at Scout delays via resolve_entitlements. Notices go through the broadcast limiter.
+
+expiry_log = log.getChild('expiry')
+expiry_notices = asyncio.Queue()  # (user_id, text)
+
+
+def _renew_keyboard():
+    return [[Button.inline("⬆️ Renew Plan", b"go_premium")]]
+
+
+def _expiry_sweep_query(now):
+    return {
+        'tier': 'premium',
+        'premium_expires_at': {'$lte': now + timedelta(hours=PREMIUM_EXPIRY['remind_before_hours'])},
+        # Reminded users drop out until their expiry date changes (renewal) or passes
+        '$or': [
+            {'premium_expires_at': {'$lte': now}},
+            {'$expr': {'$ne': ['$expiry_reminded_for', '$premium_expires_at']}},
+        ],
+    }
+
+
+async def _stop_excess_forwarders(user_ids):
+    """Keep the oldest FREE_TIER['max_accounts'] forwarders per user running; stop the rest."""
+    running = {}
+    for acc in accounts_col.find(
+        {'owner_id': {'$in': list(user_ids)}, 'is_forwarding': True}, {'_id': 1, 'owner_id': 1}
+    ).sort('added_at', 1):
+        running.setdefault(acc['owner_id'], []).append(acc['_id'])
+
+    stopped = {}
+    excess = []
+    for uid, acc_ids in running.items():
+        extra = acc_ids[FREE_TIER['max_accounts']:]
+        if extra:
+            stopped[uid] = len(extra)
+            excess.extend(extra)
+    if not excess:
+        return stopped
+
+    accounts_col.update_many({'_id': {'$in': excess}}, {'$set': {'is_forwarding': False}})
+    for acc_id in excess:
+        for key in (acc_id, str(acc_id)):
+            task = forwarding_tasks.pop(key, None)
+            if task:
+                task.cancel()
+            client = auto_reply_clients.pop(key, None)
+            if client:
+                try:
+                    await client.disconnect()
+                except Exception:
+                    pass
+    return stopped
+
+
+async def _downgrade_expired(users):
+    users_col.bulk_write([
+        UpdateOne(
+            {'_id': u['_id'], 'tier': 'premium', 'premium_expires_at': u['premium_expires_at']},
+            {'$set': {'tier': 'free', 'max_accounts': FREE_TIER['max_accounts'], 'premium_expired_at': u['premium_expires_at']}},
+        )
+        for u in users
+    ], ordered=False)
+    for u in users:
+        forget_entitlements(u['user_id'])
+
+    stopped = await _stop_excess_forwarders(u['user_id'] for u in users)
+    for u in users:
+        plan = PLANS[_premium_plan_key(u)]
+        text = (
+            f"⌛ **Your {plan['name']} plan has expired.**\n\n"
+            f"You're back on Scout (Free): {FREE_TIER['max_accounts']} account(s), slower delays."
+        )
+        if stopped.get(u['user_id']):
+            text += f"\n{stopped[u['user_id']]} running account(s) were stopped."
+        text += "\n\nRenew any time to restore your limits."
+        expiry_notices.put_nowait((u['user_id'], text))
+    expiry_log.info("Downgraded %d expired user(s), stopped %d forwarder(s)", len(users), sum(stopped.values()))
+
+
+def _mark_reminded(users, now):
+    users_col.bulk_write([
+        UpdateOne({'_id': u['_id']}, {'$set': {'expiry_reminded_for': u['premium_expires_at']}})
+        for u in users
+    ], ordered=False)
+    for u in users:
+        left = u['premium_expires_at'] - now
+        plan = PLANS[_premium_plan_key(u)]
+        expiry_notices.put_nowait((
+            u['user_id'],
+            f"⏰ **Your {plan['name']} plan expires in {left.days}d {left.seconds // 3600}h.**\n\n"
+            "Renew now to keep your accounts running at full speed."
+        ))
+
+
+def _next_users(cursor, n):
+    return list(itertools.islice(cursor, n))
+
+
+async def sweep_premium_expiry():
+    """One sweep: downgrade expired users and queue reminders, in batches."""
+    now = datetime.now()
+    cursor = users_col.find(
+        _expiry_sweep_query(now),
+        {'_id': 1, 'user_id': 1, 'plan_name': 1, 'max_accounts': 1, 'premium_expires_at': 1},
+        batch_size=PREMIUM_EXPIRY['batch_size'],
+    ).sort('premium_expires_at', 1)
+    while True:
+        batch = await asyncio.to_thread(_next_users, cursor, PREMIUM_EXPIRY['batch_size'])
+        if not batch:
+            break
+        expired = [u for u in batch if u['premium_expires_at'] <= now]
+        upcoming = [u for u in batch if u['premium_expires_at'] > now]
+        if expired:
+            await _downgrade_expired(expired)
+        if upcoming:
+            _mark_reminded(upcoming, now)
+
+
+async def premium_expiry_loop():
+    while True:
+        try:
+            await sweep_premium_expiry()
+        except Exception as e:
+            expiry_log.exception("Sweep failed: %s", e)
+        await asyncio.sleep(PREMIUM_EXPIRY['sweep_interval'])
+
+
+async def expiry_notice_loop():
+    """Deliver queued expiry notices/reminders at the shared broadcast rate."""
+    while True:
+        user_id, text = await expiry_notices.get()
+        outcome = await _broadcast_send({'kind': 'text', 'text': text, 'buttons': _renew_keyboard()}, user_id)
+        if outcome not in (True, False):
+            try:
+                mark_undeliverable({user_id: outcome})
+            except Exception as e:
+                expiry_log.warning("Failed to flag unreachable user: %s", e, extra={'user_id': user_id})
+
+
+# ===================== UI Helpers =====================
+
+def _h(s: str) -> str:
+    """Basic HTML escape for user-provided strings."""
+    try:
+        return (
+            str(s)
+            .replace("&", "&amp;")
+            .replace("<", "&lt;")
+            .replace(">", "&gt;")
+        )
+    except Exception:
+        return ""
+
+
+def ui_title(title: str) -> str:
+    return f"<b>{_h(title)}</b>"
+
+
+def ui_kv(key: str, val: str) -> str:
+    return f"<b>{_h(key)}:</b> {_h(val)}"
+
+
+def ui_section(title: str, lines: list[str]) -> str:
+    body = "\n".join(lines).strip()
+    return f"<b>{_h(title)}</b>\n{body}" if body else f"<b>{_h(title)}</b>"
+
+
+def ui_divider() -> str:
+    return "\n\n"
+
+
+def render_plan_select_text() -> str:
+    return (
+        "<b>💎 Choose Your Plan</b>\n\n"
         "<blockquote>Pick a plan that matches your needs. You can upgrade anytime.</blockquote>\n\n"
         "<b>Plans:</b> Scout (Free) • Grow • Prime • Dominion"
     )
@@ -1185,36 +3476,25 @@ def render_welcome_text() -> str:
 
 def render_dashboard_text(uid: int) -> str:
     user = get_user(uid)
-    max_acc = user.get('max_accounts', 1)
+    ent = resolve_entitlements(uid)
+    max_acc = ent['max_accounts']
     
     # Determine plan name and expiry
-    if is_admin(uid):
+    if ent['admin']:
         plan_name = "Admin"
-        max_acc = 999
         expiry_text = "999d"
-    elif is_premium(uid):
-        # Use stored plan_name if available, otherwise derive from max_accounts
-        plan_name = user.get('plan_name', 'Premium')
-        if not user.get('plan_name'):
-            # Backward compatibility: derive from max_accounts
-            if max_acc >= 15:
-                plan_name = "Dominion"
-            elif max_acc >= 7:
-                plan_name = "Prime"
-            else:
-                plan_name = "Grow"
+    elif ent['premium']:
+        plan_name = ent['plan_name']
         
         # Calculate expiry countdown
-        expires_at = user.get('premium_expires_at')
-        if expires_at and isinstance(expires_at, datetime):
-            remaining = expires_at - datetime.now()
-            if remaining.total_seconds() > 0:
-                days_left = remaining.days
-                expiry_text = f"{days_left}d"
-            else:
-                expiry_text = "Expired"
+        expires_at = ent['expires_at']
+        if expires_at:
+            expiry_text = f"{(expires_at - datetime.now()).days}d"
         else:
             expiry_text = "∞"  # Legacy users without expiry
+    elif ent['expired']:
+        plan_name = "Scout: Free"
+        expiry_text = "Expired"
     else:
         plan_name = "Scout: Free"
         expiry_text = "∞"
@@ -1247,18 +3527,10 @@ def new_welcome_keyboard():
 
 def plan_select_keyboard(user_id=None):
     """Plan selection: Scout, Grow, Prime, Dominion (2x2 grid layout)."""
-    user = get_user(user_id) if user_id else None
-    user_plan = user.get('plan_name', '').lower() if user else None
-    is_prem = is_premium(user_id) if user_id else False
-    
-    # Check if premium has expired
-    if is_prem and user:
-        expires_at = user.get('premium_expires_at')
-        if expires_at and isinstance(expires_at, datetime):
-            if expires_at < datetime.now():
-                # Premium expired - reset to Scout
-                is_prem = False
-                user_plan = 'scout'
+    # Expired premium already resolves to Scout
+    ent = resolve_entitlements(user_id) if user_id else None
+    user_plan = ent['plan'] if ent and not ent['admin'] else None
+    is_prem = ent['premium'] if ent else False
     
     buttons = []
     
@@ -1464,7 +3736,7 @@ async def apply_account_profile_templates(user_id: int):
             except Exception:
                 continue
 
-            client = TelegramClient(StringSession(decrypted_session), CONFIG['api_id'], CONFIG['api_hash'])
+            client = await account_client(acc, decrypted_session)
             try:
                 await client.connect()
                 me = await client.get_me()
@@ -1496,6 +3768,55 @@ def admin_panel_keyboard():
         [Button.inline("Back", b"enter_dashboard")]
     ]
 
+def render_account_text(account_id, acc) -> str:
+    stats = get_account_stats(account_id)
+    settings = get_account_settings(account_id)
+    topics = account_topics_col.count_documents({'account_id': account_id})
+    groups = account_auto_groups_col.count_documents({'account_id': account_id})
+
+    status = "🟢 Running" if acc.get('is_forwarding') else "🔴 Stopped"
+
+    return (
+        f"📱 **Account Details**\n\n"
+        f"Phone: {acc['phone']}\n"
+        f"Name: {acc.get('name', 'Unknown')}\n"
+        f"Status: {status}\n\n"
+        f"📊 **Statistics**\n"
+        f"Topics: {topics}\n"
+        f"Groups: {groups}\n"
+        f"Messages Sent: {stats.get('total_sent', 0)}\n"
+        f"Failed: {stats.get('total_failed', 0)}\n\n"
+        f"⏱️ **Delays**\n"
+        f"Message: {settings.get('msg_delay', 30)}s\n"
+        f"Group: {settings.get('group_delay', 90)}s\n"
+        f"Round: {settings.get('round_delay', 3600)}s"
+    )
+
+def upi_payment_text(pay_id, plan, random_user_id, status=None) -> str:
+    text = (
+        f"**UPI Payment**\n\n"
+        f"**Plan:** {plan['name']}\n"
+        f"**Price:** Rs {plan['price']}\n"
+        f"**User ID:** {random_user_id}\n"
+        f"**Payment ID:** `{pay_id}`\n"
+        f"**Expiry:** 30 Minutes\n\n"
+        f"**Plan Features:**\n"
+        f"• {plan['max_accounts']} accounts\n"
+        f"• {plan['max_topics']} topics\n"
+        f"• {plan['max_groups_per_topic']} groups/topic\n\n"
+        f"Scan QR and click **Verify Now** after payment."
+    )
+    if status:
+        text = f"**{status}**\n\n{text}"
+    return text
+
+def upi_payment_keyboard(pay_id):
+    return [
+        [Button.inline("✅ Verify Now", f"verify_{pay_id}")],
+        [Button.inline("❌ Cancel", f"cancel_{pay_id}")],
+        [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Home", b"back_start")]
+    ]
+
 def account_menu_keyboard(account_id, acc, user_id):
     fwd = acc.get('is_forwarding', False)
     btn = "Stop" if fwd else "Start"
@@ -1571,10 +3892,33 @@ def otp_keyboard():
         [Button.url("Get Code", "tg://openmessage?user_id=777000")]
     ]
 
+def prestylize_static_ui():
+    """Pre-render texts and keyboards that are identical for most users."""
+    prestylize(MESSAGES['privacy_short'], 'html')
+    prestylize(FORCE_JOIN.get('message') or '')
+    prestylize(render_plan_select_text(), 'html')
+    prestylize(render_plan_select_text())
+    prestylize(render_welcome_text())
+    prestylize(render_welcome_text(), 'html')
+
+    for keyboard in (
+        new_welcome_keyboard(),
+        forcejoin_keyboard(),
+        admin_panel_keyboard(),
+        settings_menu_keyboard(None),
+        tier_selection_keyboard(),
+        premium_contact_keyboard(),
+        otp_keyboard(),
+    ):
+        prestylize_keyboard(keyboard)
+
+prestylize_static_ui()
+
 @main_bot.on(events.NewMessage(pattern=r'^/start(?:@[\w_]+)?(?:\s|$)'))
 async def cmd_start(event):
     uid = event.sender_id
     get_user(uid)
+    revive_user(uid)
 
     # Force-join gate (admin bypass)
     if not await enforce_forcejoin_or_prompt(event):
@@ -1702,6 +4046,7 @@ async def cmd_help(event):
             "<code>/rmadmin {id}</code> — Remove admin\n"
             "<code>/finduser {id}</code> — View user details\n"
             "<code>/ping</code> — VPS stats\n"
+            "<code>/blocking</code> — Event loop stalls\n"
             "<code>/stats</code> — Admin bot stats\n"
             "<code>/bd</code> — Broadcast to all users\n"
         )
@@ -1730,13 +4075,14 @@ async def cmd_users(event):
     if not is_admin(uid):
         return
     
-    users = get_all_users()
-    if not users:
+    total = users_col.count_documents({})
+    if not total:
         await event.respond("No users.")
         return
     
+    users = get_all_users(limit=50)
     text = "**All Users**\n\n"
-    for u in users[:50]:
+    for u in users:
         user_id = u.get('user_id')
         tier = u.get('tier', 'free')
         tier_icon = "P" if tier == 'premium' else "F"
@@ -1745,8 +4091,8 @@ async def cmd_users(event):
         is_owner = " (Admin)" if user_id == CONFIG['owner_id'] else ""
         text += f"[{tier_icon}] `{user_id}` - {accounts}/{max_acc} acc{is_owner}\n"
     
-    if len(users) > 50:
-        text += f"\n...+{len(users)-50} more"
+    if total > 50:
+        text += f"\n...+{total-50} more"
     
     await event.respond(text)
 
@@ -1768,34 +4114,68 @@ async def cmd_ping(event):
     if not is_admin(uid):
         return
     
+    if 'routes' in event.raw_text.split()[1:]:
+        header = f"<b>Handler latency (last {ROUTE_STATS['samples']} calls per route)</b>\n\n"
+        await event.respond(
+            header + render_route_stats(max_chars=TELEGRAM_TEXT_LIMIT - len(header)),
+            parse_mode='html'
+        )
+        return
+
     import platform
-    cpu = psutil.cpu_percent(interval=1)
-    ram = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
+    sample = latest_system_sample()
     uptime_sec = int((datetime.now() - datetime.fromtimestamp(psutil.boot_time())).total_seconds())
     uptime_str = f"{uptime_sec//3600:02d}:{(uptime_sec%3600)//60:02d}:{uptime_sec%60:02d}"
-    
-    # Bot stats
-    total_users = users_col.count_documents({})
-    active_accounts = accounts_col.count_documents({'is_forwarding': True})
-    total_accounts = accounts_col.count_documents({})
+    counts_at = system_counts['at'].strftime('%H:%M:%S') if system_counts['at'] else 'pending'
     
     text = (
         f"<b>PONG! — BOT STATUS</b>\n\n"
         f"<code> System: {platform.system()} {platform.release()}\n"
         f" Uptime: {uptime_str}\n\n"
-        f" CPU Usage: {cpu}%\n"
-        f" RAM: {ram.percent}% ({ram.used//(1024**3)}GB / {ram.total//(1024**3)}GB)\n"
-        f" Disk: {disk.percent}% ({disk.used//(1024**3)}GB / {disk.total//(1024**3)}GB)</code>\n\n"
-        f"<b>[stats]</b> Bot Stats:\n"
-        f"<code>• Active Broadcasts: {active_accounts}\n"
-        f"• Total Users: {total_users}\n"
-        f"• Active Accounts: {total_accounts}</code>\n\n"
+        f" CPU Usage: {sample['cpu']}% (bot {sample['proc_cpu']:.0f}%)\n"
+        f" RAM: {sample['ram_percent']}% ({sample['ram_used']//(1024**3)}GB / {sample['ram_total']//(1024**3)}GB)\n"
+        f" Disk: {sample['disk_percent']}% ({sample['disk_used']//(1024**3)}GB / {sample['disk_total']//(1024**3)}GB)</code>\n\n"
+        f"<b>[trend]</b> Last {len(system_samples)} samples, every {METRICS['system_interval']:g}s:\n"
+        f"<code> CPU   {system_trend('cpu')} {sample['cpu']:.0f}%\n"
+        f" RSS   {system_trend('rss')} {sample['rss']//(1024**2)}MB\n"
+        f" FDs   {system_trend('fds')} {sample['fds']}\n"
+        f" Tasks {system_trend('tasks')} {sample['tasks']} ({sample['forwarders']} forwarders)\n"
+        f" Lag   {system_trend('loop_lag')} {sample['loop_lag']*1000:.0f}ms</code>\n\n"
+        f"<b>[stats]</b> Bot Stats (as of {counts_at}):\n"
+        f"<code>• Active Broadcasts: {system_counts['active_accounts']}\n"
+        f"• Total Users: {system_counts['users']}\n"
+        f"• Active Accounts: {system_counts['accounts']}</code>\n\n"
+        f"<b>[slow]</b> Slowest Routes (p95):\n"
+        f"{render_route_stats(limit=ROUTE_STATS['top'])}\n"
+        f"<i>/ping routes for every route</i>\n\n"
         f"<i>Bot is running smoothly!</i> <b>[OK]</b>"
     )
     
     await event.respond(text, parse_mode='html')
 
+@main_bot.on(events.NewMessage(pattern=r'^/blocking(?:@[\w_]+)?(?:\s|$)'))
+async def cmd_blocking(event):
+    """Admin: Show the code paths that blocked the event loop the longest."""
+    uid = event.sender_id
+    if not is_admin(uid):
+        return
+
+    if 'reset' in event.raw_text.split()[1:]:
+        with loop_stalls_lock:
+            loop_stalls.clear()
+        loop_lag['max'] = 0.0
+        await event.respond("Loop stall samples cleared.")
+        return
+
+    header = (
+        f"<b>Event loop stalls</b> (threshold {METRICS['block_threshold']:g}s, "
+        f"max lag {loop_lag['max']:.2f}s)\n\n"
+    )
+    footer = "\n\n<i>/blocking reset to start over</i>"
+    body = render_loop_stalls(limit=METRICS['block_top'],
+                              max_chars=TELEGRAM_TEXT_LIMIT - len(header) - len(footer))
+    await event.respond(header + body + footer, parse_mode='html')
+
 @main_bot.on(events.NewMessage(pattern=r'^/reboot(?:@[\w_]+)?(?:\s|$)'))
 async def cmd_reboot(event):
     """Admin: Reboot the bot (restart process)."""
@@ -1824,6 +4204,7 @@ async def cmd_addadmin(event):
     
     # Add to admins
     admins_col.insert_one({'user_id': target_uid, 'added_at': datetime.now(), 'added_by': uid})
+    forget_entitlements(target_uid)
     
     # Notify
     try:
@@ -1849,6 +4230,7 @@ async def cmd_rmadmin(event):
     
     # Remove from admins
     result = admins_col.delete_one({'user_id': target_uid})
+    forget_entitlements(target_uid)
     
     if result.deleted_count > 0:
         # Notify
@@ -1904,7 +4286,7 @@ async def cmd_go(event):
                 accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': True}})
                 
                 if acc['_id'] not in forwarding_tasks or forwarding_tasks[acc['_id']].done():
-                    task = asyncio.create_task(run_forwarding_loop(uid, acc['_id']))
+                    task = spawn_detached(run_forwarding_loop(uid, acc['_id']))
                     forwarding_tasks[acc['_id']] = task
                 
                 started += 1
@@ -2135,53 +4517,14 @@ async def cmd_bd_broadcast(event):
         await event.respond("Reply to a message with /bd to broadcast it!")
         return
     
-    users = get_all_users()
-    total = len(users)
-    
     # Get sender info
     sender = await replied_msg.get_sender()
     sender_name = getattr(sender, 'first_name', 'Unknown')
     sender_username = getattr(sender, 'username', None)
     sender_display = f"@{sender_username}" if sender_username else sender_name
     
-    # Progress message
-    progress_msg = await event.respond(f"📢 Broadcasting from {sender_display}...\n0/{total} (0%)")
-    
-    sent = 0
-    failed = 0
-    
-    for i, u in enumerate(users):
-        try:
-            # Forward the message directly (preserves media, buttons, formatting)
-            await main_bot.forward_messages(
-                u['user_id'],
-                replied_msg,
-                from_peer=event.chat_id
-            )
-            sent += 1
-        except Exception as e:
-            failed += 1
-            print(f"[BROADCAST] Failed to send to {u['user_id']}: {e}")
-        
-        # Update progress every 10 users or at end
-        if (i + 1) % 10 == 0 or (i + 1) == total:
-            percent = int(((i + 1) / total) * 100)
-            await progress_msg.edit(
-                f"📢 Broadcasting from {sender_display}...\n{i + 1}/{total} ({percent}%)\n\n"
-                f"✅ Sent: {sent}\n❌ Failed: {failed}"
-            )
-        
-        # Small delay to avoid flood
-        await asyncio.sleep(0.05)
-    
-    await progress_msg.edit(
-        f"✅ <b>Broadcast Complete!</b>\n\n"
-        f"<b>From:</b> {sender_display}\n"
-        f"<b>Total:</b> {total}\n"
-        f"<b>Sent:</b> {sent}\n"
-        f"<b>Failed:</b> {failed}",
-        parse_mode='html'
-    )
+    # Runs in the background; progress is edited into the reply on a timer
+    await start_broadcast(event, 'forward', sender=sender_display, from_peer=event.chat_id, msg_id=replied_msg.id)
 
 @main_bot.on(events.NewMessage(pattern=r'^/broadcast(?:@[\w_]+)?\s+(.+)$', func=lambda e: not e.is_reply))
 async def cmd_broadcast(event):
@@ -2190,18 +4533,7 @@ async def cmd_broadcast(event):
         return
     
     msg = event.pattern_match.group(1)
-    users = get_all_users()
-    
-    sent = 0
-    failed = 0
-    for u in users:
-        try:
-            await main_bot.send_message(u['user_id'], f"**Announcement**\n\n{msg}")
-            sent += 1
-        except:
-            failed += 1
-    
-    await event.respond(f"Broadcast complete!\nSent: {sent}\nFailed: {failed}")
+    await start_broadcast(event, 'text', text=f"**Announcement**\n\n{msg}")
 
 @main_bot.on(events.NewMessage(pattern=r'^/add(?:@[\w_]+)?(?:\s|$)'))
 async def cmd_add(event):
@@ -2223,7 +4555,8 @@ async def cmd_add(event):
             await event.respond(f"Free tier limit: {max_accounts} account(s).\nUpgrade to Premium for more!")
         return
     
-    user_states[uid] = {'action': 'phone'}
+    await end_login(uid)
+    user_states[uid] = new_login_state(action='phone')
     await event.respond("Send phone number with country code:\n\nExample: `+919876543210`")
 
 @main_bot.on(events.NewMessage(pattern=r'^/list(?:@[\w_]+)?(?:\s|$)'))
@@ -2252,2377 +4585,2420 @@ async def cmd_list(event):
     
     await event.respond(text)
 
+# ===================== Callback Router =====================
+# Button callbacks are dispatched through a table instead of one long if/elif chain:
+# exact callback data is a dict lookup, otherwise the longest registered prefix wins (char
+# trie). Each route declares its gates (force-join, admin, premium) and how to parse the
+# payload that follows its prefix; handlers are called as handler(event, uid, data, payload).
+
+callback_exact_routes = {}  # {data: route}
+callback_prefix_trie = {}  # nested {char: node}; node[None] holds the route for that prefix
+
+
+def callback_route(exact=(), prefix=(), parse=None, forcejoin=True, admin=False, premium=False):
+    """Register a callback handler for exact data value(s) and/or data prefix(es)."""
+    exact = (exact,) if isinstance(exact, str) else tuple(exact)
+    prefix = (prefix,) if isinstance(prefix, str) else tuple(prefix)
+
+    def register(handler):
+        for key in exact:
+            callback_exact_routes[key] = {
+                'name': key, 'handler': handler, 'prefix': None, 'parse': None,
+                'forcejoin': forcejoin, 'admin': admin, 'premium': premium,
+            }
+        for key in prefix:
+            node = callback_prefix_trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[None] = {
+                'name': key + '*', 'handler': handler, 'prefix': key, 'parse': parse,
+                'forcejoin': forcejoin, 'admin': admin, 'premium': premium,
+            }
+        return handler
+    return register
+
+
+def match_callback_route(data: str):
+    """Return (route, raw payload) for callback data, or (None, None)."""
+    route = callback_exact_routes.get(data)
+    if route is not None:
+        return route, None
+    node = callback_prefix_trie
+    for ch in data:
+        node = node.get(ch)
+        if node is None:
+            break
+        if None in node:
+            route = node[None]
+    if route is None:
+        return None, None
+    return route, data[len(route['prefix']):]
+
+
 @main_bot.on(events.CallbackQuery)
 async def callback(event):
     uid = event.sender_id
     data = event.data.decode()
 
-    # Force-join gate for interactive UI (admin bypass).
-    # Allow verify button itself.
-    if data != "force_verify":
-        if not await enforce_forcejoin_or_prompt(event, edit=True):
-            return
-    
+    route, payload = match_callback_route(data)
+    if route is None:
+        name_current_route(None)
+        return
+    name_current_route(f"cb:{route['name']}")
+
+    # Force-join gate for interactive UI (admin bypass); the Verify button skips it.
+    if route['forcejoin'] and not await enforce_forcejoin_or_prompt(event, edit=True):
+        return
+    if route['admin'] and not is_admin(uid):
+        return
+    if route['premium'] and not is_premium(uid):
+        await event.answer("Premium only!", alert=True)
+        return
+
     try:
-        if data == "force_verify":
-            # User claims they joined; re-validate.
-            if await is_user_passed_forcejoin(uid):
-                # Delete the force-join message
-                try:
-                    await event.delete()
-                except:
-                    pass
-                
-                # Show Privacy Policy screen (new flow)
-                await main_bot.send_message(
-                    uid,
-                    MESSAGES['privacy_short'],
-                    parse_mode='html',
-                    buttons=[
-                        [Button.url("📄 View Full Privacy Policy", MESSAGES['privacy_full_link'])],
-                        [Button.inline("✅ Accept & Continue", b"accept_privacy")]
-                    ]
-                )
-            else:
-                await event.answer("Not joined yet. Please join both Channel and Group.", alert=True)
-            return
-        
-        if data == "accept_privacy":
-            # User accepted privacy policy → Show welcome with Adsye Now
-            welcome_text = (
-                "🚀 Welcome to Adsye Bot!\n\n"
-                "Automate your Telegram advertising campaigns across multiple groups.\n\n"
-                "<blockquote><b>Plans Available:</b>\n"
-                "• Scout (Free)\n"
-                "• Grow (₹69)\n"
-                "• Prime (₹199)\n"
-                "• Dominion (₹389)</blockquote>\n\n"
-                "Click <b>Adsye Now</b> to choose your plan!"
-            )
-            welcome_image = MESSAGES.get('welcome_image', '')
-            if welcome_image:
-                await event.delete()
-                await main_bot.send_file(
-                    uid,
-                    welcome_image,
-                    caption=welcome_text,
-                    parse_mode='html',
-                    buttons=[[Button.inline("🚀 Adsye Now", b"adsye_now")]]
-                )
-            else:
-                await event.edit(
-                    welcome_text,
-                    parse_mode='html',
-                    buttons=[[Button.inline("🚀 Adsye Now", b"adsye_now")]]
-                )
-            return
+        if route['parse'] is not None:
+            payload = route['parse'](payload)
+        await route['handler'](event, uid, data, payload)
+    except MessageNotModifiedError:
+        pass
+    except Exception as e:
+        callback_log.exception("Callback error: %s", e, extra={'user_id': uid})
+        await event.answer("Error!", alert=True)
 
-        if data.startswith("verify_"):
-            # Verify payment with rate limit (1 tap / 10 seconds)
-            pay_id = data.replace("verify_", "")
-            
-            # Check rate limit
-            now = time.time()
-            last_verify = payment_verify_cooldown.get(uid, 0)
-            if now - last_verify < 10:
-                remaining = int(10 - (now - last_verify))
-                await event.answer(f"Wait {remaining}s before verifying again!", alert=True)
-                return
-            
-            payment_verify_cooldown[uid] = now
-            
-            if pay_id not in active_invoices:
-                await event.answer("Invalid payment ID!", alert=True)
-                return
-            
-            invoice = active_invoices[pay_id]
-            
-            # Call gateway to verify payment
-            success, res = await call_gateway("upi/verify", {"pay_id": pay_id})
-            
-            if success:
-                # NOTE: Gateway response formats may vary.
-                # Old: {"status": "paid" | "already_paid" | "pending"}
-                # New: {"status": "success", "amount": 1.0}
-                status = str(res.get('status', '')).lower().strip()
-
-                # Optional amount validation (prevents accidentally confirming wrong invoice)
-                expected_amount = invoice.get('amount')
-                received_amount = res.get('amount', None)
-                if received_amount is not None and expected_amount is not None:
-                    try:
-                        if abs(float(received_amount) - float(expected_amount)) > 0.001:
-                            await event.answer(
-                                f"Amount mismatch! Expected ₹{expected_amount}, got ₹{received_amount}.",
-                                alert=True
-                            )
-                            return
-                    except Exception:
-                        # If amount can't be parsed, don't block verification; just continue.
-                        pass
 
-                paid = (
-                    status in {'paid', 'already_paid', 'success'} or
-                    bool(res.get('paid')) is True
-                )
+# ===================== Background Callbacks =====================
+# Slow actions (Telegram logins, gateway calls) must not keep the button spinning: the
+# handler does its quick checks, then answer_then_run() answers the callback at once and
+# finishes the work in a tracked task that delivers its result by editing the message.
+# The callback can only be answered once, so the work itself must not call event.answer.
 
-                if paid:
-                    # Payment confirmed!
-                    plan_name = invoice['plan']
-                    plan = PLANS[plan_name]
+callback_jobs = {}  # {user_id: set of running asyncio.Task}
 
-                    # Grant premium with plan name (for 30-day expiry tracking)
-                    plan_display_name = plan_name.replace('plan_', '').capitalize() if 'plan_' in plan_name else plan_name.capitalize()
-                    set_user_premium(uid, plan['max_accounts'], plan_display_name)
 
-                    # Clean up
-                    del active_invoices[pay_id]
-                    if uid in payment_verify_cooldown:
-                        del payment_verify_cooldown[uid]
+def _forget_callback_job(uid: int, task):
+    running = callback_jobs.get(uid)
+    if running is None:
+        return
+    running.discard(task)
+    if not running:
+        callback_jobs.pop(uid, None)
 
-                    # Send payment confirmation notification with image
-                    try:
-                        await event.delete()
-                    except Exception:
-                        pass
-                    await event.answer("Payment verified!", alert=True)
 
-                    # Notify + open dashboard (best effort). If user has blocked bot / chat issues,
-                    # we still keep premium granted and show a fallback message.
-                    try:
-                        welcome_image = MESSAGES.get('welcome_image', '')
-                        notify_text = (
-                            "<b>🎉 Payment Confirmed!</b>\n\n"
-                            f"<b>Plan:</b> {plan['name']}\n"
-                            f"<b>Accounts:</b> {plan['max_accounts']}\n"
-                            "<b>Validity:</b> 30 days\n\n"
-                            "<i>Your premium features are now active!</i>\n"
-                            "<i>Opening dashboard...</i>"
-                        )
-
-                        if welcome_image:
-                            await main_bot.send_file(uid, welcome_image, caption=notify_text, parse_mode='html')
-                        else:
-                            await main_bot.send_message(uid, notify_text, parse_mode='html')
-
-                        # Wait a moment for user to see the success message
-                        await asyncio.sleep(2)
-
-                        # Automatically redirect to dashboard
-                        accounts = get_user_accounts(uid)
-                        dashboard_text = (
-                            f"<b>🏠 Dashboard</b>\n\n"
-                            f"<b>👤 User ID:</b> <code>{uid}</code>\n"
-                            f"<b>📊 Plan:</b> {plan['name']} {plan.get('emoji', '✨')}\n"
-                            f"<b>🔢 Max Accounts:</b> {plan['max_accounts']}\n"
-                            f"<b>📱 Current Accounts:</b> {len(accounts)}/{plan['max_accounts']}\n"
-                            f"<b>📅 Expires:</b> {(datetime.now() + timedelta(days=30)).strftime('%d %b %Y')}\n\n"
-                            "<i>Start by adding your Telegram accounts!</i>"
-                        )
-                        dashboard_buttons = [
-                            [Button.inline("➕ Add Account", b"add_account")],
-                            [Button.inline("📋 My Accounts", b"list_accounts")],
-                            [Button.inline("📦 Plans", b"back_plans"), Button.inline("ℹ️ Help", b"help")]
-                        ]
-                        await main_bot.send_message(uid, dashboard_text, parse_mode='html', buttons=dashboard_buttons)
-                    except Exception as e:
-                        print(f"[PAYMENT] Post-upgrade UI send failed for {uid}: {e}")
-                        try:
-                            await event.answer(
-                                "✅ Premium activated. If menu didn't open, type /start to open dashboard.",
-                                alert=True
-                            )
-                        except Exception:
-                            pass
-                        try:
-                            await main_bot.send_message(
-                                uid,
-                                "✅ Premium activated. Type /start to open dashboard.",
-                            )
-                        except Exception:
-                            pass
-                elif status == 'pending':
-                    await event.answer("Payment pending! Please wait and try again.", alert=True)
-                else:
-                    await event.answer(f"Payment status: {status or 'unknown'}", alert=True)
-            else:
-                await event.answer("Payment not confirmed yet!", alert=True)
-            
-            return
-        
-        if data.startswith("cancel_"):
-            # Cancel payment
-            pay_id = data.replace("cancel_", "")
-            
-            if pay_id in active_invoices:
-                del active_invoices[pay_id]
-            
-            try:
-                await event.delete()
-            except:
-                pass
-            await event.answer("Payment cancelled!")
-            return
+async def _run_callback_job(uid: int, work):
+    try:
+        await work()
+    except MessageNotModifiedError:
+        pass
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        callback_log.exception("Background job failed: %s", e, extra={'user_id': uid})
+        try:
+            await main_bot.send_message(uid, "❌ Something went wrong. Please try again.")
+        except Exception:
+            pass
 
-        if data.startswith("payment_"):
-            # payment_upi_grow or payment_crypto_prime
-            parts = data.split("_")
-            method = parts[1]  # upi or crypto
-            plan_name = parts[2]  # grow, prime, dominion
-            
-            plan = PLANS.get(plan_name)
-            if not plan:
-                await event.answer("Invalid plan!", alert=True)
-                return
-            
-            # UPI payment with gateway.py integration
-            if method == "upi":
-                await event.answer("Generating UPI Invoice...")
-                
-                # Call gateway API to create invoice
-                random_user_id = random.randint(100000, 999999)
-                payload = {
-                    "user_id": random_user_id,
-                    "price_amount": plan['price'],
-                    "client_id": CLIENT_ID,
-                    "notification_url": NOTIFICATION_URL,
-                    "coin_key": ""
-                }
-                
-                success, res = await call_gateway("upi/create", payload)
-                
-                if success:
-                    pay_id = res['pay_id']
-                    upi_link = res['upi_link']
-                    
-                    # Generate QR code
-                    qr_path = f"downloads/qr_{uid}.png"
-                    os.makedirs("downloads", exist_ok=True)
-                    qrcode.make(upi_link).save(qr_path)
-                    
-                    # Store invoice
-                    active_invoices[pay_id] = {
-                        "user_id": uid,
-                        "amount": plan['price'],
-                        "plan": plan_name,
-                        "random_user_id": random_user_id
-                    }
-                    
-                    # Send payment interface with plan details
-                    payment_msg = (
-                        f"**UPI Payment**\n\n"
-                        f"**Plan:** {plan['name']}\n"
-                        f"**Price:** Rs {plan['price']}\n"
-                        f"**User ID:** {random_user_id}\n"
-                        f"**Payment ID:** `{pay_id}`\n"
-                        f"**Expiry:** 30 Minutes\n\n"
-                        f"**Plan Features:**\n"
-                        f"• {plan['max_accounts']} accounts\n"
-                        f"• {plan['max_topics']} topics\n"
-                        f"• {plan['max_groups_per_topic']} groups/topic\n\n"
-                        f"Scan QR and click **Verify Now** after payment."
-                    )
-                    
-                    try:
-                        await event.delete()
-                    except:
-                        pass
-                    
-                    await main_bot.send_file(
-                        uid,
-                        qr_path,
-                        caption=payment_msg,
-                        buttons=[
-                            [Button.inline("✅ Verify Now", f"verify_{pay_id}")],
-                            [Button.inline("❌ Cancel", f"cancel_{pay_id}")],
-                            [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Home", b"back_start")]
-                        ]
-                    )
-                    
-                    # Clean up QR
-                    if os.path.exists(qr_path):
-                        os.remove(qr_path)
-                else:
-                    await event.answer("Payment gateway error! Try again.", alert=True)
-                
-                return
-            
-            # Crypto placeholder
-            else:
-                payment_info = (
-                    f"₿ **Crypto Payment - {plan['name']}**\n\n"
-                    f"Amount: **{plan['price_display']}**\n\n"
-                    f"Contact admin for crypto payment."
-                )
-                
-                await event.edit(
-                    payment_info,
-                    buttons=[
-                        [Button.url("Contact Admin", MESSAGES['support_link'])],
-                        [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Home", b"back_start")]
-                    ]
-                )
-                return
 
-        if data.startswith("plan_"):
-            plan_name = data.replace("plan_", "")
-            
-            plan = PLANS.get(plan_name)
-            if not plan:
-                await event.answer("Invalid plan!", alert=True)
-                return
-            
-            # Show plan details with tagline + Buy Now button
-            detail_text = (
-                f"<b>{plan['emoji']} {plan['name']} Plan</b>\n\n"
-                f"<i>{plan['tagline']}</i>\n\n"
-                f"<blockquote><b>Plan Features:</b>\n\n"
-                f"💼 <b>Accounts:</b> {plan['max_accounts']}\n"
-                f"📂 <b>Topics:</b> {plan['max_topics']}\n"
-                f"👥 <b>Groups per Topic:</b> {plan['max_groups_per_topic']}\n\n"
-                f"⏱️ <b>Delays:</b>\n"
-                f"  • Message: {plan['msg_delay']}s\n"
-                f"  • Group: {plan['group_delay']}s\n"
-                f"  • Round: {plan['round_delay']}s\n\n"
-                f"✨ <b>Features:</b>\n"
-                f"  • Auto Reply: {'Yes' if plan['auto_reply_enabled'] else 'No'}\n"
-                f"  • Logs: {'Yes' if plan['logs_enabled'] else 'No'}</blockquote>\n\n"
-            )
-            
-            if plan_name == "scout":
-                # Free plan - Show "Activate Free" or "Active" button
-                user = get_user(uid)
-                is_scout_active = user.get('approved') and user.get('tier') == 'free'
-                
-                detail_text += f"<b>Price: FREE</b>"
-                
-                if is_scout_active:
-                    buttons = [
-                        [Button.inline("✓ Active Plan", b"enter_dashboard")],
-                        [Button.inline("← Back to Plans", b"back_plans")]
-                    ]
-                else:
-                    buttons = [
-                        [Button.inline("✅ Activate Free Plan", b"activate_scout")],
-                        [Button.inline("← Back to Plans", b"back_plans")]
-                    ]
-            else:
-                # Paid plans - Check if user already has this plan
-                user = get_user(uid)
-                user_plan_name = user.get('plan_name', '').lower()
-                is_active_plan = user_plan_name == plan_name
-                
-                detail_text += f"<b>Price: {plan['price_display']}</b>"
-                
-                if is_active_plan:
-                    # User already has this plan - show Active
-                    buttons = [
-                        [Button.inline("✓ Active Plan", b"enter_dashboard")],
-                        [Button.inline("← Back to Plans", b"back_plans")]
-                    ]
-                else:
-                    # Show Buy Now button
-                    buttons = [
-                        [Button.inline(f"💳 Buy Now - {plan['price_display']}", f"buy_{plan_name}")],
-                        [Button.inline("← Back to Plans", b"back_plans")]
-                    ]
-            
-            await event.edit(detail_text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "activate_scout":
-            # Activate Scout (free) plan
-            approve_user(uid)
-            await event.answer("Scout plan activated!", alert=True)
-            
-            # Redirect to dashboard
-            await event.edit(render_dashboard_text(uid), parse_mode='html', buttons=main_dashboard_keyboard(uid))
-            return
-        
-        if data.startswith("buy_"):
-            # Buy paid plan - redirect to payment method selection
-            plan_name = data.replace("buy_", "")
-            plan = PLANS[plan_name]
-            
-            await event.edit(
-                f"<b>💳 {plan['name']} Plan - {plan['price_display']}</b>\n\n"
-                f"<b>Choose Payment Method:</b>",
-                parse_mode='html',
-                buttons=[
-                    [Button.inline("📱 UPI", f"payment_upi_{plan_name}")],
-                    [Button.inline("₿ Crypto", f"payment_crypto_{plan_name}")],
-                    [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Dashboard", b"enter_dashboard")]
-                ]
-            )
-            return
+async def answer_then_run(event, uid: int, work, ack: str = "Working..."):
+    """Answer the callback with `ack` now and run `work()` in the background.
 
-        if data == "adsye_now":
-            # Acknowledge immediately to avoid Telegram's loading animation
-            try:
-                await event.answer(cache_time=0)
-            except Exception:
-                pass
+    Returns the task, or None when the user already has CALLBACK_JOBS['per_user'] running.
+    """
+    running = callback_jobs.setdefault(uid, set())
+    if len(running) >= CALLBACK_JOBS['per_user']:
+        await event.answer("⏳ Still working on your last request...", alert=True)
+        return None
 
-            # NEW FLOW: Show plan selection (not account add)
-            plan_msg = render_plan_select_text()
-            
-            if PLAN_IMAGE_URL:
-                try:
-                    await event.delete()
-                except:
-                    pass
-                await main_bot.send_file(
-                    uid,
-                    PLAN_IMAGE_URL,
-                    caption=plan_msg,
-                    parse_mode='html',
-                    buttons=plan_select_keyboard(uid)
-                )
-            else:
-                await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
+    task = asyncio.create_task(_run_callback_job(uid, work))
+    running.add(task)
+    task.add_done_callback(lambda t: _forget_callback_job(uid, t))
+    await event.answer(ack)
+    return task
+
+
+@callback_route(exact="force_verify", forcejoin=False)
+async def cb_force_verify(event, uid, data, payload):
+    # User claims they joined; re-validate.
+    if await is_user_passed_forcejoin(uid):
+        # Delete the force-join message
+        try:
+            await event.delete()
+        except:
+            pass
+
+        # Show Privacy Policy screen (new flow)
+        await main_bot.send_message(
+            uid,
+            MESSAGES['privacy_short'],
+            parse_mode='html',
+            buttons=[
+                [Button.url("📄 View Full Privacy Policy", MESSAGES['privacy_full_link'])],
+                [Button.inline("✅ Accept & Continue", b"accept_privacy")]
+            ]
+        )
+    else:
+        await event.answer("Not joined yet. Please join both Channel and Group.", alert=True)
+
+
+@callback_route(exact="accept_privacy")
+async def cb_accept_privacy(event, uid, data, payload):
+    # User accepted privacy policy → Show welcome with Adsye Now
+    welcome_text = (
+        "🚀 Welcome to Adsye Bot!\n\n"
+        "Automate your Telegram advertising campaigns across multiple groups.\n\n"
+        "<blockquote><b>Plans Available:</b>\n"
+        "• Scout (Free)\n"
+        "• Grow (₹69)\n"
+        "• Prime (₹199)\n"
+        "• Dominion (₹389)</blockquote>\n\n"
+        "Click <b>Adsye Now</b> to choose your plan!"
+    )
+    welcome_image = MESSAGES.get('welcome_image', '')
+    if welcome_image:
+        await event.delete()
+        await main_bot.send_file(
+            uid,
+            welcome_image,
+            caption=welcome_text,
+            parse_mode='html',
+            buttons=[[Button.inline("🚀 Adsye Now", b"adsye_now")]]
+        )
+    else:
+        await event.edit(
+            welcome_text,
+            parse_mode='html',
+            buttons=[[Button.inline("🚀 Adsye Now", b"adsye_now")]]
+        )
+
+
+@callback_route(prefix="verify_")
+async def cb_verify(event, uid, data, payload):
+    # Verify payment with rate limit (1 tap / 10 seconds)
+    pay_id = payload
+
+    # Check rate limit
+    remaining = check_verify_cooldown(uid)
+    if remaining:
+        await event.answer(f"Wait {remaining}s before verifying again!", alert=True)
+        return
+
+    invoice = get_invoice(pay_id)
+    if not invoice or invoice.get('user_id') != uid:
+        await event.answer("Invalid or expired payment ID!", alert=True)
+        return
+
+    if invoice.get('status') == 'paid':
+        await event.answer("This payment was already verified. Type /start to open dashboard.", alert=True)
+        return
+
+    await answer_then_run(event, uid, lambda: verify_upi_payment(event, uid, pay_id, invoice), ack="Checking payment...")
+
+
+async def verify_upi_payment(event, uid: int, pay_id: str, invoice: dict):
+    """Ask the gateway about an invoice; grant the plan or edit the payment message with the status."""
+    async def show(status):
+        plan = PLANS.get(invoice.get('plan')) or {}
+        if not plan:
+            await main_bot.send_message(uid, status)
             return
+        await event.edit(
+            upi_payment_text(pay_id, plan, invoice.get('random_user_id', '-'), status=status),
+            buttons=upi_payment_keyboard(pay_id)
+        )
 
-        if data.startswith("admin_"):
-            # Admin panel callbacks
-            if not is_admin(uid):
-                return
-            
-            if data == "admin_users":
-                # System stats (CPU/RAM/Disk) + platform stats
-                cpu_pct = psutil.cpu_percent(interval=0.3)
-                mem = psutil.virtual_memory()
-                root_path = os.path.abspath(os.sep)
-                disk = psutil.disk_usage(root_path)
-
-                total_users = users_col.count_documents({})
-                premium_users = users_col.count_documents({'tier': 'premium'})
-                today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                new_today = users_col.count_documents({'created_at': {'$gte': today_start}}) if users_col.find_one({}, {'created_at': 1}) else 0
-                banned_users = 0  # Placeholder for banned users feature
-                
-                # Premium by plan (counts)
-                grow_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^grow$', '$options': 'i'}})
-                prime_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^prime$', '$options': 'i'}})
-                dominion_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^dominion$', '$options': 'i'}})
-                
-                # Accounts
-                total_accounts = accounts_col.count_documents({})
-                active_broadcasts = accounts_col.count_documents({'is_forwarding': True})
-                
-                # Messaging stats
-                total_ads_sent = sum(stat.get('total_sent', 0) for stat in account_stats_col.find({}, {'total_sent': 1}))
-                # Auto replies counter (stored in db, incremented when auto-reply is sent)
-                auto_replies = sum(stat.get('auto_replies', 0) for stat in account_stats_col.find({}, {'auto_replies': 1}))
-                target_groups = account_topics_col.count_documents({}) + account_auto_groups_col.count_documents({})
-                
-                # Topics
-                total_topics = account_topics_col.count_documents({})
-                active_topics = len(set(t['topic'] for t in account_topics_col.find({}, {'topic': 1})))
-                failed_topics = account_failed_groups_col.count_documents({})
-                
-                text = (
-                    f"<b>🖥️ SYSTEM STATS</b>\n\n"
-                    f"<b>CPU:</b> <code>{cpu_pct:.0f}%</code>\n"
-                    f"<b>RAM:</b> <code>{mem.percent:.0f}%</code> <i>({mem.used//(1024**3)}GB/{mem.total//(1024**3)}GB)</i>\n"
-                    f"<b>DISK:</b> <code>{disk.percent:.0f}%</code> <i>({disk.used//(1024**3)}GB/{disk.total//(1024**3)}GB)</i>\n\n"
-                    f"<b>👥 USERS:</b>\n"
-                    f"<code>├ Total: {total_users}\n"
-                    f"├ Subscribers: {premium_users}\n"
-                    f"├ New Today: {new_today}\n"
-                    f"└ Banned: {banned_users}</code>\n\n"
-                    f"<b>✦ PREMIUM BY PLAN:</b>\n"
-                    f"<code>├ Grow: {grow_count}\n"
-                    f"├ Prime: {prime_count}\n"
-                    f"└ Dominion: {dominion_count}</code>\n\n"
-                    f"<b>📱 ACCOUNTS:</b>\n"
-                    f"<code>├ Total: {total_accounts}\n"
-                    f"└ Active Broadcasts: {active_broadcasts}</code>\n\n"
-                    f"<b>💬 MESSAGING:</b>\n"
-                    f"<code>├ Total Ads Sent: {total_ads_sent}\n"
-                    f"├ Auto-Replies: {auto_replies}\n"
-                    f"└ Target Groups: {target_groups}</code>\n\n"
-                    f"<b>📂 TOPICS:</b>\n"
-                    f"<code>├ Total: {total_topics}\n"
-                    f"├ Active: {active_topics}\n"
-                    f"└ Failed: {failed_topics}</code>"
-                )
-                
-                await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"back_admin")]])
-                return
-            
-            if data == "admin_admins":
-                admins = list(admins_col.find())
-                text = f"**Admins List**\n\nOwner: `{CONFIG['owner_id']}`\n\n"
-                for a in admins:
-                    text += f"`{a['user_id']}`\n"
-                
-                await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
-                return
-            
-            if data == "admin_stats":
-                # psutil is imported at module level
-                cpu = psutil.cpu_percent(interval=1)
-                ram = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                
-                text = (
-                    f"**System Stats**\n\n"
-                    f"CPU: {cpu}%\n"
-                    f"RAM: {ram.percent}% ({ram.used // (1024**3)}GB / {ram.total // (1024**3)}GB)\n"
-                    f"Disk: {disk.percent}% ({disk.used // (1024**3)}GB / {disk.total // (1024**3)}GB)\n"
-                )
-                
-                await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
-                return
-            
-            if data == "admin_controls":
-                text = "**Bot Controls**\n\nUse commands:\n/ping - System stats\n/reboot - Restart bot"
-                await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
-                return
-            
-            if data == "back_admin":
-                # Recreate admin panel
-                total_users = users_col.count_documents({})
-                premium_users = users_col.count_documents({'tier': 'premium'})
-                total_accounts = accounts_col.count_documents({})
-                active_accounts = accounts_col.count_documents({'is_forwarding': True})
-                total_admins = admins_col.count_documents({}) + 1
-                
-                text = (
-                    "<b>Admin Panel</b>\n\n"
-                    "<b>Bot Statistics</b>\n"
-                    f"Total Users: <code>{total_users}</code>\n"
-                    f"Premium Users: <code>{premium_users}</code>\n"
-                    f"Total Accounts: <code>{total_accounts}</code>\n"
-                    f"Active Forwarding: <code>{active_accounts}</code>\n"
-                    f"Total Admins: <code>{total_admins}</code>\n\n"
-                    "<i>Use commands or buttons below:</i>"
-                )
-
-                buttons = [
-                    [Button.inline("👥 View Users", b"admin_users"), Button.inline("👑 View Admins", b"admin_admins")],
-                    [Button.inline("📊 Full Stats", b"admin_stats"), Button.inline("🔧 Bot Controls", b"admin_controls")],
-                    [Button.inline("🏠 Back", b"back_start")]
-                ]
-
-                await event.edit(text, parse_mode='html', buttons=buttons)
-                return
+    # Call gateway to verify payment
+    success, res = await call_gateway("upi/verify", {"pay_id": pay_id})
+    if not success:
+        await show("⏳ Payment not confirmed yet!")
+        return
 
-        if data.startswith("addprm_"):
-            # Admin granting premium plan
-            if not is_admin(uid):
-                return
-            
-            state = user_states.get(uid, {})
-            target_uid = state.get('target_uid')
-            
-            if not target_uid:
-                await event.answer("Session expired!", alert=True)
-                return
-            
-            if data == "addprm_cancel":
-                del user_states[uid]
-                await event.edit("Cancelled.")
-                return
-            
-            # Extract plan name
-            plan_name = data.replace("addprm_", "")
-            plan = PLANS.get(plan_name)
-            
-            if not plan:
-                await event.answer("Invalid plan!", alert=True)
+    # NOTE: Gateway response formats may vary.
+    # Old: {"status": "paid" | "already_paid" | "pending"}
+    # New: {"status": "success", "amount": 1.0}
+    status = str(res.get('status', '')).lower().strip()
+
+    # Optional amount validation (prevents accidentally confirming wrong invoice)
+    expected_amount = invoice.get('amount')
+    received_amount = res.get('amount', None)
+    if received_amount is not None and expected_amount is not None:
+        try:
+            if abs(float(received_amount) - float(expected_amount)) > 0.001:
+                await show(f"⚠️ Amount mismatch! Expected ₹{expected_amount}, got ₹{received_amount}.")
                 return
-            
-            # Grant premium with plan name
-            plan_name = plan_id.replace('plan_', '').capitalize()
-            set_user_premium(target_uid, plan['max_accounts'], plan_name)
-            
-            # Notify target user
-            try:
-                await main_bot.send_message(
-                    target_uid,
-                    f"**Premium Activated**\n\n"
-                    f"Plan: {plan['name']}\n"
-                    f"Accounts: {plan['max_accounts']}\n\n"
-                    f"Your premium plan has been activated by admin!\n"
-                    f"Enjoy all features."
-                )
-            except:
-                pass
-            
-            # Confirm to admin
-            del user_states[uid]
-            await event.edit(
-                f"**Premium Granted**\n\n"
-                f"User: `{target_uid}`\n"
-                f"Plan: {plan['name']}\n"
-                f"Accounts: {plan['max_accounts']}\n\n"
-                f"User has been notified."
-            )
+        except Exception:
+            # If amount can't be parsed, don't block verification; just continue.
+            pass
+
+    paid = (
+        status in {'paid', 'already_paid', 'success'} or
+        bool(res.get('paid')) is True
+    )
+
+    if paid:
+        # Payment confirmed! Only the first verify (or webhook) for this invoice grants premium.
+        claimed = claim_invoice(pay_id, paid_via='verify')
+        if not claimed:
+            await show("✅ This payment was already verified. Type /start to open dashboard.")
             return
 
-        if data == "noop":
-            await event.answer("Account limit reached!")
+        try:
+            apply_invoice_plan(claimed)
+        except Exception as e:
+            payment_log.error("Grant failed for %s: %s", pay_id, e, extra={'user_id': uid})
+            await show("⚠️ Payment received but activation failed. Tap Verify again in a minute.")
             return
-        
-        if data == "back_plans":
-            # Return to plan selection screen
-            plan_msg = (
-                "<b>💎 Choose Your Plan</b>\n\n"
-                "<blockquote>Select a plan that fits your advertising needs.\n"
-                "You can upgrade anytime.</blockquote>"
+
+        # Clean up
+        payment_verify_cooldown.pop(uid, None)
+
+        try:
+            await event.delete()
+        except Exception:
+            pass
+
+        if not await announce_invoice_plan(claimed):
+            await main_bot.send_message(
+                uid, "✅ Premium activated. If menu didn't open, type /start to open dashboard."
             )
+    elif status == 'pending':
+        await show("⏳ Payment pending! Please wait and try again.")
+    else:
+        await show(f"Payment status: {status or 'unknown'}")
 
-            if PLAN_IMAGE_URL:
-                # Edit caption/text only (media edit is tricky); just edit message text
-                await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
-            else:
-                await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
-            return
 
-        if data == "back_start":
-            # If force-join is enabled and user isn't joined, show lock screen
-            if not await enforce_forcejoin_or_prompt(event, edit=True):
-                return
+@callback_route(prefix="cancel_")
+async def cb_cancel(event, uid, data, payload):
+    # Cancel payment
+    pay_id = payload
 
-            # Check if user has accounts
-            accounts = get_user_accounts(uid)
-            
-            if len(accounts) > 0:
-                # User has accounts, show plan selection
-                plan_msg = (
-                    "**💎 Choose Your Plan to Continue:**\n\n"
-                    "• Scout - Free starter plan\n"
-                    "• Grow - Scale your campaigns (₹69)\n"
-                    "• Prime - Advanced automation (₹199)\n"
-                    "• Dominion - Enterprise level (₹389)"
-                )
-                
-                if PLAN_IMAGE_URL:
-                    try:
-                        await event.delete()
-                    except:
-                        pass
-                    await main_bot.send_file(uid, PLAN_IMAGE_URL, caption=plan_msg, buttons=plan_select_keyboard(uid))
-                else:
-                    await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
-            else:
-                # No accounts, show welcome screen
-                await event.edit(render_welcome_text(), parse_mode='html', buttons=new_welcome_keyboard())
-            return
-        
-        if data == "enter_dashboard":
-            # Force-join gate (extra safety)
-            if not await enforce_forcejoin_or_prompt(event, edit=True):
-                return
+    cancel_invoice(pay_id, uid)
 
-            if not is_approved(uid):
-                approve_user(uid)
+    try:
+        await event.delete()
+    except:
+        pass
+    await event.answer("Payment cancelled!")
+
+
+@callback_route(prefix="payment_")
+async def cb_payment(event, uid, data, payload):
+    # payment_upi_grow or payment_crypto_prime
+    parts = data.split("_")
+    method = parts[1]  # upi or crypto
+    plan_name = parts[2]  # grow, prime, dominion
+
+    plan = PLANS.get(plan_name)
+    if not plan:
+        await event.answer("Invalid plan!", alert=True)
+        return
+
+    # UPI payment with gateway.py integration
+    if method == "upi":
+        await event.answer("Generating UPI Invoice...")
+
+        # Call gateway API to create invoice
+        random_user_id = random.randint(100000, 999999)
+        payload = {
+            "user_id": random_user_id,
+            "price_amount": plan['price'],
+            "client_id": CLIENT_ID,
+            "notification_url": NOTIFICATION_URL,
+            "coin_key": ""
+        }
+
+        success, res = await call_gateway("upi/create", payload)
+
+        if success:
+            pay_id = res['pay_id']
+            upi_link = res['upi_link']
+
+            # Generate QR code (in memory, off the event loop)
+            qr_file = await asyncio.to_thread(render_qr_png, upi_link)
+
+            # Store invoice
+            create_invoice(pay_id, uid, plan_name, plan['price'], random_user_id=random_user_id)
 
-            # Update account profiles when dashboard loads
-            try:
-                await apply_account_profile_templates(uid)
-            except Exception:
-                pass
 
-            text = render_dashboard_text(uid)
-            
-            buttons = main_dashboard_keyboard(uid)
-            # Admin button removed (already in main_dashboard_keyboard)
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "menu_account":
-            accounts = get_user_accounts(uid)
-            max_acc = get_user_max_accounts(uid)
-            text = (
-                f"<b>👤 Account Management</b>\n\n"
-                f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n\n"
-                f"<i>Select an account below or add a new one.</i>"
-            )
-            await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid))
-            return
-        
-        if data.startswith("accpage_"):
-            page = int(data.split("_")[1])
-            accounts = get_user_accounts(uid)
-            max_acc = get_user_max_accounts(uid)
-            text = (
-                f"<b>👤 Account Management</b>\n\n"
-                f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n\n"
-                f"<i>Page:</i> <code>{page+1}</code>"
-            )
-            await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid, page))
-            return
-        
-        if data == "add_account":
-            accounts = get_user_accounts(uid)
-            max_accounts = get_user_max_accounts(uid)
-            if len(accounts) >= max_accounts:
-                await event.answer(f"Account limit reached ({max_accounts})!", alert=True)
-                return
-            user_states[uid] = {'action': 'phone'}
-            await event.edit("**Add Account**\n\nSend phone number with country code:\n\nExample: `+919876543210`", buttons=[[Button.inline("Cancel", b"menu_account")]])
-            return
-        
-        if data == "delete_account_menu":
-            accounts = get_user_accounts(uid)
-            if not accounts:
-                await event.answer("No accounts to delete!", alert=True)
-                return
-            await event.edit("**Delete Account**\n\nSelect account to delete:", buttons=delete_account_list_keyboard(uid))
-            return
-        
-        if data.startswith("confirm_del_"):
-            acc_id = data.replace("confirm_del_", "")
-            from bson.objectid import ObjectId
-            try:
-                acc = accounts_col.find_one({'_id': ObjectId(acc_id), 'user_id': uid})
-            except:
-                acc = accounts_col.find_one({'_id': acc_id, 'user_id': uid})
-            if acc:
-                phone = acc['phone']
-                await event.edit(
-                    f"**Confirm Delete**\n\nAre you sure you want to delete account:\n`{phone}`?",
-                    buttons=[
-                        [Button.inline("Yes, Delete", f"final_del_{acc_id}"), Button.inline("No, Cancel", b"delete_account_menu")]
-                    ]
-                )
-            return
-        
-        if data.startswith("final_del_"):
-            acc_id = data.replace("final_del_", "")
-            from bson.objectid import ObjectId
             try:
-                acc = accounts_col.find_one({'_id': ObjectId(acc_id), 'user_id': uid})
+                await event.delete()
             except:
-                acc = accounts_col.find_one({'_id': acc_id, 'user_id': uid})
-            if acc:
-                real_id = acc['_id']
-                if real_id in forwarding_tasks:
-                    forwarding_tasks[real_id].cancel()
-                    del forwarding_tasks[real_id]
-                accounts_col.delete_one({'_id': real_id})
-                account_topics_col.delete_many({'account_id': real_id})
-                account_settings_col.delete_many({'account_id': real_id})
-                account_auto_groups_col.delete_many({'account_id': real_id})
-                await event.answer("Account deleted!", alert=True)
-            await event.edit(
-                "<b>👤 Account Management</b>",
-                parse_mode='html',
-                buttons=account_list_keyboard(uid)
-            )
-            return
-        
-        if data == "menu_analytics":
-            accounts = get_user_accounts(uid)
-            total_sent = 0
-            total_failed = 0
-            total_groups = 0
-            total_auto_replies = 0
-            
-            for acc in accounts:
-                # Convert ObjectId to string for stats lookup
-                account_id = str(acc['_id'])
-                stats = account_stats_col.find_one({'account_id': account_id})
-                if stats:
-                    total_sent += stats.get('total_sent', 0)
-                    total_failed += stats.get('total_failed', 0)
-                    total_auto_replies += stats.get('auto_replies', 0)
-                groups = account_auto_groups_col.count_documents({'account_id': account_id})
-                total_groups += groups
-            
-            active = sum(1 for acc in accounts if acc.get('is_forwarding'))
-            
-            success_rate = 0.0
-            if (total_sent + total_failed) > 0:
-                success_rate = (total_sent / (total_sent + total_failed)) * 100
+                pass
 
-            text = (
-                "<b>📈 Analytics</b>\n\n"
-                f"<b>Total Accounts:</b> <code>{len(accounts)}</code>\n"
-                f"<b>Active Accounts:</b> <code>{active}</code>\n"
-                f"<b>Total Groups:</b> <code>{total_groups}</code>\n\n"
-                f"<b>Messages Sent:</b> <code>{total_sent}</code>\n"
-                f"<b>Messages Failed:</b> <code>{total_failed}</code>\n"
-                f"<b>Success Rate:</b> <code>{success_rate:.1f}%</code>\n"
-                f"<b>Auto Replies:</b> <code>{total_auto_replies}</code>"
+            # Send payment interface with plan details
+            await main_bot.send_file(
+                uid,
+                qr_file,
+                caption=upi_payment_text(pay_id, plan, random_user_id),
+                buttons=upi_payment_keyboard(pay_id)
             )
 
-            await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"enter_dashboard")]])
-            return
-        
-        if data == "menu_interval":
-            user = get_user(uid)
-            current = user.get('interval_preset', 'medium')
-            
-            if current == 'custom' and user.get('custom_interval'):
-                custom = user['custom_interval']
-                text = (
-                    "⏱️ Interval Settings\n\n"
-                    "Current: Custom\n\n"
-                    f"Group Delay: {custom['group_delay']}s\n"
-                    f"Message Delay: {custom['msg_delay']}s\n"
-                    f"Round Delay: {custom['round_delay']}s"
-                )
-            else:
-                preset = INTERVAL_PRESETS.get(current, INTERVAL_PRESETS['medium'])
-                text = (
-                    "⏱️ Interval Settings\n\n"
-                    f"Current: {preset['name']}\n\n"
-                    f"Group Delay: {preset['group_delay']}s\n"
-                    f"Message Delay: {preset['msg_delay']}s\n"
-                    f"Round Delay: {preset['round_delay']}s"
-                )
-            
-            await event.edit(text, buttons=interval_menu_keyboard(uid))
-            return
-        
-        if data.startswith("interval_") and not data == "interval_upgrade" and not data == "interval_custom":
-            preset_key = data.replace("interval_", "")
-            if preset_key in INTERVAL_PRESETS:
-                users_col.update_one({'user_id': uid}, {'$set': {'interval_preset': preset_key}})
-                preset = INTERVAL_PRESETS[preset_key]
-                await event.answer(f"Interval set to: {preset['name']}", alert=True)
-                
-                text = (
-                    "⏱️ Interval Settings\n\n"
-                    f"Current: {preset['name']}\n\n"
-                    f"Group Delay: {preset['group_delay']}s\n"
-                    f"Message Delay: {preset['msg_delay']}s\n"
-                    f"Round Delay: {preset['round_delay']}s"
-                )
-                await event.edit(text, buttons=interval_menu_keyboard(uid))
-            return
-        
-        if data == "interval_upgrade":
-            owner_id = CONFIG['owner_id']
-            text = (
-                "<b>⏱️ Custom Interval</b>\n\n"
-                "<blockquote>This feature is not available for Free tier.</blockquote>\n\n"
-                "<i>Upgrade to Premium to set custom intervals.</i>"
-            )
-            await event.edit(text, parse_mode='html', buttons=[
-                [Button.inline("Upgrade to Premium", b"go_premium")],
-                [Button.inline("Back", b"menu_interval")]
-            ])
-            return
-        
-        if data == "interval_custom":
-            if not is_premium(uid):
-                await event.answer("Premium only!", alert=True)
-                return
-            user_states[uid] = {'action': 'custom_interval', 'step': 'group_delay'}
-            await event.edit(
-                "⏱️ Custom Interval\n\nEnter group delay in seconds (30-300):",
-                buttons=[[Button.inline("← Back", b"menu_interval")]]
-            )
-            return
-        
-        if data == "menu_topics":
-            accounts = get_user_accounts(uid)
-            if not accounts:
-                await event.answer("Add an account first!", alert=True)
-                return
-            
-            tier_settings = get_user_tier_settings(uid)
-            max_topics = tier_settings.get('max_topics', 3)
-            
-            text = (
-                "<b>🏷️ Topics</b>\n\n"
-                "<blockquote>Select a topic to add group links.</blockquote>\n\n"
-                f"<b>Available topics:</b> <code>{max_topics}/{len(TOPICS)}</code>"
-            )
-            if not is_premium(uid):
-                text += "\n\n<i>Upgrade to Premium for all topics.</i>"
-            
-            buttons = []
-            for i, topic in enumerate(TOPICS[:max_topics]):
-                count = 0
-                for acc in accounts:
-                    count += account_topics_col.count_documents({'account_id': acc['_id'], 'topic': topic})
-                buttons.append([Button.inline(f"{topic.title()} ({count} groups)", f"topic_select_{topic}")])
-            
-            if not is_premium(uid) and len(TOPICS) > max_topics:
-                buttons.append([Button.inline("Unlock More Topics", b"go_premium")])
-            
-            buttons.append([Button.inline("Back", b"enter_dashboard")])
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("topic_select_"):
-            topic = data.replace("topic_select_", "")
-            accounts = get_user_accounts(uid)
-            
-            tier_settings = get_user_tier_settings(uid)
-            max_groups = tier_settings.get('max_groups_per_topic', 10)
-            
-            if len(accounts) == 1:
-                acc = accounts[0]
-                groups = list(account_topics_col.find({'account_id': acc['_id'], 'topic': topic}))
-                
-                text = (
-                    f"<b>{_h(topic.title())}</b>\n\n"
-                    f"<b>Groups:</b> <code>{len(groups)}/{max_groups}</code>\n\n"
-                    "<b>Send topic link to add:</b>\n"
-                    "<code>https://t.me/groupname/5</code>"
-                )
-                buttons = [[Button.inline("View Groups", f"view_topic_groups_{topic}_{acc['_id']}")]] if groups else []
-                buttons.append([Button.inline("Back", b"menu_topics")])
-                msg = await event.edit(text, parse_mode='html', buttons=buttons)
-                user_states[uid] = {'action': 'add_topic_link', 'topic': topic, 'account_id': acc['_id'], 'last_msg_id': msg.id if hasattr(msg, 'id') else event.message_id}
-            else:
-                text = f"<b>{_h(topic.title())}</b>\n\n<i>Select account to add groups:</i>"
-                buttons = []
-                for acc in accounts:
-                    phone = acc['phone'][-4:]
-                    name = acc.get('name', 'Unknown')[:12]
-                    count = account_topics_col.count_documents({'account_id': acc['_id'], 'topic': topic})
-                    buttons.append([Button.inline(f"{phone} - {name} ({count})", f"topic_acc_{topic}_{acc['_id']}")])
-                buttons.append([Button.inline("Back", b"menu_topics")])
-                await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("topic_acc_"):
-            parts = data.replace("topic_acc_", "").split("_", 1)
-            topic = parts[0]
-            acc_id = parts[1] if len(parts) > 1 else ""
-            
-            tier_settings = get_user_tier_settings(uid)
-            max_groups = tier_settings.get('max_groups_per_topic', 10)
-            groups = list(account_topics_col.find({'account_id': acc_id, 'topic': topic}))
-            
-            text = (
-                f"<b>🏷️ {topic.title()}</b>\n\n"
-                f"<b>Groups:</b> <code>{len(groups)}/{max_groups}</code>\n\n"
-                "<i>Send a topic link to add.</i>\n"
-                "<code>Example: https://t.me/groupname/5</code>"
-            )
-            buttons = [[Button.inline("👁️ View Groups", f"view_topic_groups_{topic}_{acc_id}")]] if groups else []
-            buttons.append([Button.inline("← Back", f"topic_select_{topic}")])
-            msg = await event.edit(text, parse_mode='html', buttons=buttons)
-            user_states[uid] = {'action': 'add_topic_link', 'topic': topic, 'account_id': acc_id, 'last_msg_id': msg.id if hasattr(msg, 'id') else event.message_id}
-            return
-        
-        if data.startswith("view_topic_groups_"):
-            parts = data.replace("view_topic_groups_", "").split("_", 1)
-            topic = parts[0]
-            acc_id = parts[1] if len(parts) > 1 else ""
-            
-            groups = list(account_topics_col.find({'account_id': acc_id, 'topic': topic}))
-            total = len(groups)
-            display_limit = 5
-            
-            text = f"<b>🏷️ {topic.title()} Groups</b> <code>({total} total)</code>\n\n"
-            for i, g in enumerate(groups[:display_limit]):
-                title = g.get('title', g.get('url', 'Unknown'))[:25]
-                text += f"{i+1}. {title}\n"
-            
-            if total > display_limit:
-                text += f"\n...and {total - display_limit} more groups"
-            
-            buttons = [
-                [Button.inline("Clear All", f"clear_topic_{topic}_{acc_id}")],
-                [Button.inline("Back", f"topic_select_{topic}")]
-            ]
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("clear_topic_"):
-            parts = data.replace("clear_topic_", "").split("_", 1)
-            topic = parts[0]
-            acc_id = parts[1] if len(parts) > 1 else ""
-            
-            account_topics_col.delete_many({'account_id': acc_id, 'topic': topic})
-            await event.answer(f"Cleared all {topic} groups!", alert=True)
-            await event.edit(
-                f"<b>🏷️ {topic.title()}</b>\n\n<b>Groups:</b> <code>0</code>\n\n<i>Send a group link to add.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back", b"menu_topics")]]
-            )
-            return
-        
-        if data == "menu_settings":
-            text = "<b>⚙️ Settings</b>\n\n<i>Configure bot features and preferences.</i>"
-            await event.edit(text, parse_mode='html', buttons=settings_menu_keyboard(uid))
-            return
-        if data == "menu_autoreply":
-            tier = "Premium" if is_premium(uid) else "Free"
-            text = f"<b>💬 Auto Reply</b>\n\n<b>Tier:</b> <code>{tier}</code>\n\n"
-            
-            if is_premium(uid):
-                user = get_user(uid)
-                enabled = user.get('autoreply_enabled', True)
-                
-                # Check if user has set a custom message
-                accounts = get_user_accounts(uid)
-                has_custom = False
-                if accounts:
-                    for acc in accounts:
-                        settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
-                        if settings_doc and 'auto_reply' in settings_doc and settings_doc.get('auto_reply'):
-                            has_custom = True
-                            break
-                
-                text += f"<b>Status:</b> <code>{'ON' if enabled else 'OFF'}</code>\n"
-                text += f"<b>Custom Reply:</b> {'✅' if has_custom else '❌'} <code>{'Set' if has_custom else 'Not Set'}</code>"
-            else:
-                text += "🔒 <b>Auto-reply is a premium feature.</b>\n\n"
-                text += "Upgrade to premium to set custom auto-reply messages!"
-            
-            await event.edit(text, parse_mode='html', buttons=autoreply_menu_keyboard(uid))
-            return
-        
-        if data == "autoreply_view":
-            if not is_premium(uid):
-                await event.answer("Premium only!", alert=True)
-                return
-            
-            # Get custom message from account settings
-            accounts = get_user_accounts(uid)
-            reply = None
-            if accounts:
-                for acc in accounts:
-                    settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
-                    if settings_doc and 'auto_reply' in settings_doc:
-                        reply = settings_doc.get('auto_reply')
-                        break
-            
-            if reply:
-                text = f"<b>💬 Current Auto Reply</b>\n\n<blockquote>{_h(reply)}</blockquote>"
-            else:
-                text = "<b>💬 Current Auto Reply</b>\n\n<i>No custom message set yet.</i>"
-            
-            await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"menu_autoreply")]])
-            return
-
-        if data == "autoreply_toggle":
-            if not is_premium(uid):
-                await event.answer("Premium feature only", alert=True)
-                return
-
-            # Flip the flag and refresh menu
-            user = get_user(uid)
-            enabled = user.get('autoreply_enabled', True)
-            new_value = not enabled
-            users_col.update_one({'user_id': int(uid)}, {'$set': {'autoreply_enabled': new_value}})
-
-            try:
-                await event.answer(f"Auto Reply {'enabled' if new_value else 'disabled'}", alert=False)
-            except Exception:
-                pass
-
-            # Re-render menu
-            tier = "Premium"
-            user = get_user(uid)
-            text = f"<b>💬 Auto Reply</b>\n\n<b>Tier:</b> <code>{tier}</code>\n\n"
-            enabled = user.get('autoreply_enabled', True)
-            
-            # Check if user has set a custom message
-            accounts = get_user_accounts(uid)
-            has_custom = False
-            if accounts:
-                for acc in accounts:
-                    settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
-                    if settings_doc and 'auto_reply' in settings_doc and settings_doc.get('auto_reply'):
-                        has_custom = True
-                        break
-            
-            text += f"<b>Status:</b> <code>{'ON' if enabled else 'OFF'}</code>\n"
-            text += f"<b>Custom Reply:</b> {'✅' if has_custom else '❌'} <code>{'Set' if has_custom else 'Not Set'}</code>"
-            await event.edit(text, parse_mode='html', buttons=autoreply_menu_keyboard(uid))
-            return
-        
-        if data == "autoreply_custom":
-            if not is_premium(uid):
-                await event.answer("Premium only!", alert=True)
-                return
-            user_states[uid] = {'action': 'custom_autoreply'}
-            await event.edit(
-                "<b>💬 Set Custom Reply</b>\n\nSend your custom auto-reply message:",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back", b"menu_autoreply")]]
-            )
-            return
-        
-        if data == "go_premium":
-            # Show plan selection menu for everyone
-            plan_msg = (
-                "**Choose Your Plan:**\n\n"
-                "• Scout - Free starter plan\n"
-                "• Grow - Scale your campaigns (₹69)\n"
-                "• Prime - Advanced automation (₹199)\n"
-                "• Dominion - Enterprise level (₹389)"
-            )
-            
-            if PLAN_IMAGE_URL:
-                try:
-                    await event.delete()
-                except:
-                    pass
-                await main_bot.send_file(uid, PLAN_IMAGE_URL, caption=plan_msg, buttons=plan_select_keyboard(uid))
-            else:
-                await event.edit(plan_msg, buttons=plan_select_keyboard(uid))
-            return
-        
-        if data.startswith("buy_"):
-            plan = data.replace("buy_", "")
-            prices = {"1month": "$20", "3months": "$50", "6months": "$70"}
-            price = prices.get(plan, "$20")
-            
-            owner_id = CONFIG['owner_id']
-            try:
-                await main_bot.send_message(owner_id, f"**Premium Purchase Request**\n\nUser ID: `{uid}`\nPlan: {plan}\nPrice: {price}")
-            except:
-                pass
-            
-            await event.edit(
-                f"**Request Sent!**\n\nPlan: {plan}\nPrice: {price}\n\nAdmin has been notified.\nThey will contact you shortly.\n\nYour User ID: `{uid}`",
-                buttons=[[Button.inline("Back", b"go_premium")]]
-            )
-            return
-        
-        if data == "account_limit_reached":
-            await event.edit(
-                "**Account Limit Reached**\n\nYou've reached the maximum accounts for your tier.\n\nUpgrade to Premium for more accounts!",
-                buttons=[
-                    [Button.inline("Buy Premium", b"go_premium")],
-                    [Button.inline("Back", b"menu_account")]
-                ]
-            )
-            return
-        
-        if data == "menu_logs":
-            # Logs are now free for everyone
-            logger_bot_username = CONFIG.get('logger_bot_username', 'logstesthubot')
-            logger_link = f"https://t.me/{logger_bot_username}"
-            
-            await event.edit(
-                "<b>📝 Logs Configuration</b>\n\n"
-                "<blockquote>Logs are sent via Logger Bot with View Message buttons.\n\n"
-                "To receive logs:\n"
-                "1. Start the Logger Bot\n"
-                "2. Click button below\n"
-                "3. Enable logs for your accounts</blockquote>\n\n"
-                "<i>Logs include forwarding activity with direct message links.</i>",
-                parse_mode='html',
-                buttons=[
-                    [Button.url("Start Logger Bot", logger_link)],
-                    [Button.inline("Configure Logs", b"logs_config")],
-                    [Button.inline("Back", b"enter_dashboard")]
-                ]
-            )
-            return
-        
-        if data == "logs_config":
-            # Show old logs configuration for accounts
-            
-            accounts = get_user_accounts(uid)
-            if not accounts:
-                await event.answer("Add an account first!", alert=True)
-                return
-            
-            if len(accounts) == 1:
-                acc = accounts[0]
-                account_id = str(acc['_id'])
-                settings = get_account_settings(account_id)
-                logs_chat = settings.get('logs_chat_id')
-
-                if logs_chat:
-                    text = (
-                        "**Logs Configuration**\n\n"
-                        f"Status: Enabled\nDM Target: `{logs_chat}`\n\n"
-                        "Logs will be sent directly in your DM with View Message links."
-                    )
-                    buttons = [
-                        [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
-                        [Button.inline("Back", b"enter_dashboard")]
-                    ]
-                else:
-                    text = (
-                        "**Logs Configuration**\n\n"
-                        "Status: Disabled\n\n"
-                        "Enable logs to receive them directly in DM."
-                    )
-                    buttons = [
-                        [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
-                        [Button.inline("Back", b"enter_dashboard")]
-                    ]
-
-                await event.edit(text, parse_mode='html', buttons=buttons)
-            else:
-                text = "<b>Logs Configuration</b>\n\n<i>Select account to configure logs:</i>"
-                buttons = []
-                for acc in accounts:
-                    phone = acc['phone'][-4:]
-                    name = acc.get('name', 'Unknown')[:12]
-                    settings = get_account_settings(str(acc['_id']))
-                    status_icon = "Connected" if settings.get('logs_chat_id') else "Setup"
-                    buttons.append([Button.inline(f"{phone} - {name} ({status_icon})", f"logs_acc_{acc['_id']}")])
-                buttons.append([Button.inline("Back", b"enter_dashboard")])
-                await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("logs_acc_"):
-            account_id = data.replace("logs_acc_", "")
+        else:
+            await event.answer("Payment gateway error! Try again.", alert=True)
 
-            settings = get_account_settings(account_id)
-            logs_chat = settings.get('logs_chat_id')
-
-            if logs_chat:
-                status = f"Enabled (DM to you: `{logs_chat}`)"
-                text = (
-                    "**Logs Configuration**\n\n"
-                    f"Status: {status}\n\n"
-                    "Logs will be sent **directly in your DM** with View Message links."
-                )
-                buttons = [
-                    [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
-                    [Button.inline("Back", b"menu_logs")]
-                ]
-            else:
-                status = "Disabled"
-                text = (
-                    "**Logs Configuration**\n\n"
-                    f"Status: {status}\n\n"
-                    "Click below to enable logs in your DM."
-                )
-                buttons = [
-                    [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
-                    [Button.inline("Back", b"menu_logs")]
-                ]
-
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("enablelogs_"):
-            account_id = data.replace("enablelogs_", "")
-            
-            # Logs are now free for everyone - Send logs directly to this user's DM
-            update_account_settings(account_id, {'logs_chat_id': int(uid)})
-            await event.answer("DM logs enabled!", alert=True)
-            await event.edit(
-                "<b>✅ Logs Enabled</b>\n\n<i>You will now receive logs directly in DM.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back", f"acc_{account_id}")]]
-            )
-            return
+        return
 
-        if data == "menu_fwd_mode":
-            user = get_user(uid)
-            current = user.get('forwarding_mode', 'topics')
-            modes = {
-                'topics': 'Forward to Topics Only',
-                'auto': 'Forward to Auto Groups Only',
-                'both': 'Forward to Both (Topics first, then Auto)'
-            }
-            
-            text = (
-                "<b>📤 Forwarding Mode</b>\n\n"
-                "<blockquote>Select how ads should be forwarded.</blockquote>\n\n"
-                f"<b>Current:</b> <code>{modes.get(current, 'Topics Only')}</code>"
-            )
-            
-            buttons = []
-            for mode, label in modes.items():
-                mark = " (Current)" if mode == current else ""
-                buttons.append([Button.inline(f"{label}{mark}", f"set_fwd_mode_{mode}")])
-            buttons.append([Button.inline("← Back", b"enter_dashboard")])
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("set_fwd_mode_"):
-            mode = data.replace("set_fwd_mode_", "")
-            users_col.update_one({'user_id': uid}, {'$set': {'forwarding_mode': mode}})
-            modes = {
-                'topics': 'Forward to Topics Only',
-                'auto': 'Forward to Auto Groups Only',
-                'both': 'Forward to Both (Topics first, then Auto)'
-            }
-            await event.answer(f"Mode set: {modes.get(mode, mode)}", alert=True)
-            
-            text = (
-                "<b>📤 Forwarding Mode</b>\n\n"
-                "<blockquote>Select how ads should be forwarded.</blockquote>\n\n"
-                f"<b>Current:</b> <code>{modes.get(mode, 'Topics Only')}</code>"
-            )
-            
-            buttons = []
-            for m, label in modes.items():
-                mark = " (Current)" if m == mode else ""
-                buttons.append([Button.inline(f"{label}{mark}", f"set_fwd_mode_{m}")])
-            buttons.append([Button.inline("← Back", b"enter_dashboard")])
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "menu_refresh":
-            accounts = get_user_accounts(uid)
-            total_groups = 0
-            for acc in accounts:
-                try:
-                    session = cipher_suite.decrypt(acc['session'].encode()).decode()
-                    client = TelegramClient(StringSession(session), CONFIG['api_id'], CONFIG['api_hash'])
-                    await client.connect()
-                    count = await fetch_groups_for_account(client, acc['_id'])
-                    total_groups += count
-                    await client.disconnect()
-                except:
-                    pass
-            await event.answer(f"Refreshed! Found {total_groups} groups.", alert=True)
-            
-            text = render_dashboard_text(uid)
-            buttons = main_dashboard_keyboard(uid)
-            # Admin button removed (already in main_dashboard_keyboard)
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "start_all_ads":
-            # Update all added accounts profile (last name + bio) when starting ads
-            try:
-                await apply_account_profile_templates(uid)
-            except Exception:
-                pass
+    # Crypto placeholder
+    else:
+        payment_info = (
+            f"₿ **Crypto Payment - {plan['name']}**\n\n"
+            f"Amount: **{plan['price_display']}**\n\n"
+            f"Contact admin for crypto payment."
+        )
 
-            accounts = get_user_accounts(uid)
-            if not accounts:
-                await event.answer("No accounts to start!", alert=True)
-                return
-            
-            user = get_user(uid)
-            fwd_mode = user.get('forwarding_mode', 'topics')
-            
-            started = 0
-            for acc in accounts:
-                acc_id = str(acc['_id'])
-                is_fwd = acc.get('is_forwarding', False)
-                
-                print(f"[ADS DEBUG] Account {acc_id}: is_forwarding={is_fwd}, fwd_mode={fwd_mode}")
-                
-                if not is_fwd:
-                    has_groups = False
-                    if fwd_mode in ('topics', 'both'):
-                        topic_count = account_topics_col.count_documents({'account_id': {'$in': _account_id_variants(acc['_id'])}})
-                        print(f"[ADS DEBUG] Topics count: {topic_count}")
-                        has_groups = topic_count > 0
-                    if fwd_mode in ('auto', 'both') and not has_groups:
-                        auto_count = account_auto_groups_col.count_documents({'account_id': {'$in': _account_id_variants(acc['_id'])}})
-                        print(f"[ADS DEBUG] Auto groups count: {auto_count}")
-                        has_groups = auto_count > 0
-                    
-                    print(f"[ADS DEBUG] has_groups={has_groups}")
-                    
-                    if has_groups:
-                        accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': True}})
-                        
-                        if acc['_id'] not in forwarding_tasks or forwarding_tasks[acc['_id']].done():
-                            task = asyncio.create_task(run_forwarding_loop(uid, acc['_id']))
-                            forwarding_tasks[acc['_id']] = task
-                            print(f"[ADS] Started forwarding task for account {acc['_id']}")
-                        
-                        started += 1
-                else:
-                    print(f"[ADS DEBUG] Account {acc_id} already forwarding, skipped")
-            
-            print(f"[ADS] Started {started} accounts for user {uid}")
-            await event.answer(f"Started {started} accounts!", alert=True)
-            
-            text = render_dashboard_text(uid)
-            buttons = main_dashboard_keyboard(uid)
-            # Admin button removed (already in main_dashboard_keyboard)
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "stop_all_ads":
-            accounts = get_user_accounts(uid)
-            stopped = 0
-            for acc in accounts:
-                if acc.get('is_forwarding'):
-                    accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': False}})
-                    if acc['_id'] in forwarding_tasks:
-                        forwarding_tasks[acc['_id']].cancel()
-                        del forwarding_tasks[acc['_id']]
-                    stopped += 1
-            await event.answer(f"Stopped {stopped} accounts!", alert=True)
-            
-            text = render_dashboard_text(uid)
-            buttons = main_dashboard_keyboard(uid)
-            # Admin button removed (already in main_dashboard_keyboard)
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "tier_free":
-            if not is_approved(uid):
-                approve_user(uid)
-            
-            accounts = get_user_accounts(uid)
-            max_acc = get_user_max_accounts(uid)
-            tier_settings = get_user_tier_settings(uid)
-            tier = "Premium" if is_premium(uid) else "Free"
-            active = sum(1 for a in accounts if a.get('is_forwarding'))
-            
-            text = (
-                f"<b>{tier} Dashboard</b>\n\n"
-                f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n"
-                f"<b>Active:</b> <code>{active}</code> | <b>Inactive:</b> <code>{len(accounts) - active}</code>\n\n"
-                f"<b>Delays:</b> <code>{tier_settings['msg_delay']}s/{tier_settings['group_delay']}s/{tier_settings['round_delay']}s</code>"
-            )
+        await event.edit(
+            payment_info,
+            buttons=[
+                [Button.url("Contact Admin", MESSAGES['support_link'])],
+                [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Home", b"back_start")]
+            ]
+        )
+        return
 
-            await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid))
-            return
-        
-        if data == "tier_premium":
-            if is_premium(uid):
-                await event.edit(
-                    "**Premium Active**\n\nYou already have premium access!",
-                    buttons=[[Button.inline("Go to Dashboard", b"tier_free")], [Button.inline("Back", b"enter_dashboard")]]
-                )
-            else:
-                await event.edit(
-                    f"**Premium Access**\n\n{MESSAGES['premium_contact']}",
-                    buttons=premium_contact_keyboard()
-                )
-            return
-        
-        if data == "admin_panel" or data == "back_admin":
-            if not is_admin(uid):
-                await event.answer("Admin only!", alert=True)
-                return
-            
-            total_users = users_col.count_documents({})
-            premium_users = users_col.count_documents({'tier': 'premium'})
-            total_accounts = accounts_col.count_documents({})
-            active = accounts_col.count_documents({'is_forwarding': True})
-            total_admins = admins_col.count_documents({}) + 1
-            
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            new_today = users_col.count_documents({'created_at': {'$gte': today_start}})
-            
-            text = (
-                "<b>👑 Admin Panel</b>\n\n"
-                f"<b>Total Users:</b> <code>{total_users}</code> <i>(+{new_today} today)</i>\n"
-                f"<b>Premium Users:</b> <code>{premium_users}</code>\n"
-                f"<b>Total Admins:</b> <code>{total_admins}</code>\n\n"
-                f"<b>Total Accounts:</b> <code>{total_accounts}</code>\n"
-                f"<b>Active Forwarding:</b> <code>{active}</code>\n\n"
-                "<i>Use buttons below to manage bot.</i>"
-            )
-            
-            await event.edit(text, parse_mode='html', buttons=admin_panel_keyboard())
-            return
-        
-        if data == "admin_all_users":
-            if not is_admin(uid):
-                return
 
-            page = 0
-            per_page = 5
-            users = list(users_col.find().sort('created_at', -1).skip(page*per_page).limit(per_page))
-            total = users_col.count_documents({})
-            total_pages = max(1, (total + per_page - 1) // per_page)
+@callback_route(prefix="plan_")
+async def cb_plan(event, uid, data, payload):
+    plan_name = payload
 
-            text = f"<b>👥 All Users</b> <code>({total} total, page {page+1}/{total_pages})</code>\n\n"
-            user_list = []
-            buttons = []
-            
-            for u in users:
-                user_id = u['user_id']
-                username = u.get('username')
-                
-                # Try to fetch username from Telegram if not in database
-                if not username:
-                    username = await get_username_from_id(event.client, user_id)
-                    if username:
-                        # Update database with fetched username
-                        users_col.update_one({'user_id': user_id}, {'$set': {'username': username}})
-                
-                # Add to display list
-                if username:
-                    user_list.append(f"@{username}")
-                    label = f"View @{username}"
-                else:
-                    user_list.append(f"<code>{user_id}</code>")
-                    label = f"View {user_id}"
-                
-                buttons.append([Button.inline(label, f"admin_user_detail_all_{user_id}")])
-            
-            text += "\n".join(user_list) if users else "<i>No users found.</i>"
-            nav = []
-            if page > 0:
-                nav.append(Button.inline("<", f"admin_all_users_page_{page-1}"))
-            if (page+1)*per_page < total:
-                nav.append(Button.inline(">", f"admin_all_users_page_{page+1}"))
-            if nav:
-                buttons.append(nav)
-
-            buttons.append([Button.inline("← Back", b"admin_panel")])
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("admin_all_users_page_"):
-            if not is_admin(uid):
-                return
+    plan = PLANS.get(plan_name)
+    if not plan:
+        await event.answer("Invalid plan!", alert=True)
+        return
 
-            page = int(data.replace("admin_all_users_page_", ""))
-            per_page = 5
-            users = list(users_col.find().sort('created_at', -1).skip(page*per_page).limit(per_page))
-            total = users_col.count_documents({})
-            total_pages = max(1, (total + per_page - 1) // per_page)
+    # Show plan details with tagline + Buy Now button
+    detail_text = (
+        f"<b>{plan['emoji']} {plan['name']} Plan</b>\n\n"
+        f"<i>{plan['tagline']}</i>\n\n"
+        f"<blockquote><b>Plan Features:</b>\n\n"
+        f"💼 <b>Accounts:</b> {plan['max_accounts']}\n"
+        f"📂 <b>Topics:</b> {plan['max_topics']}\n"
+        f"👥 <b>Groups per Topic:</b> {plan['max_groups_per_topic']}\n\n"
+        f"⏱️ <b>Delays:</b>\n"
+        f"  • Message: {plan['msg_delay']}s\n"
+        f"  • Group: {plan['group_delay']}s\n"
+        f"  • Round: {plan['round_delay']}s\n\n"
+        f"✨ <b>Features:</b>\n"
+        f"  • Auto Reply: {'Yes' if plan['auto_reply_enabled'] else 'No'}\n"
+        f"  • Logs: {'Yes' if plan['logs_enabled'] else 'No'}</blockquote>\n\n"
+    )
 
-            text = f"<b>👥 All Users</b> <code>({total} total, page {page+1}/{total_pages})</code>\n\n"
-            user_list = []
-            buttons = []
-            
-            for u in users:
-                user_id = u['user_id']
-                username = u.get('username')
-                
-                # Try to fetch username from Telegram if not in database
-                if not username:
-                    username = await get_username_from_id(event.client, user_id)
-                    if username:
-                        # Update database with fetched username
-                        users_col.update_one({'user_id': user_id}, {'$set': {'username': username}})
-                
-                # Add to display list
-                if username:
-                    user_list.append(f"@{username}")
-                    label = f"View @{username}"
-                else:
-                    user_list.append(f"<code>{user_id}</code>")
-                    label = f"View {user_id}"
-                
-                buttons.append([Button.inline(label, f"admin_user_detail_all_{user_id}")])
-            
-            text += "\n".join(user_list) if users else "<i>No users found.</i>"
-            nav = []
-            if page > 0:
-                nav.append(Button.inline("<", f"admin_all_users_page_{page-1}"))
-            if (page+1)*per_page < total:
-                nav.append(Button.inline(">", f"admin_all_users_page_{page+1}"))
-            if nav:
-                buttons.append(nav)
-
-            buttons.append([Button.inline("← Back", b"admin_panel")])
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("admin_user_detail_all_"):
-            if not is_admin(uid):
-                return
+    if plan_name == "scout":
+        # Free plan - Show "Activate Free" or "Active" button
+        user = get_user(uid)
+        is_scout_active = user.get('approved') and user.get('tier') == 'free'
 
-            target_id = int(data.replace("admin_user_detail_all_", ""))
-            user_detail_source = 'all'
+        detail_text += f"<b>Price: FREE</b>"
 
-        elif data.startswith("admin_user_detail_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_user_detail_", ""))
-            user_detail_source = 'premium'
-        
-        # Common user detail display logic for both handlers
-        if data.startswith("admin_user_detail_all_") or data.startswith("admin_user_detail_"):
-            user = users_col.find_one({'user_id': target_id})
-            
-            if not user:
-                await event.answer("User not found!", alert=True)
-                return
-            
-            tier = user.get('tier', 'free')
-            max_acc = user.get('max_accounts', 1)
-            approved = user.get('approved', False)
-            accounts = list(accounts_col.find({'owner_id': target_id}))
-            active = sum(1 for a in accounts if a.get('is_forwarding'))
-            
-            created_at = user.get('created_at')
-            created_str = created_at.strftime('%Y-%m-%d %H:%M') if hasattr(created_at, 'strftime') else str(created_at)
-            
-            # Show plan name and expiry instead of tier
-            if is_admin(target_id):
-                plan_display = "Admin"
-                expiry_display = "999d"
-            elif tier == 'premium':
-                plan_name = user.get('plan_name', 'Premium')
-                expires_at = user.get('premium_expires_at')
-                if expires_at and isinstance(expires_at, datetime):
-                    remaining = expires_at - datetime.now()
-                    if remaining.total_seconds() > 0:
-                        expiry_display = f"{remaining.days}d"
-                    else:
-                        expiry_display = "Expired"
-                else:
-                    expiry_display = "∞"
-                plan_display = plan_name
-            else:
-                plan_display = "Scout: Free"
-                expiry_display = "∞"
-            
-            text = (
-                f"<b>👤 User Profile</b>\n\n"
-                f"<b>ID:</b> <code>{target_id}</code>\n"
-                f"<b>Plan:</b> <code>{plan_display}</code>\n"
-                f"<b>Expiry:</b> <code>{expiry_display}</code>\n"
-                f"<b>Approved:</b> {'✅' if approved else '❌'}\n"
-                f"<b>Max Accounts:</b> <code>{max_acc}</code>\n"
-                f"<b>Accounts:</b> <code>{len(accounts)}</code> <i>(active: {active})</i>\n"
-                f"<b>Created:</b> <code>{created_str}</code>"
-            )
-            
-            buttons = []
-            if tier != 'premium':
-                buttons.append([Button.inline("✅ Grant Premium", f"admin_grant_premium_{target_id}")])
-            else:
-                buttons.append([Button.inline("❌ Revoke Premium", f"admin_revoke_premium_{target_id}")])
-            
-            # Back button routing based on source list
-            if user_detail_source == 'all':
-                back_callback = b"admin_all_users"
-            else:
-                back_callback = b"admin_premium"
-            buttons.append([Button.inline("← Back", back_callback)])
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("admin_grant_premium_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_grant_premium_", ""))
-            
-            # Show plan selection screen
-            text = (
-                f"<b>🎯 Select Plan for User {target_id}</b>\n\n"
-                f"<i>Choose a plan to grant (30 days):</i>\n\n"
-                f"<b>🔰 Scout:</b> Free Plan (1 account)\n"
-                f"<b>📈 Grow:</b> 3 accounts, medium speed\n"
-                f"<b>⭐ Prime:</b> 7 accounts, fast speed\n"
-                f"<b>👑 Dominion:</b> 15 accounts, fastest speed"
-            )
-            
+        if is_scout_active:
             buttons = [
-                [Button.inline("🔰 Scout", f"admin_grant_scout_{target_id}")],
-                [Button.inline("📈 Grow", f"admin_grant_grow_{target_id}")],
-                [Button.inline("⭐ Prime", f"admin_grant_prime_{target_id}")],
-                [Button.inline("👑 Dominion", f"admin_grant_dominion_{target_id}")],
-                [Button.inline("← Back", f"admin_user_detail_{target_id}")]
+                [Button.inline("✓ Active Plan", b"enter_dashboard")],
+                [Button.inline("← Back to Plans", b"back_plans")]
             ]
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        # Handle individual plan grants
-        if data.startswith("admin_grant_scout_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_grant_scout_", ""))
-            plan = PLANS['scout']
-            days = 30
-            expires_at = datetime.now() + timedelta(days=days)
-            
-            users_col.update_one(
-                {'user_id': target_id},
-                {'$set': {
-                    'tier': 'free',
-                    'plan_name': plan['name'],
-                    'max_accounts': plan['max_accounts'],
-                    'approved': True
-                }},
-                upsert=True
-            )
-            
-            # Send notification to user
-            welcome_image = MESSAGES.get('welcome_image', '')
-            notify_text = (
-                "<b>🎉 Plan Activated!</b>\n\n"
-                "<b>Plan:</b> Scout\n"
-                "<b>Accounts:</b> 1\n"
-                "<b>Validity:</b> 30 days\n\n"
-                "<i>Your plan features are now active!</i>"
-            )
-            notify_buttons = [
-                [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+        else:
+            buttons = [
+                [Button.inline("✅ Activate Free Plan", b"activate_scout")],
+                [Button.inline("← Back to Plans", b"back_plans")]
             ]
-            
-            try:
-                if welcome_image:
-                    await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
-                else:
-                    await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
-            except Exception:
-                pass
-            
-            await event.answer("✅ Scout plan granted!", alert=True)
-            await event.edit(
-                f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Scout plan access.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
-            )
-            return
-        
-        if data.startswith("admin_grant_grow_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_grant_grow_", ""))
-            plan = PLANS['grow']
-            days = 30
-            expires_at = datetime.now() + timedelta(days=days)
-            
-            users_col.update_one(
-                {'user_id': target_id},
-                {'$set': {
-                    'tier': 'premium',
-                    'plan_name': plan['name'],
-                    'max_accounts': plan['max_accounts'],
-                    'premium_expires_at': expires_at,
-                    'approved': True
-                }},
-                upsert=True
-            )
-            
-            # Send notification to user
-            welcome_image = MESSAGES.get('welcome_image', '')
-            notify_text = (
-                "<b>🎉 Plan Activated!</b>\n\n"
-                "<b>Plan:</b> Grow\n"
-                "<b>Accounts:</b> 3\n"
-                "<b>Validity:</b> 30 days\n\n"
-                "<i>Your premium features are now active!</i>"
-            )
-            notify_buttons = [
-                [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+    else:
+        # Paid plans - Check if user already has this plan
+        user = get_user(uid)
+        user_plan_name = user.get('plan_name', '').lower()
+        is_active_plan = user_plan_name == plan_name
+
+        detail_text += f"<b>Price: {plan['price_display']}</b>"
+
+        if is_active_plan:
+            # User already has this plan - show Active
+            buttons = [
+                [Button.inline("✓ Active Plan", b"enter_dashboard")],
+                [Button.inline("← Back to Plans", b"back_plans")]
             ]
-            
-            try:
-                if welcome_image:
-                    await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
-                else:
-                    await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
-            except Exception:
-                pass
-            
-            await event.answer("✅ Grow plan granted!", alert=True)
-            await event.edit(
-                f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Grow plan access.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
-            )
-            return
-        
-        if data.startswith("admin_grant_prime_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_grant_prime_", ""))
-            plan = PLANS['prime']
-            days = 30
-            expires_at = datetime.now() + timedelta(days=days)
-            
-            users_col.update_one(
-                {'user_id': target_id},
-                {'$set': {
-                    'tier': 'premium',
-                    'plan_name': plan['name'],
-                    'max_accounts': plan['max_accounts'],
-                    'premium_expires_at': expires_at,
-                    'approved': True
-                }},
-                upsert=True
-            )
-            
-            # Send notification to user
-            welcome_image = MESSAGES.get('welcome_image', '')
-            notify_text = (
-                "<b>🎉 Plan Activated!</b>\n\n"
-                "<b>Plan:</b> Prime\n"
-                "<b>Accounts:</b> 7\n"
-                "<b>Validity:</b> 30 days\n\n"
-                "<i>Your premium features are now active!</i>"
-            )
-            notify_buttons = [
-                [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+        else:
+            # Show Buy Now button
+            buttons = [
+                [Button.inline(f"💳 Buy Now - {plan['price_display']}", f"buy_{plan_name}")],
+                [Button.inline("← Back to Plans", b"back_plans")]
             ]
-            
-            try:
-                if welcome_image:
-                    await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
-                else:
-                    await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
-            except Exception:
+
+    await event.edit(detail_text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(exact="activate_scout")
+async def cb_activate_scout(event, uid, data, payload):
+    # Activate Scout (free) plan
+    approve_user(uid)
+    await event.answer("Scout plan activated!", alert=True)
+
+    # Redirect to dashboard
+    await event.edit(render_dashboard_text(uid), parse_mode='html', buttons=main_dashboard_keyboard(uid))
+
+
+@callback_route(prefix="buy_")
+async def cb_buy(event, uid, data, payload):
+    # Buy paid plan - redirect to payment method selection
+    plan_name = payload
+    plan = PLANS[plan_name]
+
+    await event.edit(
+        f"<b>💳 {plan['name']} Plan - {plan['price_display']}</b>\n\n"
+        f"<b>Choose Payment Method:</b>",
+        parse_mode='html',
+        buttons=[
+            [Button.inline("📱 UPI", f"payment_upi_{plan_name}")],
+            [Button.inline("₿ Crypto", f"payment_crypto_{plan_name}")],
+            [Button.inline("← Back to Plans", b"back_plans"), Button.inline("🏠 Dashboard", b"enter_dashboard")]
+        ]
+    )
+
+
+@callback_route(exact="adsye_now")
+async def cb_adsye_now(event, uid, data, payload):
+    # Acknowledge immediately to avoid Telegram's loading animation
+    try:
+        await event.answer(cache_time=0)
+    except Exception:
+        pass
+
+    # NEW FLOW: Show plan selection (not account add)
+    plan_msg = render_plan_select_text()
+
+    if PLAN_IMAGE_URL:
+        try:
+            await event.delete()
+        except:
+            pass
+        await main_bot.send_file(
+            uid,
+            PLAN_IMAGE_URL,
+            caption=plan_msg,
+            parse_mode='html',
+            buttons=plan_select_keyboard(uid)
+        )
+    else:
+        await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
+
+
+@callback_route(prefix="bcast_cancel_", admin=True)
+async def cb_bcast_cancel(event, uid, data, payload):
+    from bson.objectid import ObjectId
+    try:
+        job_id = ObjectId(data[len("bcast_cancel_"):])
+    except Exception:
+        return
+    if cancel_broadcast(job_id):
+        await event.answer("Cancelling broadcast...")
+    else:
+        await event.answer("Broadcast already finished.", alert=True)
+
+
+@callback_route(exact="admin_users", admin=True)
+async def cb_admin_users(event, uid, data, payload):
+    # System stats (CPU/RAM/Disk) + platform stats
+    sample = latest_system_sample()
+
+    total_users = users_col.count_documents({})
+    premium_users = users_col.count_documents({'tier': 'premium'})
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    new_today = users_col.count_documents({'created_at': {'$gte': today_start}}) if users_col.find_one({}, {'created_at': 1}) else 0
+    banned_users = 0  # Placeholder for banned users feature
+
+    # Premium by plan (counts)
+    grow_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^grow$', '$options': 'i'}})
+    prime_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^prime$', '$options': 'i'}})
+    dominion_count = users_col.count_documents({'tier': 'premium', 'plan_name': {'$regex': '^dominion$', '$options': 'i'}})
+
+    # Accounts
+    total_accounts = accounts_col.count_documents({})
+    active_broadcasts = accounts_col.count_documents({'is_forwarding': True})
+
+    # Messaging stats
+    total_ads_sent = sum(stat.get('total_sent', 0) for stat in account_stats_col.find({}, {'total_sent': 1}))
+    # Auto replies counter (stored in db, incremented when auto-reply is sent)
+    auto_replies = sum(stat.get('auto_replies', 0) for stat in account_stats_col.find({}, {'auto_replies': 1}))
+    target_groups = account_topics_col.count_documents({}) + account_auto_groups_col.count_documents({})
+
+    # Topics
+    total_topics = account_topics_col.count_documents({})
+    active_topics = len(set(t['topic'] for t in account_topics_col.find({}, {'topic': 1})))
+    failed_topics = account_failed_groups_col.count_documents({})
+
+    text = (
+        f"<b>🖥️ SYSTEM STATS</b>\n\n"
+        f"<b>CPU:</b> <code>{sample['cpu']:.0f}%</code>\n"
+        f"<b>RAM:</b> <code>{sample['ram_percent']:.0f}%</code> <i>({sample['ram_used']//(1024**3)}GB/{sample['ram_total']//(1024**3)}GB)</i>\n"
+        f"<b>DISK:</b> <code>{sample['disk_percent']:.0f}%</code> <i>({sample['disk_used']//(1024**3)}GB/{sample['disk_total']//(1024**3)}GB)</i>\n\n"
+        f"<b>👥 USERS:</b>\n"
+        f"<code>├ Total: {total_users}\n"
+        f"├ Subscribers: {premium_users}\n"
+        f"├ New Today: {new_today}\n"
+        f"└ Banned: {banned_users}</code>\n\n"
+        f"<b>✦ PREMIUM BY PLAN:</b>\n"
+        f"<code>├ Grow: {grow_count}\n"
+        f"├ Prime: {prime_count}\n"
+        f"└ Dominion: {dominion_count}</code>\n\n"
+        f"<b>📱 ACCOUNTS:</b>\n"
+        f"<code>├ Total: {total_accounts}\n"
+        f"└ Active Broadcasts: {active_broadcasts}</code>\n\n"
+        f"<b>💬 MESSAGING:</b>\n"
+        f"<code>├ Total Ads Sent: {total_ads_sent}\n"
+        f"├ Auto-Replies: {auto_replies}\n"
+        f"└ Target Groups: {target_groups}</code>\n\n"
+        f"<b>📂 TOPICS:</b>\n"
+        f"<code>├ Total: {total_topics}\n"
+        f"├ Active: {active_topics}\n"
+        f"└ Failed: {failed_topics}</code>"
+    )
+
+    await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"back_admin")]])
+
+
+@callback_route(exact="admin_admins", admin=True)
+async def cb_admin_admins(event, uid, data, payload):
+    admins = list(admins_col.find())
+    text = f"**Admins List**\n\nOwner: `{CONFIG['owner_id']}`\n\n"
+    for a in admins:
+        text += f"`{a['user_id']}`\n"
+
+    await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
+
+
+@callback_route(exact="admin_stats", admin=True)
+async def cb_admin_stats(event, uid, data, payload):
+    sample = latest_system_sample()
+
+    text = (
+        f"**System Stats**\n\n"
+        f"CPU: {sample['cpu']}%\n"
+        f"RAM: {sample['ram_percent']}% ({sample['ram_used'] // (1024**3)}GB / {sample['ram_total'] // (1024**3)}GB)\n"
+        f"Disk: {sample['disk_percent']}% ({sample['disk_used'] // (1024**3)}GB / {sample['disk_total'] // (1024**3)}GB)\n"
+    )
+
+    await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
+
+
+@callback_route(exact="admin_controls", admin=True)
+async def cb_admin_controls(event, uid, data, payload):
+    text = "**Bot Controls**\n\nUse commands:\n/ping - System stats\n/blocking - Event loop stalls\n/reboot - Restart bot"
+    await event.edit(text, buttons=[[Button.inline("🏠 Back", b"back_admin")]])
+
+
+@callback_route(prefix="addprm_", admin=True)
+async def cb_addprm(event, uid, data, payload):
+    state = user_states.get(uid, {})
+    target_uid = state.get('target_uid')
+
+    if not target_uid:
+        await event.answer("Session expired!", alert=True)
+        return
+
+    if data == "addprm_cancel":
+        del user_states[uid]
+        await event.edit("Cancelled.")
+        return
+
+    # Extract plan name
+    plan_name = payload
+    plan = PLANS.get(plan_name)
+
+    if not plan:
+        await event.answer("Invalid plan!", alert=True)
+        return
+
+    # Grant premium with plan name
+    plan_name = plan_id.replace('plan_', '').capitalize()
+    set_user_premium(target_uid, plan['max_accounts'], plan_name)
+
+    # Notify target user
+    try:
+        await main_bot.send_message(
+            target_uid,
+            f"**Premium Activated**\n\n"
+            f"Plan: {plan['name']}\n"
+            f"Accounts: {plan['max_accounts']}\n\n"
+            f"Your premium plan has been activated by admin!\n"
+            f"Enjoy all features."
+        )
+    except:
+        pass
+
+    # Confirm to admin
+    del user_states[uid]
+    await event.edit(
+        f"**Premium Granted**\n\n"
+        f"User: `{target_uid}`\n"
+        f"Plan: {plan['name']}\n"
+        f"Accounts: {plan['max_accounts']}\n\n"
+        f"User has been notified."
+    )
+
+
+@callback_route(exact="noop")
+async def cb_noop(event, uid, data, payload):
+    await event.answer("Account limit reached!")
+
+
+@callback_route(exact="back_plans")
+async def cb_back_plans(event, uid, data, payload):
+    # Return to plan selection screen
+    plan_msg = (
+        "<b>💎 Choose Your Plan</b>\n\n"
+        "<blockquote>Select a plan that fits your advertising needs.\n"
+        "You can upgrade anytime.</blockquote>"
+    )
+
+    if PLAN_IMAGE_URL:
+        # Edit caption/text only (media edit is tricky); just edit message text
+        await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
+    else:
+        await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
+
+
+@callback_route(exact="back_start")
+async def cb_back_start(event, uid, data, payload):
+    # If force-join is enabled and user isn't joined, show lock screen
+    if not await enforce_forcejoin_or_prompt(event, edit=True):
+        return
+
+    # Check if user has accounts
+    accounts = get_user_accounts(uid)
+
+    if len(accounts) > 0:
+        # User has accounts, show plan selection
+        plan_msg = (
+            "**💎 Choose Your Plan to Continue:**\n\n"
+            "• Scout - Free starter plan\n"
+            "• Grow - Scale your campaigns (₹69)\n"
+            "• Prime - Advanced automation (₹199)\n"
+            "• Dominion - Enterprise level (₹389)"
+        )
+
+        if PLAN_IMAGE_URL:
+            try:
+                await event.delete()
+            except:
                 pass
-            
-            await event.answer("✅ Prime plan granted!", alert=True)
-            await event.edit(
-                f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Prime plan access.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
-            )
-            return
-        
-        if data.startswith("admin_grant_dominion_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_grant_dominion_", ""))
-            plan = PLANS['dominion']
-            days = 30
-            expires_at = datetime.now() + timedelta(days=days)
-            
-            users_col.update_one(
-                {'user_id': target_id},
-                {'$set': {
-                    'tier': 'premium',
-                    'plan_name': plan['name'],
-                    'max_accounts': plan['max_accounts'],
-                    'premium_expires_at': expires_at,
-                    'approved': True
-                }},
-                upsert=True
+            await main_bot.send_file(uid, PLAN_IMAGE_URL, caption=plan_msg, buttons=plan_select_keyboard(uid))
+        else:
+            await event.edit(plan_msg, parse_mode='html', buttons=plan_select_keyboard(uid))
+    else:
+        # No accounts, show welcome screen
+        await event.edit(render_welcome_text(), parse_mode='html', buttons=new_welcome_keyboard())
+
+
+@callback_route(exact="enter_dashboard")
+async def cb_enter_dashboard(event, uid, data, payload):
+    # Force-join gate (extra safety)
+    if not await enforce_forcejoin_or_prompt(event, edit=True):
+        return
+
+    if not is_approved(uid):
+        approve_user(uid)
+
+    # Update account profiles when dashboard loads
+    try:
+        await apply_account_profile_templates(uid)
+    except Exception:
+        pass
+
+    text = render_dashboard_text(uid)
+
+    buttons = main_dashboard_keyboard(uid)
+    # Admin button removed (already in main_dashboard_keyboard)
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(exact="menu_account")
+async def cb_menu_account(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    max_acc = get_user_max_accounts(uid)
+    text = (
+        f"<b>👤 Account Management</b>\n\n"
+        f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n\n"
+        f"<i>Select an account below or add a new one.</i>"
+    )
+    await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid))
+
+
+@callback_route(prefix="accpage_", parse=int)
+async def cb_accpage(event, uid, data, payload):
+    page = payload
+    accounts = get_user_accounts(uid)
+    max_acc = get_user_max_accounts(uid)
+    text = (
+        f"<b>👤 Account Management</b>\n\n"
+        f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n\n"
+        f"<i>Page:</i> <code>{page+1}</code>"
+    )
+    await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid, page))
+
+
+@callback_route(exact="add_account")
+async def cb_add_account(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    max_accounts = get_user_max_accounts(uid)
+    if len(accounts) >= max_accounts:
+        await event.answer(f"Account limit reached ({max_accounts})!", alert=True)
+        return
+    await end_login(uid)
+    user_states[uid] = new_login_state(action='phone')
+    await event.edit("**Add Account**\n\nSend phone number with country code:\n\nExample: `+919876543210`", buttons=[[Button.inline("Cancel", b"menu_account")]])
+
+
+@callback_route(exact="delete_account_menu")
+async def cb_delete_account_menu(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    if not accounts:
+        await event.answer("No accounts to delete!", alert=True)
+        return
+    await event.edit("**Delete Account**\n\nSelect account to delete:", buttons=delete_account_list_keyboard(uid))
+
+
+@callback_route(prefix="confirm_del_")
+async def cb_confirm_del(event, uid, data, payload):
+    acc_id = payload
+    from bson.objectid import ObjectId
+    try:
+        acc = accounts_col.find_one({'_id': ObjectId(acc_id), 'user_id': uid})
+    except:
+        acc = accounts_col.find_one({'_id': acc_id, 'user_id': uid})
+    if acc:
+        phone = acc['phone']
+        await event.edit(
+            f"**Confirm Delete**\n\nAre you sure you want to delete account:\n`{phone}`?",
+            buttons=[
+                [Button.inline("Yes, Delete", f"final_del_{acc_id}"), Button.inline("No, Cancel", b"delete_account_menu")]
+            ]
+        )
+
+
+@callback_route(prefix="final_del_")
+async def cb_final_del(event, uid, data, payload):
+    acc_id = payload
+    from bson.objectid import ObjectId
+    try:
+        acc = accounts_col.find_one({'_id': ObjectId(acc_id), 'user_id': uid})
+    except:
+        acc = accounts_col.find_one({'_id': acc_id, 'user_id': uid})
+    if acc:
+        real_id = acc['_id']
+        if real_id in forwarding_tasks:
+            forwarding_tasks[real_id].cancel()
+            del forwarding_tasks[real_id]
+        accounts_col.delete_one({'_id': real_id})
+        account_topics_col.delete_many({'account_id': real_id})
+        account_settings_col.delete_many({'account_id': real_id})
+        account_auto_groups_col.delete_many({'account_id': real_id})
+        forget_target_health(real_id)
+        await event.answer("Account deleted!", alert=True)
+    await event.edit(
+        "<b>👤 Account Management</b>",
+        parse_mode='html',
+        buttons=account_list_keyboard(uid)
+    )
+
+
+@callback_route(exact="menu_analytics")
+async def cb_menu_analytics(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    account_ids = [str(acc['_id']) for acc in accounts]
+    total_sent = 0
+    total_failed = 0
+    total_auto_replies = 0
+
+    for stats in account_stats_col.find({'account_id': {'$in': account_ids}}):
+        total_sent += stats.get('total_sent', 0)
+        total_failed += stats.get('total_failed', 0)
+        total_auto_replies += stats.get('auto_replies', 0)
+    total_groups = account_auto_groups_col.count_documents({'account_id': {'$in': account_ids}})
+
+    active = sum(1 for acc in accounts if acc.get('is_forwarding'))
+
+    success_rate = 0.0
+    if (total_sent + total_failed) > 0:
+        success_rate = (total_sent / (total_sent + total_failed)) * 100
+
+    now = datetime.now()
+    day = delivery_totals(uid, now - timedelta(hours=24))
+    week = delivery_totals(uid, now - timedelta(days=7))
+    best, worst = group_leaderboard(uid, now - timedelta(days=7))
+
+    def window(label, t):
+        attempts = t['sent'] + t['failed']
+        rate = f"{t['sent'] / attempts * 100:.0f}%" if attempts else "-"
+        return (
+            f"<b>{label}:</b> <code>{t['sent']} sent · {t['failed']} failed · {rate}</code>\n"
+            f"<code>  flood waits {t['flood_wait_s'] // 60}m · blocked {t['permanent_fail']} · replies {t['auto_replies']}</code>\n"
+        )
+
+    def groups(rows):
+        return "".join(
+            f"<code>• {_h((r.get('title') or r['_id']['group_key'])[:24])} — {r['sent']}/{r['attempts']} ({r['rate'] * 100:.0f}%)</code>\n"
+            for r in rows
+        ) or "<code>• not enough data yet</code>\n"
+
+    text = (
+        "<b>📈 Analytics</b>\n\n"
+        f"<b>Total Accounts:</b> <code>{len(accounts)}</code>\n"
+        f"<b>Active Accounts:</b> <code>{active}</code>\n"
+        f"<b>Total Groups:</b> <code>{total_groups}</code>\n\n"
+        + window("Last 24h", day)
+        + window("Last 7d", week)
+        + "\n<b>🏆 Best groups (7d)</b>\n" + groups(best)
+        + "\n<b>⚠️ Worst groups (7d)</b>\n" + groups(worst)
+        + "\n<b>All time</b>\n"
+        f"<b>Messages Sent:</b> <code>{total_sent}</code>\n"
+        f"<b>Messages Failed:</b> <code>{total_failed}</code>\n"
+        f"<b>Success Rate:</b> <code>{success_rate:.1f}%</code>\n"
+        f"<b>Auto Replies:</b> <code>{total_auto_replies}</code>"
+    )
+
+    await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"enter_dashboard")]])
+
+
+@callback_route(exact="menu_interval")
+async def cb_menu_interval(event, uid, data, payload):
+    user = get_user(uid)
+    current = user.get('interval_preset', 'medium')
+
+    if current == 'custom' and user.get('custom_interval'):
+        custom = user['custom_interval']
+        text = (
+            "⏱️ Interval Settings\n\n"
+            "Current: Custom\n\n"
+            f"Group Delay: {custom['group_delay']}s\n"
+            f"Message Delay: {custom['msg_delay']}s\n"
+            f"Round Delay: {custom['round_delay']}s"
+        )
+    else:
+        preset = INTERVAL_PRESETS.get(current, INTERVAL_PRESETS['medium'])
+        text = (
+            "⏱️ Interval Settings\n\n"
+            f"Current: {preset['name']}\n\n"
+            f"Group Delay: {preset['group_delay']}s\n"
+            f"Message Delay: {preset['msg_delay']}s\n"
+            f"Round Delay: {preset['round_delay']}s"
+        )
+
+    await event.edit(text, buttons=interval_menu_keyboard(uid))
+
+
+@callback_route(prefix="interval_")
+async def cb_interval(event, uid, data, payload):
+    preset_key = payload
+    if preset_key in INTERVAL_PRESETS:
+        users_col.update_one({'user_id': uid}, {'$set': {'interval_preset': preset_key}})
+        preset = INTERVAL_PRESETS[preset_key]
+        await event.answer(f"Interval set to: {preset['name']}", alert=True)
+
+        text = (
+            "⏱️ Interval Settings\n\n"
+            f"Current: {preset['name']}\n\n"
+            f"Group Delay: {preset['group_delay']}s\n"
+            f"Message Delay: {preset['msg_delay']}s\n"
+            f"Round Delay: {preset['round_delay']}s"
+        )
+        await event.edit(text, buttons=interval_menu_keyboard(uid))
+
+
+@callback_route(exact="interval_upgrade")
+async def cb_interval_upgrade(event, uid, data, payload):
+    owner_id = CONFIG['owner_id']
+    text = (
+        "<b>⏱️ Custom Interval</b>\n\n"
+        "<blockquote>This feature is not available for Free tier.</blockquote>\n\n"
+        "<i>Upgrade to Premium to set custom intervals.</i>"
+    )
+    await event.edit(text, parse_mode='html', buttons=[
+        [Button.inline("Upgrade to Premium", b"go_premium")],
+        [Button.inline("Back", b"menu_interval")]
+    ])
+
+
+@callback_route(exact="interval_custom", premium=True)
+async def cb_interval_custom(event, uid, data, payload):
+    user_states[uid] = {'action': 'custom_interval', 'step': 'group_delay'}
+    await event.edit(
+        "⏱️ Custom Interval\n\nEnter group delay in seconds (30-300):",
+        buttons=[[Button.inline("← Back", b"menu_interval")]]
+    )
+
+
+@callback_route(exact="menu_topics")
+async def cb_menu_topics(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    if not accounts:
+        await event.answer("Add an account first!", alert=True)
+        return
+
+    tier_settings = get_user_tier_settings(uid)
+    max_topics = tier_settings.get('max_topics', 3)
+
+    text = (
+        "<b>🏷️ Topics</b>\n\n"
+        "<blockquote>Select a topic to add group links.</blockquote>\n\n"
+        f"<b>Available topics:</b> <code>{max_topics}/{len(TOPICS)}</code>"
+    )
+    if not is_premium(uid):
+        text += "\n\n<i>Upgrade to Premium for all topics.</i>"
+
+    buttons = []
+    for i, topic in enumerate(TOPICS[:max_topics]):
+        count = 0
+        for acc in accounts:
+            count += account_topics_col.count_documents({'account_id': acc['_id'], 'topic': topic})
+        buttons.append([Button.inline(f"{topic.title()} ({count} groups)", f"topic_select_{topic}")])
+
+    if not is_premium(uid) and len(TOPICS) > max_topics:
+        buttons.append([Button.inline("Unlock More Topics", b"go_premium")])
+
+    buttons.append([Button.inline("Back", b"enter_dashboard")])
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="topic_select_")
+async def cb_topic_select(event, uid, data, payload):
+    topic = payload
+    accounts = get_user_accounts(uid)
+
+    tier_settings = get_user_tier_settings(uid)
+    max_groups = tier_settings.get('max_groups_per_topic', 10)
+
+    if len(accounts) == 1:
+        acc = accounts[0]
+        groups = list(account_topics_col.find({'account_id': acc['_id'], 'topic': topic}))
+
+        text = (
+            f"<b>{_h(topic.title())}</b>\n\n"
+            f"<b>Groups:</b> <code>{len(groups)}/{max_groups}</code>\n\n"
+            "<b>Send topic link to add:</b>\n"
+            "<code>https://t.me/groupname/5</code>"
+        )
+        buttons = [[Button.inline("View Groups", f"view_topic_groups_{topic}_{acc['_id']}")]] if groups else []
+        buttons.append([Button.inline("Back", b"menu_topics")])
+        msg = await event.edit(text, parse_mode='html', buttons=buttons)
+        user_states[uid] = {'action': 'add_topic_link', 'topic': topic, 'account_id': acc['_id'], 'last_msg_id': msg.id if hasattr(msg, 'id') else event.message_id}
+    else:
+        text = f"<b>{_h(topic.title())}</b>\n\n<i>Select account to add groups:</i>"
+        buttons = []
+        for acc in accounts:
+            phone = acc['phone'][-4:]
+            name = acc.get('name', 'Unknown')[:12]
+            count = account_topics_col.count_documents({'account_id': acc['_id'], 'topic': topic})
+            buttons.append([Button.inline(f"{phone} - {name} ({count})", f"topic_acc_{topic}_{acc['_id']}")])
+        buttons.append([Button.inline("Back", b"menu_topics")])
+        await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="topic_acc_")
+async def cb_topic_acc(event, uid, data, payload):
+    parts = payload.split("_", 1)
+    topic = parts[0]
+    acc_id = parts[1] if len(parts) > 1 else ""
+
+    tier_settings = get_user_tier_settings(uid)
+    max_groups = tier_settings.get('max_groups_per_topic', 10)
+    groups = list(account_topics_col.find({'account_id': acc_id, 'topic': topic}))
+
+    text = (
+        f"<b>🏷️ {topic.title()}</b>\n\n"
+        f"<b>Groups:</b> <code>{len(groups)}/{max_groups}</code>\n\n"
+        "<i>Send a topic link to add.</i>\n"
+        "<code>Example: https://t.me/groupname/5</code>"
+    )
+    buttons = [[Button.inline("👁️ View Groups", f"view_topic_groups_{topic}_{acc_id}")]] if groups else []
+    buttons.append([Button.inline("← Back", f"topic_select_{topic}")])
+    msg = await event.edit(text, parse_mode='html', buttons=buttons)
+    user_states[uid] = {'action': 'add_topic_link', 'topic': topic, 'account_id': acc_id, 'last_msg_id': msg.id if hasattr(msg, 'id') else event.message_id}
+
+
+@callback_route(prefix="view_topic_groups_")
+async def cb_view_topic_groups(event, uid, data, payload):
+    parts = payload.split("_", 1)
+    topic = parts[0]
+    acc_id = parts[1] if len(parts) > 1 else ""
+
+    groups = list(account_topics_col.find({'account_id': acc_id, 'topic': topic}))
+    total = len(groups)
+    display_limit = 5
+
+    text = f"<b>🏷️ {topic.title()} Groups</b> <code>({total} total)</code>\n\n"
+    for i, g in enumerate(groups[:display_limit]):
+        title = g.get('title', g.get('url', 'Unknown'))[:25]
+        text += f"{i+1}. {title}\n"
+
+    if total > display_limit:
+        text += f"\n...and {total - display_limit} more groups"
+
+    buttons = [
+        [Button.inline("Clear All", f"clear_topic_{topic}_{acc_id}")],
+        [Button.inline("Back", f"topic_select_{topic}")]
+    ]
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="clear_topic_")
+async def cb_clear_topic(event, uid, data, payload):
+    parts = payload.split("_", 1)
+    topic = parts[0]
+    acc_id = parts[1] if len(parts) > 1 else ""
+
+    account_topics_col.delete_many({'account_id': acc_id, 'topic': topic})
+    await event.answer(f"Cleared all {topic} groups!", alert=True)
+    await event.edit(
+        f"<b>🏷️ {topic.title()}</b>\n\n<b>Groups:</b> <code>0</code>\n\n<i>Send a group link to add.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back", b"menu_topics")]]
+    )
+
+
+@callback_route(exact="menu_settings")
+async def cb_menu_settings(event, uid, data, payload):
+    text = "<b>⚙️ Settings</b>\n\n<i>Configure bot features and preferences.</i>"
+    await event.edit(text, parse_mode='html', buttons=settings_menu_keyboard(uid))
+
+
+@callback_route(exact="menu_autoreply")
+async def cb_menu_autoreply(event, uid, data, payload):
+    tier = "Premium" if is_premium(uid) else "Free"
+    text = f"<b>💬 Auto Reply</b>\n\n<b>Tier:</b> <code>{tier}</code>\n\n"
+
+    if is_premium(uid):
+        user = get_user(uid)
+        enabled = user.get('autoreply_enabled', True)
+
+        # Check if user has set a custom message
+        accounts = get_user_accounts(uid)
+        has_custom = False
+        if accounts:
+            for acc in accounts:
+                settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
+                if settings_doc and 'auto_reply' in settings_doc and settings_doc.get('auto_reply'):
+                    has_custom = True
+                    break
+
+        text += f"<b>Status:</b> <code>{'ON' if enabled else 'OFF'}</code>\n"
+        text += f"<b>Custom Reply:</b> {'✅' if has_custom else '❌'} <code>{'Set' if has_custom else 'Not Set'}</code>"
+    else:
+        text += "🔒 <b>Auto-reply is a premium feature.</b>\n\n"
+        text += "Upgrade to premium to set custom auto-reply messages!"
+
+    await event.edit(text, parse_mode='html', buttons=autoreply_menu_keyboard(uid))
+
+
+@callback_route(exact="autoreply_view", premium=True)
+async def cb_autoreply_view(event, uid, data, payload):
+    # Get custom message from account settings
+    accounts = get_user_accounts(uid)
+    reply = None
+    if accounts:
+        for acc in accounts:
+            settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
+            if settings_doc and 'auto_reply' in settings_doc:
+                reply = settings_doc.get('auto_reply')
+                break
+
+    if reply:
+        text = f"<b>💬 Current Auto Reply</b>\n\n<blockquote>{_h(reply)}</blockquote>"
+    else:
+        text = "<b>💬 Current Auto Reply</b>\n\n<i>No custom message set yet.</i>"
+
+    await event.edit(text, parse_mode='html', buttons=[[Button.inline("← Back", b"menu_autoreply")]])
+
+
+@callback_route(exact="autoreply_toggle")
+async def cb_autoreply_toggle(event, uid, data, payload):
+    if not is_premium(uid):
+        await event.answer("Premium feature only", alert=True)
+        return
+
+    # Flip the flag and refresh menu
+    user = get_user(uid)
+    enabled = user.get('autoreply_enabled', True)
+    new_value = not enabled
+    users_col.update_one({'user_id': int(uid)}, {'$set': {'autoreply_enabled': new_value}})
+
+    try:
+        await event.answer(f"Auto Reply {'enabled' if new_value else 'disabled'}", alert=False)
+    except Exception:
+        pass
+
+    # Re-render menu
+    tier = "Premium"
+    user = get_user(uid)
+    text = f"<b>💬 Auto Reply</b>\n\n<b>Tier:</b> <code>{tier}</code>\n\n"
+    enabled = user.get('autoreply_enabled', True)
+
+    # Check if user has set a custom message
+    accounts = get_user_accounts(uid)
+    has_custom = False
+    if accounts:
+        for acc in accounts:
+            settings_doc = account_settings_col.find_one({'account_id': str(acc['_id'])})
+            if settings_doc and 'auto_reply' in settings_doc and settings_doc.get('auto_reply'):
+                has_custom = True
+                break
+
+    text += f"<b>Status:</b> <code>{'ON' if enabled else 'OFF'}</code>\n"
+    text += f"<b>Custom Reply:</b> {'✅' if has_custom else '❌'} <code>{'Set' if has_custom else 'Not Set'}</code>"
+    await event.edit(text, parse_mode='html', buttons=autoreply_menu_keyboard(uid))
+
+
+@callback_route(exact="autoreply_custom", premium=True)
+async def cb_autoreply_custom(event, uid, data, payload):
+    user_states[uid] = {'action': 'custom_autoreply'}
+    await event.edit(
+        "<b>💬 Set Custom Reply</b>\n\nSend your custom auto-reply message:",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back", b"menu_autoreply")]]
+    )
+
+
+@callback_route(exact="go_premium")
+async def cb_go_premium(event, uid, data, payload):
+    # Show plan selection menu for everyone
+    plan_msg = (
+        "**Choose Your Plan:**\n\n"
+        "• Scout - Free starter plan\n"
+        "• Grow - Scale your campaigns (₹69)\n"
+        "• Prime - Advanced automation (₹199)\n"
+        "• Dominion - Enterprise level (₹389)"
+    )
+
+    if PLAN_IMAGE_URL:
+        try:
+            await event.delete()
+        except:
+            pass
+        await main_bot.send_file(uid, PLAN_IMAGE_URL, caption=plan_msg, buttons=plan_select_keyboard(uid))
+    else:
+        await event.edit(plan_msg, buttons=plan_select_keyboard(uid))
+
+
+@callback_route(exact="account_limit_reached")
+async def cb_account_limit_reached(event, uid, data, payload):
+    await event.edit(
+        "**Account Limit Reached**\n\nYou've reached the maximum accounts for your tier.\n\nUpgrade to Premium for more accounts!",
+        buttons=[
+            [Button.inline("Buy Premium", b"go_premium")],
+            [Button.inline("Back", b"menu_account")]
+        ]
+    )
+
+
+@callback_route(exact="menu_logs")
+async def cb_menu_logs(event, uid, data, payload):
+    # Logs are now free for everyone
+    logger_bot_username = CONFIG.get('logger_bot_username', 'logstesthubot')
+    logger_link = f"https://t.me/{logger_bot_username}"
+
+    await event.edit(
+        "<b>📝 Logs Configuration</b>\n\n"
+        "<blockquote>Logs are sent via Logger Bot with View Message buttons.\n\n"
+        "To receive logs:\n"
+        "1. Start the Logger Bot\n"
+        "2. Click button below\n"
+        "3. Enable logs for your accounts</blockquote>\n\n"
+        "<i>Logs include forwarding activity with direct message links.</i>",
+        parse_mode='html',
+        buttons=[
+            [Button.url("Start Logger Bot", logger_link)],
+            [Button.inline("Configure Logs", b"logs_config")],
+            [Button.inline("Back", b"enter_dashboard")]
+        ]
+    )
+
+
+@callback_route(exact="logs_config")
+async def cb_logs_config(event, uid, data, payload):
+    # Show old logs configuration for accounts
+
+    accounts = get_user_accounts(uid)
+    if not accounts:
+        await event.answer("Add an account first!", alert=True)
+        return
+
+    if len(accounts) == 1:
+        acc = accounts[0]
+        account_id = str(acc['_id'])
+        settings = get_account_settings(account_id)
+        logs_chat = settings.get('logs_chat_id')
+
+        if logs_chat:
+            text = (
+                "**Logs Configuration**\n\n"
+                f"Status: Enabled\nDM Target: `{logs_chat}`\n\n"
+                "Logs will be sent directly in your DM with View Message links."
             )
-            
-            # Send notification to user
-            welcome_image = MESSAGES.get('welcome_image', '')
-            notify_text = (
-                "<b>🎉 Plan Activated!</b>\n\n"
-                "<b>Plan:</b> Dominion\n"
-                "<b>Accounts:</b> 15\n"
-                "<b>Validity:</b> 30 days\n\n"
-                "<i>Your premium features are now active!</i>"
+            buttons = [
+                [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
+                [Button.inline("Back", b"enter_dashboard")]
+            ]
+        else:
+            text = (
+                "**Logs Configuration**\n\n"
+                "Status: Disabled\n\n"
+                "Enable logs to receive them directly in DM."
             )
-            notify_buttons = [
-                [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+            buttons = [
+                [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
+                [Button.inline("Back", b"enter_dashboard")]
             ]
-            
+
+        await event.edit(text, parse_mode='html', buttons=buttons)
+    else:
+        text = "<b>Logs Configuration</b>\n\n<i>Select account to configure logs:</i>"
+        buttons = []
+        for acc in accounts:
+            phone = acc['phone'][-4:]
+            name = acc.get('name', 'Unknown')[:12]
+            settings = get_account_settings(str(acc['_id']))
+            status_icon = "Connected" if settings.get('logs_chat_id') else "Setup"
+            buttons.append([Button.inline(f"{phone} - {name} ({status_icon})", f"logs_acc_{acc['_id']}")])
+        buttons.append([Button.inline("Back", b"enter_dashboard")])
+        await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="logs_acc_")
+async def cb_logs_acc(event, uid, data, payload):
+    account_id = payload
+
+    settings = get_account_settings(account_id)
+    logs_chat = settings.get('logs_chat_id')
+
+    if logs_chat:
+        status = f"Enabled (DM to you: `{logs_chat}`)"
+        text = (
+            "**Logs Configuration**\n\n"
+            f"Status: {status}\n\n"
+            "Logs will be sent **directly in your DM** with View Message links."
+        )
+        buttons = [
+            [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
+            [Button.inline("Back", b"menu_logs")]
+        ]
+    else:
+        status = "Disabled"
+        text = (
+            "**Logs Configuration**\n\n"
+            f"Status: {status}\n\n"
+            "Click below to enable logs in your DM."
+        )
+        buttons = [
+            [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
+            [Button.inline("Back", b"menu_logs")]
+        ]
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="enablelogs_")
+async def cb_enablelogs(event, uid, data, payload):
+    account_id = payload
+
+    # Logs are now free for everyone - Send logs directly to this user's DM
+    update_account_settings(account_id, {'logs_chat_id': int(uid)})
+    await event.answer("DM logs enabled!", alert=True)
+    await event.edit(
+        "<b>✅ Logs Enabled</b>\n\n<i>You will now receive logs directly in DM.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back", f"acc_{account_id}")]]
+    )
+
+
+@callback_route(exact="menu_fwd_mode")
+async def cb_menu_fwd_mode(event, uid, data, payload):
+    user = get_user(uid)
+    current = user.get('forwarding_mode', 'topics')
+    modes = {
+        'topics': 'Forward to Topics Only',
+        'auto': 'Forward to Auto Groups Only',
+        'both': 'Forward to Both (Topics first, then Auto)'
+    }
+
+    text = (
+        "<b>📤 Forwarding Mode</b>\n\n"
+        "<blockquote>Select how ads should be forwarded.</blockquote>\n\n"
+        f"<b>Current:</b> <code>{modes.get(current, 'Topics Only')}</code>"
+    )
+
+    buttons = []
+    for mode, label in modes.items():
+        mark = " (Current)" if mode == current else ""
+        buttons.append([Button.inline(f"{label}{mark}", f"set_fwd_mode_{mode}")])
+    buttons.append([Button.inline("← Back", b"enter_dashboard")])
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="set_fwd_mode_")
+async def cb_set_fwd_mode(event, uid, data, payload):
+    mode = payload
+    users_col.update_one({'user_id': uid}, {'$set': {'forwarding_mode': mode}})
+    modes = {
+        'topics': 'Forward to Topics Only',
+        'auto': 'Forward to Auto Groups Only',
+        'both': 'Forward to Both (Topics first, then Auto)'
+    }
+    await event.answer(f"Mode set: {modes.get(mode, mode)}", alert=True)
+
+    text = (
+        "<b>📤 Forwarding Mode</b>\n\n"
+        "<blockquote>Select how ads should be forwarded.</blockquote>\n\n"
+        f"<b>Current:</b> <code>{modes.get(mode, 'Topics Only')}</code>"
+    )
+
+    buttons = []
+    for m, label in modes.items():
+        mark = " (Current)" if m == mode else ""
+        buttons.append([Button.inline(f"{label}{mark}", f"set_fwd_mode_{m}")])
+    buttons.append([Button.inline("← Back", b"enter_dashboard")])
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(exact="menu_refresh")
+async def cb_menu_refresh(event, uid, data, payload):
+    async def work():
+        total_groups = 0
+        for acc in get_user_accounts(uid):
+            client = await account_client(acc)
             try:
-                if welcome_image:
-                    await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
-                else:
-                    await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
+                await client.connect()
+                if await client.is_user_authorized():
+                    total_groups += await fetch_groups(client, str(acc['_id']), acc.get('phone'))
             except Exception:
                 pass
-            
-            await event.answer("✅ Dominion plan granted!", alert=True)
-            await event.edit(
-                f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Dominion plan access.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
-            )
-            return
-        
-        if data.startswith("admin_revoke_premium_"):
-            if not is_admin(uid):
-                return
-            
-            target_id = int(data.replace("admin_revoke_premium_", ""))
-            users_col.update_one(
-                {'user_id': target_id},
-                {'$set': {'tier': 'free', 'max_accounts': 1}}
-            )
-            await event.answer("❌ Premium revoked!", alert=True)
-            
-            await event.edit(
-                f"<b>❌ Premium Revoked</b>\n\n<i>User {target_id} now has free tier.</i>",
-                parse_mode='html',
-                buttons=[[Button.inline("← Back to Premium Users", b"admin_premium")]]
-            )
-            return
-        
-        if data == "admin_premium":
-            if not is_admin(uid):
-                return
-            
-            users = get_premium_users()
-            text = f"<b>\U0001F451 Premium Users</b> <code>({len(users) if users else 0} total)</code>\n\n"
-            
-            buttons = []
-            if not users:
-                text += "<i>No premium users yet.</i>"
-            else:
-                for u in users[:20]:
-                    user_id = u.get('user_id')
-                    max_acc = u.get('max_accounts', 5)
-                    acc_count = accounts_col.count_documents({'owner_id': user_id})
-                    username = u.get('username')
-                    label_id = f"@{username}" if username else str(user_id)
-                    label = f"\U0001F451 {label_id} ({acc_count}/{max_acc} acc)"
-                    buttons.append([Button.inline(label, f"admin_user_detail_{user_id}")])
-            
-            buttons.append([Button.inline("← Back", b"admin_panel")])
-            
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data == "admin_stats":
-            if not is_admin(uid):
-                return
-            
-            total_sent = 0
-            total_failed = 0
-            total_auto_replies = 0
-            for stat in account_stats_col.find({}):
-                total_sent += stat.get('total_sent', 0)
-                total_failed += stat.get('total_failed', 0)
-                total_auto_replies += stat.get('auto_replies', 0)
-            
-            text = f"**Bot Statistics**\n\n"
-            text += f"Total Messages Sent: {total_sent}\n"
-            text += f"Total Failed: {total_failed}\n"
-            text += f"Success Rate: {(total_sent / max(1, total_sent + total_failed) * 100):.1f}%\n"
-            text += f"Total Auto Replies: {total_auto_replies}"
-            
-            await event.edit(text, buttons=[[Button.inline("Back", b"admin_panel")]])
-            return
-        
-        if data == "admin_broadcast":
-            if not is_admin(uid):
-                return
-            
-            user_states[uid] = {'action': 'broadcast'}
-            await event.respond("Send the message to broadcast to all users:")
-            return
-        
-        if data.startswith("page_"):
-            page = int(data.split("_")[1])
-            accounts = get_user_accounts(uid)
-            max_acc = get_user_max_accounts(uid)
-            tier_settings = get_user_tier_settings(uid)
-            tier = "Premium" if is_premium(uid) else "Free"
-            
-            text = f"**{tier} Dashboard** (Page {page+1})\n\nAccounts: {len(accounts)}/{max_acc}"
-            await event.edit(text, buttons=account_list_keyboard(uid, page))
-            return
-        
-        if data.startswith("acc_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            if not acc:
-                await event.answer("Not found!", alert=True)
-                return
-            
-            # Check if user has per-account config access (Prime/Dominion)
-            if not has_per_account_config_access(uid):
-                await event.answer("Per-account config is a Prime/Dominion feature!", alert=True)
-                await event.edit(
-                    "🔒 **Per-Account Configuration**\n\n"
-                    "This feature allows you to customize settings for each account individually.\n\n"
-                    "Available in:\n"
-                    "• Prime Plan (₹199)\n"
-                    "• Dominion Plan (₹389)\n\n"
-                    "Use main dashboard settings to control all accounts together.",
-                    buttons=[[Button.inline("⬆️ Upgrade Plan", b"go_premium")], [Button.inline("🏠 Dashboard", b"enter_dashboard")]]
-                )
-                return
-            
-            stats = get_account_stats(account_id)
-            settings = get_account_settings(account_id)
-            topics = account_topics_col.count_documents({'account_id': account_id})
-            groups = account_auto_groups_col.count_documents({'account_id': account_id})
-            
-            status = "🟢 Running" if acc.get('is_forwarding') else "🔴 Stopped"
-            
-            text = (
-                f"📱 **Account Details**\n\n"
-                f"Phone: {acc['phone']}\n"
-                f"Name: {acc.get('name', 'Unknown')}\n"
-                f"Status: {status}\n\n"
-                f"📊 **Statistics**\n"
-                f"Topics: {topics}\n"
-                f"Groups: {groups}\n"
-                f"Messages Sent: {stats.get('total_sent', 0)}\n"
-                f"Failed: {stats.get('total_failed', 0)}\n\n"
-                f"⏱️ **Delays**\n"
-                f"Message: {settings.get('msg_delay', 30)}s\n"
-                f"Group: {settings.get('group_delay', 90)}s\n"
-                f"Round: {settings.get('round_delay', 3600)}s"
-            )
-            
-            await event.edit(text, buttons=account_menu_keyboard(account_id, acc, uid))
-            return
-        
-        if data.startswith("topics_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            await event.edit(
-                f"<b> Topics</b>\n<blockquote>Account: <code>{_h(acc['phone'])}</code></blockquote>",
-                parse_mode='html',
-                buttons=topics_menu_keyboard(account_id, uid)
-            )
-            return
-        
-        if data.startswith("topic_"):
-            parts = data.split("_")
-            account_id, topic = parts[1], parts[2]
-            
-            tier_settings = get_user_tier_settings(uid)
-            max_groups = tier_settings.get('max_groups_per_topic', 10)
-            
-            links = list(account_topics_col.find({'account_id': account_id, 'topic': topic}))
-            text = f"**{topic.capitalize()}** ({len(links)}/{max_groups} links)\n\n"
-            
-            for i, l in enumerate(links[:15], 1):
-                text += f"{i}. {l['url']}\n"
-            if len(links) > 15:
-                text += f"...+{len(links)-15} more"
-            
-            if not links:
-                text += "No links yet."
-            
-            await event.edit(text, buttons=[
-                [Button.inline("Add", f"add_{account_id}_{topic}"), Button.inline("Clear", f"clear_{account_id}_{topic}")],
-                [Button.inline("Back", f"topics_{account_id}")]
-            ])
-            return
-        
-        if data.startswith("auto_"):
-            account_id = data.split("_")[1]
-            groups = list(account_auto_groups_col.find({'account_id': account_id}))
-            
-            text = f"**Auto Groups** ({len(groups)})\n\n"
-            for i, g in enumerate(groups[:15], 1):
-                u = f"@{g['username']}" if g.get('username') else "Private"
-                text += f"{i}. {g['title'][:20]} ({u})\n"
-            if len(groups) > 15:
-                text += f"...+{len(groups)-15} more"
-            
-            await event.edit(text, buttons=[[Button.inline("Back", f"topics_{account_id}")]])
-            return
-        
-        if data.startswith("add_"):
-            parts = data.split("_")
-            account_id, topic = parts[1], parts[2]
-            user_states[uid] = {'action': 'add_links', 'account_id': account_id, 'topic': topic}
-            await event.respond(f"Send links for **{topic}** (one per line):")
-            return
-        
-        if data.startswith("clear_"):
-            parts = data.split("_")
-            account_id, topic = parts[1], parts[2]
-            result = account_topics_col.delete_many({'account_id': account_id, 'topic': topic})
-            await event.answer(f"Deleted {result.deleted_count} links!")
-            return
-        
-        if data.startswith("settings_"):
-            account_id = data.split("_")[1]
-            settings = get_account_settings(account_id)
-            
-            text = "**Settings**\n\n"
-            text += f"Message Delay: {settings.get('msg_delay', 30)}s\n"
-            text += f"Group Delay: {settings.get('group_delay', 90)}s (every 10 msgs)\n"
-            text += f"Round Delay: {settings.get('round_delay', 3600)}s\n"
-            
-            tier_settings = get_user_tier_settings(uid)
-            if tier_settings.get('auto_reply_enabled'):
-                text += f"Auto-Reply: {settings.get('auto_reply', 'Default')[:40]}..."
-            
-            failed = account_failed_groups_col.count_documents({'account_id': account_id})
-            text += f"\nFailed Groups: {failed}"
-            
-            await event.edit(text, buttons=settings_keyboard(account_id, uid))
-            return
-        
-        if data.startswith("setmsg_"):
-            account_id = data.split("_")[1]
-            user_states[uid] = {'action': 'set_msg_delay', 'account_id': account_id}
-            await event.respond("Enter message delay (minimum 3 seconds, max 300):")
-            return
-        
-        if data.startswith("setgrp_"):
-            account_id = data.split("_")[1]
-            user_states[uid] = {'action': 'set_grp_delay', 'account_id': account_id}
-            await event.respond("Enter group delay (10-600 seconds):")
-            return
-        
-        if data.startswith("setround_"):
-            account_id = data.split("_")[1]
-            user_states[uid] = {'action': 'set_round_delay', 'account_id': account_id}
-            await event.respond("Enter round delay (minimum 3600 seconds / 1 hour):")
-            return
-        
-        if data.startswith("setreply_"):
-            tier_settings = get_user_tier_settings(uid)
-            if not tier_settings.get('auto_reply_enabled'):
-                await event.answer("Premium feature!", alert=True)
-                return
-            account_id = data.split("_")[1]
-            user_states[uid] = {'action': 'set_reply', 'account_id': account_id}
-            await event.respond("Send new auto-reply message:")
-            return
-        
-        if data.startswith("clearfailed_"):
-            account_id = data.split("_")[1]
-            clear_failed_groups(account_id)
-            await event.answer("Cleared failed groups!")
+            finally:
+                try:
+                    await client.disconnect()
+                except Exception:
+                    pass
+
+        text = f"<b>✅ Refreshed! Found {total_groups} groups.</b>\n\n" + render_dashboard_text(uid)
+        await event.edit(text, parse_mode='html', buttons=main_dashboard_keyboard(uid))
+
+    await answer_then_run(event, uid, work, ack="Refreshing groups...")
+
+
+@callback_route(exact="start_all_ads")
+async def cb_start_all_ads(event, uid, data, payload):
+    if not get_user_accounts(uid):
+        await event.answer("No accounts to start!", alert=True)
+        return
+    await answer_then_run(event, uid, lambda: start_all_ads(uid, event), ack="Starting ads...")
+
+
+async def start_all_ads(uid: int, event):
+    """Apply profile templates, start every idle account with groups, then redraw the dashboard."""
+    # Update all added accounts profile (last name + bio) when starting ads
+    try:
+        await apply_account_profile_templates(uid)
+    except Exception:
+        pass
+
+    accounts = get_user_accounts(uid)
+    user = get_user(uid)
+    fwd_mode = user.get('forwarding_mode', 'topics')
+
+    started = 0
+    for acc in accounts:
+        acc_id = str(acc['_id'])
+        is_fwd = acc.get('is_forwarding', False)
+
+        ads_log.debug("is_forwarding=%s, fwd_mode=%s", is_fwd, fwd_mode, extra={'user_id': uid, 'account_id': acc_id})
+
+        if not is_fwd:
+            has_groups = False
+            if fwd_mode in ('topics', 'both'):
+                topic_count = account_topics_col.count_documents({'account_id': {'$in': _account_id_variants(acc['_id'])}})
+                ads_log.debug("Topics count: %d", topic_count, extra={'user_id': uid, 'account_id': acc_id})
+                has_groups = topic_count > 0
+            if fwd_mode in ('auto', 'both') and not has_groups:
+                auto_count = account_auto_groups_col.count_documents({'account_id': {'$in': _account_id_variants(acc['_id'])}})
+                ads_log.debug("Auto groups count: %d", auto_count, extra={'user_id': uid, 'account_id': acc_id})
+                has_groups = auto_count > 0
+
+            ads_log.debug("has_groups=%s", has_groups, extra={'user_id': uid, 'account_id': acc_id})
+
+            if has_groups:
+                accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': True}})
+
+                if acc['_id'] not in forwarding_tasks or forwarding_tasks[acc['_id']].done():
+                    task = spawn_detached(run_forwarding_loop(uid, acc['_id']))
+                    forwarding_tasks[acc['_id']] = task
+                    ads_log.info("Started forwarding task", extra={'user_id': uid, 'account_id': acc_id})
+
+                started += 1
+        else:
+            ads_log.debug("Already forwarding, skipped", extra={'user_id': uid, 'account_id': acc_id})
+
+    ads_log.info("Started %d accounts", started, extra={'user_id': uid})
+
+    text = f"<b>🚀 Started {started} accounts!</b>\n\n" + render_dashboard_text(uid)
+    await event.edit(text, parse_mode='html', buttons=main_dashboard_keyboard(uid))
+
+
+@callback_route(exact="stop_all_ads")
+async def cb_stop_all_ads(event, uid, data, payload):
+    accounts = get_user_accounts(uid)
+    stopped = 0
+    for acc in accounts:
+        if acc.get('is_forwarding'):
+            accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': False}})
+            if acc['_id'] in forwarding_tasks:
+                forwarding_tasks[acc['_id']].cancel()
+                del forwarding_tasks[acc['_id']]
+            stopped += 1
+    await event.answer(f"Stopped {stopped} accounts!", alert=True)
+
+    text = render_dashboard_text(uid)
+    buttons = main_dashboard_keyboard(uid)
+    # Admin button removed (already in main_dashboard_keyboard)
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(exact="tier_free")
+async def cb_tier_free(event, uid, data, payload):
+    if not is_approved(uid):
+        approve_user(uid)
+
+    accounts = get_user_accounts(uid)
+    max_acc = get_user_max_accounts(uid)
+    tier_settings = get_user_tier_settings(uid)
+    tier = "Premium" if is_premium(uid) else "Free"
+    active = sum(1 for a in accounts if a.get('is_forwarding'))
+
+    text = (
+        f"<b>{tier} Dashboard</b>\n\n"
+        f"<b>Accounts:</b> <code>{len(accounts)}/{max_acc}</code>\n"
+        f"<b>Active:</b> <code>{active}</code> | <b>Inactive:</b> <code>{len(accounts) - active}</code>\n\n"
+        f"<b>Delays:</b> <code>{tier_settings['msg_delay']}s/{tier_settings['group_delay']}s/{tier_settings['round_delay']}s</code>"
+    )
+
+    await event.edit(text, parse_mode='html', buttons=account_list_keyboard(uid))
+
+
+@callback_route(exact="tier_premium")
+async def cb_tier_premium(event, uid, data, payload):
+    if is_premium(uid):
+        await event.edit(
+            "**Premium Active**\n\nYou already have premium access!",
+            buttons=[[Button.inline("Go to Dashboard", b"tier_free")], [Button.inline("Back", b"enter_dashboard")]]
+        )
+    else:
+        await event.edit(
+            f"**Premium Access**\n\n{MESSAGES['premium_contact']}",
+            buttons=premium_contact_keyboard()
+        )
+
+
+@callback_route(exact=("admin_panel", "back_admin"))
+async def cb_admin_panel(event, uid, data, payload):
+    if not is_admin(uid):
+        await event.answer("Admin only!", alert=True)
+        return
+
+    total_users = users_col.count_documents({})
+    premium_users = users_col.count_documents({'tier': 'premium'})
+    total_accounts = accounts_col.count_documents({})
+    active = accounts_col.count_documents({'is_forwarding': True})
+    total_admins = admins_col.count_documents({}) + 1
+
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    new_today = users_col.count_documents({'created_at': {'$gte': today_start}})
+
+    text = (
+        "<b>👑 Admin Panel</b>\n\n"
+        f"<b>Total Users:</b> <code>{total_users}</code> <i>(+{new_today} today)</i>\n"
+        f"<b>Premium Users:</b> <code>{premium_users}</code>\n"
+        f"<b>Total Admins:</b> <code>{total_admins}</code>\n\n"
+        f"<b>Total Accounts:</b> <code>{total_accounts}</code>\n"
+        f"<b>Active Forwarding:</b> <code>{active}</code>\n\n"
+        "<i>Use buttons below to manage bot.</i>"
+    )
+
+    await event.edit(text, parse_mode='html', buttons=admin_panel_keyboard())
+
+
+@callback_route(exact="admin_all_users", admin=True)
+async def cb_admin_all_users(event, uid, data, payload):
+    page = 0
+    per_page = 5
+    users = list(users_col.find({}, USER_LIST_PROJECTION).sort('created_at', -1).skip(page*per_page).limit(per_page))
+    total = users_col.count_documents({})
+    total_pages = max(1, (total + per_page - 1) // per_page)
+
+    text = f"<b>👥 All Users</b> <code>({total} total, page {page+1}/{total_pages})</code>\n\n"
+    user_list = []
+    buttons = []
+
+    for u in users:
+        user_id = u['user_id']
+        username = u.get('username')
+
+        # Try to fetch username from Telegram if not in database
+        if not username:
+            username = await get_username_from_id(event.client, user_id)
+            if username:
+                # Update database with fetched username
+                users_col.update_one({'user_id': user_id}, {'$set': {'username': username}})
+
+        # Add to display list
+        if username:
+            user_list.append(f"@{username}")
+            label = f"View @{username}"
+        else:
+            user_list.append(f"<code>{user_id}</code>")
+            label = f"View {user_id}"
+
+        buttons.append([Button.inline(label, f"admin_user_detail_all_{user_id}")])
+
+    text += "\n".join(user_list) if users else "<i>No users found.</i>"
+    nav = []
+    if page > 0:
+        nav.append(Button.inline("<", f"admin_all_users_page_{page-1}"))
+    if (page+1)*per_page < total:
+        nav.append(Button.inline(">", f"admin_all_users_page_{page+1}"))
+    if nav:
+        buttons.append(nav)
+
+    buttons.append([Button.inline("← Back", b"admin_panel")])
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="admin_all_users_page_", parse=int, admin=True)
+async def cb_admin_all_users_page(event, uid, data, payload):
+    page = payload
+    per_page = 5
+    users = list(users_col.find({}, USER_LIST_PROJECTION).sort('created_at', -1).skip(page*per_page).limit(per_page))
+    total = users_col.count_documents({})
+    total_pages = max(1, (total + per_page - 1) // per_page)
+
+    text = f"<b>👥 All Users</b> <code>({total} total, page {page+1}/{total_pages})</code>\n\n"
+    user_list = []
+    buttons = []
+
+    for u in users:
+        user_id = u['user_id']
+        username = u.get('username')
+
+        # Try to fetch username from Telegram if not in database
+        if not username:
+            username = await get_username_from_id(event.client, user_id)
+            if username:
+                # Update database with fetched username
+                users_col.update_one({'user_id': user_id}, {'$set': {'username': username}})
+
+        # Add to display list
+        if username:
+            user_list.append(f"@{username}")
+            label = f"View @{username}"
+        else:
+            user_list.append(f"<code>{user_id}</code>")
+            label = f"View {user_id}"
+
+        buttons.append([Button.inline(label, f"admin_user_detail_all_{user_id}")])
+
+    text += "\n".join(user_list) if users else "<i>No users found.</i>"
+    nav = []
+    if page > 0:
+        nav.append(Button.inline("<", f"admin_all_users_page_{page-1}"))
+    if (page+1)*per_page < total:
+        nav.append(Button.inline(">", f"admin_all_users_page_{page+1}"))
+    if nav:
+        buttons.append(nav)
+
+    buttons.append([Button.inline("← Back", b"admin_panel")])
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix=("admin_user_detail_all_", "admin_user_detail_"), admin=True)
+async def cb_admin_user_detail_all(event, uid, data, payload):
+    if data.startswith("admin_user_detail_all_"):
+        if not is_admin(uid):
             return
-        
-        if data.startswith("stats_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            stats = get_account_stats(account_id)
-            failed = account_failed_groups_col.count_documents({'account_id': account_id})
-            
-            text = f"**Stats** - {acc['phone']}\n\n"
-            text += f"Sent: {stats.get('total_sent', 0)}\n"
-            text += f"Failed: {stats.get('total_failed', 0)}\n"
-            text += f"Skipped: {failed}\n"
-            
-            last = stats.get('last_forward')
-            text += f"Last: {last.strftime('%Y-%m-%d %H:%M') if last else 'Never'}"
-            
-            await event.edit(text, buttons=[
-                [Button.inline("Reset", f"reset_{account_id}")],
-                [Button.inline("Back", f"acc_{account_id}")]
-            ])
+
+        target_id = int(data.replace("admin_user_detail_all_", ""))
+        user_detail_source = 'all'
+
+    elif data.startswith("admin_user_detail_"):
+        if not is_admin(uid):
             return
-        
-        if data.startswith("reset_"):
-            account_id = data.split("_")[1]
-            account_stats_col.update_one(
-                {'account_id': account_id},
-                {'$set': {'total_sent': 0, 'total_failed': 0}},
-                upsert=True
-            )
-            await event.answer("Stats reset!")
+
+        target_id = int(data.replace("admin_user_detail_", ""))
+        user_detail_source = 'premium'
+
+    # Common user detail display logic for both handlers
+    if data.startswith("admin_user_detail_all_") or data.startswith("admin_user_detail_"):
+        user = users_col.find_one({'user_id': target_id})
+
+        if not user:
+            await event.answer("User not found!", alert=True)
             return
-        
-        if data.startswith("refresh_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            
-            await event.answer("Refreshing...", alert=False)
-            
-            try:
-                session = cipher_suite.decrypt(acc['session'].encode()).decode()
-                client = TelegramClient(StringSession(session), CONFIG['api_id'], CONFIG['api_hash'])
-                await client.connect()
-                
-                if await client.is_user_authorized():
-                    count = await fetch_groups(client, account_id, acc['phone'])
-                    await client.disconnect()
-                    await event.answer(f"Found {count} groups!", alert=True)
+
+        tier = user.get('tier', 'free')
+        max_acc = user.get('max_accounts', 1)
+        approved = user.get('approved', False)
+        accounts = list(accounts_col.find({'owner_id': target_id}))
+        active = sum(1 for a in accounts if a.get('is_forwarding'))
+
+        created_at = user.get('created_at')
+        created_str = created_at.strftime('%Y-%m-%d %H:%M') if hasattr(created_at, 'strftime') else str(created_at)
+
+        # Show plan name and expiry instead of tier
+        if is_admin(target_id):
+            plan_display = "Admin"
+            expiry_display = "999d"
+        elif tier == 'premium':
+            plan_name = user.get('plan_name', 'Premium')
+            expires_at = user.get('premium_expires_at')
+            if expires_at and isinstance(expires_at, datetime):
+                remaining = expires_at - datetime.now()
+                if remaining.total_seconds() > 0:
+                    expiry_display = f"{remaining.days}d"
                 else:
-                    await event.answer("Session expired!", alert=True)
-            except Exception as e:
-                await event.answer("Error!", alert=True)
-            return
-        
-        if data.startswith("fwd_select_"):
-            account_id = data.split("_")[2]
-            await event.edit("**Start Forwarding**\n\nSelect where to forward:", buttons=forwarding_select_keyboard(account_id, uid))
-            return
-        
-        if data.startswith("startfwd_"):
-            parts = data.split("_")
-            account_id = parts[1]
-            topic = parts[2] if len(parts) > 2 else "all"
-            
-            acc = get_account_by_id(account_id)
-            accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': True, 'fwd_topic': topic}})
-            
-            if account_id not in forwarding_tasks:
-                forwarding_tasks[account_id] = asyncio.create_task(forwarder_loop(account_id, topic, uid))
-            
-            await event.answer("Started!")
-            await event.edit(f"Forwarding started!\n\nTopic: {topic}", buttons=[[Button.inline("Back", f"acc_{account_id}")]])
-            return
-        
-        if data.startswith("stop_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            
-            accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': False}})
-            
-            if account_id in forwarding_tasks:
-                forwarding_tasks[account_id].cancel()
-                del forwarding_tasks[account_id]
-            
-            if account_id in auto_reply_clients:
-                try:
-                    await auto_reply_clients[account_id].disconnect()
-                except:
-                    pass
-                del auto_reply_clients[account_id]
-            
-            await event.answer("Stopped!")
-            await send_log(account_id, "Forwarding stopped")
-            await event.edit("Forwarding stopped!", buttons=[[Button.inline("Back", f"acc_{account_id}")]])
-            return
-        
-        if data.startswith("clearlogs_"):
-            account_id = data.replace("clearlogs_", "")
-            update_account_settings(account_id, {'logs_chat_id': None})
-            await event.answer("Logs disabled!", alert=True)
-            await event.edit("**Logs Disabled**\n\nLogs will no longer be sent in DM.", buttons=[
-                [Button.inline("Back", f"acc_{account_id}")]
-            ])
-            return
-        
-        if data.startswith("logs_"):
-            account_id = data.replace("logs_", "")
-            
-            # Logs are now free for everyone
+                    expiry_display = "Expired"
+            else:
+                expiry_display = "∞"
+            plan_display = plan_name
+        else:
+            plan_display = "Scout: Free"
+            expiry_display = "∞"
+
+        text = (
+            f"<b>👤 User Profile</b>\n\n"
+            f"<b>ID:</b> <code>{target_id}</code>\n"
+            f"<b>Plan:</b> <code>{plan_display}</code>\n"
+            f"<b>Expiry:</b> <code>{expiry_display}</code>\n"
+            f"<b>Approved:</b> {'✅' if approved else '❌'}\n"
+            f"<b>Max Accounts:</b> <code>{max_acc}</code>\n"
+            f"<b>Accounts:</b> <code>{len(accounts)}</code> <i>(active: {active})</i>\n"
+            f"<b>Created:</b> <code>{created_str}</code>"
+        )
+
+        buttons = []
+        if tier != 'premium':
+            buttons.append([Button.inline("✅ Grant Premium", f"admin_grant_premium_{target_id}")])
+        else:
+            buttons.append([Button.inline("❌ Revoke Premium", f"admin_revoke_premium_{target_id}")])
+
+        # Back button routing based on source list
+        if user_detail_source == 'all':
+            back_callback = b"admin_all_users"
+        else:
+            back_callback = b"admin_premium"
+        buttons.append([Button.inline("← Back", back_callback)])
+
+        await event.edit(text, parse_mode='html', buttons=buttons)
+        return
+
+
+@callback_route(prefix="admin_grant_premium_", parse=int, admin=True)
+async def cb_admin_grant_premium(event, uid, data, payload):
+    target_id = payload
+
+    # Show plan selection screen
+    text = (
+        f"<b>🎯 Select Plan for User {target_id}</b>\n\n"
+        f"<i>Choose a plan to grant (30 days):</i>\n\n"
+        f"<b>🔰 Scout:</b> Free Plan (1 account)\n"
+        f"<b>📈 Grow:</b> 3 accounts, medium speed\n"
+        f"<b>⭐ Prime:</b> 7 accounts, fast speed\n"
+        f"<b>👑 Dominion:</b> 15 accounts, fastest speed"
+    )
+
+    buttons = [
+        [Button.inline("🔰 Scout", f"admin_grant_scout_{target_id}")],
+        [Button.inline("📈 Grow", f"admin_grant_grow_{target_id}")],
+        [Button.inline("⭐ Prime", f"admin_grant_prime_{target_id}")],
+        [Button.inline("👑 Dominion", f"admin_grant_dominion_{target_id}")],
+        [Button.inline("← Back", f"admin_user_detail_{target_id}")]
+    ]
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+# Handle individual plan grants
+@callback_route(prefix="admin_grant_scout_", parse=int, admin=True)
+async def cb_admin_grant_scout(event, uid, data, payload):
+    target_id = payload
+    plan = PLANS['scout']
+    days = 30
+    expires_at = datetime.now() + timedelta(days=days)
+
+    users_col.update_one(
+        {'user_id': target_id},
+        {'$set': {
+            'tier': 'free',
+            'plan_name': plan['name'],
+            'max_accounts': plan['max_accounts'],
+            'approved': True
+        }},
+        upsert=True
+    )
+
+    # Send notification to user
+    welcome_image = MESSAGES.get('welcome_image', '')
+    notify_text = (
+        "<b>🎉 Plan Activated!</b>\n\n"
+        "<b>Plan:</b> Scout\n"
+        "<b>Accounts:</b> 1\n"
+        "<b>Validity:</b> 30 days\n\n"
+        "<i>Your plan features are now active!</i>"
+    )
+    notify_buttons = [
+        [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+    ]
+
+    try:
+        if welcome_image:
+            await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
+        else:
+            await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
+    except Exception:
+        pass
+
+    await event.answer("✅ Scout plan granted!", alert=True)
+    await event.edit(
+        f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Scout plan access.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
+    )
+
+
+@callback_route(prefix="admin_grant_grow_", parse=int, admin=True)
+async def cb_admin_grant_grow(event, uid, data, payload):
+    target_id = payload
+    plan = PLANS['grow']
+    days = 30
+    expires_at = datetime.now() + timedelta(days=days)
+
+    users_col.update_one(
+        {'user_id': target_id},
+        {'$set': {
+            'tier': 'premium',
+            'plan_name': plan['name'],
+            'max_accounts': plan['max_accounts'],
+            'premium_expires_at': expires_at,
+            'approved': True
+        }},
+        upsert=True
+    )
+
+    # Send notification to user
+    welcome_image = MESSAGES.get('welcome_image', '')
+    notify_text = (
+        "<b>🎉 Plan Activated!</b>\n\n"
+        "<b>Plan:</b> Grow\n"
+        "<b>Accounts:</b> 3\n"
+        "<b>Validity:</b> 30 days\n\n"
+        "<i>Your premium features are now active!</i>"
+    )
+    notify_buttons = [
+        [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+    ]
+
+    try:
+        if welcome_image:
+            await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
+        else:
+            await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
+    except Exception:
+        pass
+
+    await event.answer("✅ Grow plan granted!", alert=True)
+    await event.edit(
+        f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Grow plan access.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
+    )
+
+
+@callback_route(prefix="admin_grant_prime_", parse=int, admin=True)
+async def cb_admin_grant_prime(event, uid, data, payload):
+    target_id = payload
+    plan = PLANS['prime']
+    days = 30
+    expires_at = datetime.now() + timedelta(days=days)
+
+    users_col.update_one(
+        {'user_id': target_id},
+        {'$set': {
+            'tier': 'premium',
+            'plan_name': plan['name'],
+            'max_accounts': plan['max_accounts'],
+            'premium_expires_at': expires_at,
+            'approved': True
+        }},
+        upsert=True
+    )
+
+    # Send notification to user
+    welcome_image = MESSAGES.get('welcome_image', '')
+    notify_text = (
+        "<b>🎉 Plan Activated!</b>\n\n"
+        "<b>Plan:</b> Prime\n"
+        "<b>Accounts:</b> 7\n"
+        "<b>Validity:</b> 30 days\n\n"
+        "<i>Your premium features are now active!</i>"
+    )
+    notify_buttons = [
+        [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+    ]
+
+    try:
+        if welcome_image:
+            await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
+        else:
+            await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
+    except Exception:
+        pass
+
+    await event.answer("✅ Prime plan granted!", alert=True)
+    await event.edit(
+        f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Prime plan access.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
+    )
+
+
+@callback_route(prefix="admin_grant_dominion_", parse=int, admin=True)
+async def cb_admin_grant_dominion(event, uid, data, payload):
+    target_id = payload
+    plan = PLANS['dominion']
+    days = 30
+    expires_at = datetime.now() + timedelta(days=days)
+
+    users_col.update_one(
+        {'user_id': target_id},
+        {'$set': {
+            'tier': 'premium',
+            'plan_name': plan['name'],
+            'max_accounts': plan['max_accounts'],
+            'premium_expires_at': expires_at,
+            'approved': True
+        }},
+        upsert=True
+    )
+
+    # Send notification to user
+    welcome_image = MESSAGES.get('welcome_image', '')
+    notify_text = (
+        "<b>🎉 Plan Activated!</b>\n\n"
+        "<b>Plan:</b> Dominion\n"
+        "<b>Accounts:</b> 15\n"
+        "<b>Validity:</b> 30 days\n\n"
+        "<i>Your premium features are now active!</i>"
+    )
+    notify_buttons = [
+        [Button.inline("Check Plans", b"back_plans"), Button.inline("Adsye Now!", b"enter_dashboard")]
+    ]
+
+    try:
+        if welcome_image:
+            await main_bot.send_file(target_id, welcome_image, caption=notify_text, parse_mode='html', buttons=notify_buttons)
+        else:
+            await main_bot.send_message(target_id, notify_text, parse_mode='html', buttons=notify_buttons)
+    except Exception:
+        pass
+
+    await event.answer("✅ Dominion plan granted!", alert=True)
+    await event.edit(
+        f"<b>✅ Plan Granted</b>\n\n<i>User {target_id} now has Dominion plan access.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back to Users", b"admin_all_users")]]
+    )
+
+
+@callback_route(prefix="admin_revoke_premium_", parse=int, admin=True)
+async def cb_admin_revoke_premium(event, uid, data, payload):
+    target_id = payload
+    users_col.update_one(
+        {'user_id': target_id},
+        {'$set': {'tier': 'free', 'max_accounts': 1}}
+    )
+    await event.answer("❌ Premium revoked!", alert=True)
+
+    await event.edit(
+        f"<b>❌ Premium Revoked</b>\n\n<i>User {target_id} now has free tier.</i>",
+        parse_mode='html',
+        buttons=[[Button.inline("← Back to Premium Users", b"admin_premium")]]
+    )
+
+
+@callback_route(exact="admin_premium", admin=True)
+async def cb_admin_premium(event, uid, data, payload):
+    total = users_col.count_documents({'tier': 'premium'})
+    users = get_premium_users(limit=20)
+    text = f"<b>\U0001F451 Premium Users</b> <code>({total} total)</code>\n\n"
+
+    buttons = []
+    if not users:
+        text += "<i>No premium users yet.</i>"
+    else:
+        for u in users:
+            user_id = u.get('user_id')
+            max_acc = u.get('max_accounts', 5)
+            acc_count = accounts_col.count_documents({'owner_id': user_id})
+            username = u.get('username')
+            label_id = f"@{username}" if username else str(user_id)
+            label = f"\U0001F451 {label_id} ({acc_count}/{max_acc} acc)"
+            buttons.append([Button.inline(label, f"admin_user_detail_{user_id}")])
+
+    buttons.append([Button.inline("← Back", b"admin_panel")])
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(exact="admin_broadcast", admin=True)
+async def cb_admin_broadcast(event, uid, data, payload):
+    user_states[uid] = {'action': 'broadcast'}
+    await event.respond("Send the message to broadcast to all users:")
+
+
+@callback_route(prefix="page_", parse=int)
+async def cb_page(event, uid, data, payload):
+    page = payload
+    accounts = get_user_accounts(uid)
+    max_acc = get_user_max_accounts(uid)
+    tier_settings = get_user_tier_settings(uid)
+    tier = "Premium" if is_premium(uid) else "Free"
+
+    text = f"**{tier} Dashboard** (Page {page+1})\n\nAccounts: {len(accounts)}/{max_acc}"
+    await event.edit(text, buttons=account_list_keyboard(uid, page))
+
 
-            settings = get_account_settings(account_id)
-            logs_chat = settings.get('logs_chat_id')
-
-            if logs_chat:
-                text = (
-                    "**Logs Configuration**\n\n"
-                    f"Status: Enabled\nDM Target: `{logs_chat}`\n\n"
-                    "Logs will be sent in your DM with View Message links."
-                )
-                buttons = [
-                    [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
-                    [Button.inline("Back", f"acc_{account_id}")]
-                ]
+@callback_route(prefix="acc_")
+async def cb_acc(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+    if not acc:
+        await event.answer("Not found!", alert=True)
+        return
+
+    # Check if user has per-account config access (Prime/Dominion)
+    if not has_per_account_config_access(uid):
+        await event.answer("Per-account config is a Prime/Dominion feature!", alert=True)
+        await event.edit(
+            "🔒 **Per-Account Configuration**\n\n"
+            "This feature allows you to customize settings for each account individually.\n\n"
+            "Available in:\n"
+            "• Prime Plan (₹199)\n"
+            "• Dominion Plan (₹389)\n\n"
+            "Use main dashboard settings to control all accounts together.",
+            buttons=[[Button.inline("⬆️ Upgrade Plan", b"go_premium")], [Button.inline("🏠 Dashboard", b"enter_dashboard")]]
+        )
+        return
+
+    await event.edit(render_account_text(account_id, acc), buttons=account_menu_keyboard(account_id, acc, uid))
+
+
+@callback_route(prefix="topics_")
+async def cb_topics(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+    await event.edit(
+        f"<b> Topics</b>\n<blockquote>Account: <code>{_h(acc['phone'])}</code></blockquote>",
+        parse_mode='html',
+        buttons=topics_menu_keyboard(account_id, uid)
+    )
+
+
+@callback_route(prefix="topic_")
+async def cb_topic(event, uid, data, payload):
+    parts = data.split("_")
+    account_id, topic = parts[1], parts[2]
+
+    tier_settings = get_user_tier_settings(uid)
+    max_groups = tier_settings.get('max_groups_per_topic', 10)
+
+    links = list(account_topics_col.find({'account_id': account_id, 'topic': topic}))
+    text = f"**{topic.capitalize()}** ({len(links)}/{max_groups} links)\n\n"
+
+    for i, l in enumerate(links[:15], 1):
+        text += f"{i}. {l['url']}\n"
+    if len(links) > 15:
+        text += f"...+{len(links)-15} more"
+
+    if not links:
+        text += "No links yet."
+
+    await event.edit(text, buttons=[
+        [Button.inline("Add", f"add_{account_id}_{topic}"), Button.inline("Clear", f"clear_{account_id}_{topic}")],
+        [Button.inline("Back", f"topics_{account_id}")]
+    ])
+
+
+@callback_route(prefix="auto_")
+async def cb_auto(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    groups = list(account_auto_groups_col.find({'account_id': account_id}))
+
+    text = f"**Auto Groups** ({len(groups)})\n\n"
+    for i, g in enumerate(groups[:15], 1):
+        u = f"@{g['username']}" if g.get('username') else "Private"
+        text += f"{i}. {g['title'][:20]} ({u})\n"
+    if len(groups) > 15:
+        text += f"...+{len(groups)-15} more"
+
+    await event.edit(text, buttons=[[Button.inline("Back", f"topics_{account_id}")]])
+
+
+@callback_route(prefix="add_")
+async def cb_add(event, uid, data, payload):
+    parts = data.split("_")
+    account_id, topic = parts[1], parts[2]
+    user_states[uid] = {'action': 'add_links', 'account_id': account_id, 'topic': topic}
+    await event.respond(f"Send links for **{topic}** (one per line):")
+
+
+@callback_route(prefix="clear_")
+async def cb_clear(event, uid, data, payload):
+    parts = data.split("_")
+    account_id, topic = parts[1], parts[2]
+    result = account_topics_col.delete_many({'account_id': account_id, 'topic': topic})
+    await event.answer(f"Deleted {result.deleted_count} links!")
+
+
+@callback_route(prefix="settings_")
+async def cb_settings(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    settings = get_account_settings(account_id)
+
+    text = "**Settings**\n\n"
+    text += f"Message Delay: {settings.get('msg_delay', 30)}s\n"
+    text += f"Group Delay: {settings.get('group_delay', 90)}s (every 10 msgs)\n"
+    text += f"Round Delay: {settings.get('round_delay', 3600)}s\n"
+
+    tier_settings = get_user_tier_settings(uid)
+    if tier_settings.get('auto_reply_enabled'):
+        text += f"Auto-Reply: {settings.get('auto_reply', 'Default')[:40]}..."
+
+    failed = account_failed_groups_col.count_documents({'account_id': account_id})
+    text += f"\nFailed Groups: {failed}"
+
+    await event.edit(text, buttons=settings_keyboard(account_id, uid))
+
+
+@callback_route(prefix="setmsg_")
+async def cb_setmsg(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    user_states[uid] = {'action': 'set_msg_delay', 'account_id': account_id}
+    await event.respond("Enter message delay (minimum 3 seconds, max 300):")
+
+
+@callback_route(prefix="setgrp_")
+async def cb_setgrp(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    user_states[uid] = {'action': 'set_grp_delay', 'account_id': account_id}
+    await event.respond("Enter group delay (10-600 seconds):")
+
+
+@callback_route(prefix="setround_")
+async def cb_setround(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    user_states[uid] = {'action': 'set_round_delay', 'account_id': account_id}
+    await event.respond("Enter round delay (minimum 3600 seconds / 1 hour):")
+
+
+@callback_route(prefix="setreply_")
+async def cb_setreply(event, uid, data, payload):
+    tier_settings = get_user_tier_settings(uid)
+    if not tier_settings.get('auto_reply_enabled'):
+        await event.answer("Premium feature!", alert=True)
+        return
+    account_id = data.split("_")[1]
+    user_states[uid] = {'action': 'set_reply', 'account_id': account_id}
+    await event.respond("Send new auto-reply message:")
+
+
+@callback_route(prefix="clearfailed_")
+async def cb_clearfailed(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    clear_failed_groups(account_id)
+    await event.answer("Cleared failed groups!")
+
+
+@callback_route(prefix="stats_")
+async def cb_stats(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+    stats = get_account_stats(account_id)
+    failed = account_failed_groups_col.count_documents({'account_id': account_id})
+
+    text = f"**Stats** - {acc['phone']}\n\n"
+    text += f"Sent: {stats.get('total_sent', 0)}\n"
+    text += f"Failed: {stats.get('total_failed', 0)}\n"
+    text += f"Skipped: {failed}\n"
+    text += f"\n{render_target_health(account_id)}\n"
+
+    last = stats.get('last_forward')
+    text += f"Last: {last.strftime('%Y-%m-%d %H:%M') if last else 'Never'}"
+
+    await event.edit(text, buttons=[
+        [Button.inline("Reset", f"reset_{account_id}")],
+        [Button.inline("Back", f"acc_{account_id}")]
+    ])
+
+
+@callback_route(prefix="reset_")
+async def cb_reset(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    account_stats_col.update_one(
+        {'account_id': account_id},
+        {'$set': {'total_sent': 0, 'total_failed': 0}},
+        upsert=True
+    )
+    await event.answer("Stats reset!")
+
+
+@callback_route(prefix="refresh_")
+async def cb_refresh(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+    if not acc:
+        await event.answer("Not found!", alert=True)
+        return
+
+    async def work():
+        client = await account_client(acc)
+        try:
+            await client.connect()
+            if await client.is_user_authorized():
+                count = await fetch_groups(client, account_id, acc['phone'])
+                status = f"✅ Found {count} groups!"
             else:
-                text = (
-                    "**Logs Configuration**\n\n"
-                    "Status: Disabled\n\n"
-                    "Enable logs to receive them directly in DM."
-                )
-                buttons = [
-                    [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
-                    [Button.inline("Back", f"acc_{account_id}")]
-                ]
-
-            await event.edit(text, parse_mode='html', buttons=buttons)
-            return
-        
-        if data.startswith("delete_"):
-            account_id = data.split("_")[1]
+                status = "⚠️ Session expired!"
+        except Exception as e:
+            account_log.warning("Refresh failed: %s", e, extra={'user_id': uid, 'account_id': account_id})
+            status = "❌ Refresh failed, try again."
+        finally:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+        fresh = get_account_by_id(account_id) or acc
+        await event.edit(
+            f"**{status}**\n\n" + render_account_text(account_id, fresh),
+            buttons=account_menu_keyboard(account_id, fresh, uid)
+        )
+
+    await answer_then_run(event, uid, work, ack="Refreshing...")
+
+
+@callback_route(prefix="fwd_select_")
+async def cb_fwd_select(event, uid, data, payload):
+    account_id = data.split("_")[2]
+    await event.edit("**Start Forwarding**\n\nSelect where to forward:", buttons=forwarding_select_keyboard(account_id, uid))
+
+
+@callback_route(prefix="startfwd_")
+async def cb_startfwd(event, uid, data, payload):
+    parts = data.split("_")
+    account_id = parts[1]
+    topic = parts[2] if len(parts) > 2 else "all"
+
+    acc = get_account_by_id(account_id)
+    accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': True, 'fwd_topic': topic}})
+
+    if account_id not in forwarding_tasks:
+        forwarding_tasks[account_id] = spawn_detached(forwarder_loop(account_id, topic, uid))
+
+    await event.answer("Started!")
+    await event.edit(f"Forwarding started!\n\nTopic: {topic}", buttons=[[Button.inline("Back", f"acc_{account_id}")]])
+
+
+@callback_route(prefix="stop_")
+async def cb_stop(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+
+    accounts_col.update_one({'_id': acc['_id']}, {'$set': {'is_forwarding': False}})
+
+    if account_id in forwarding_tasks:
+        forwarding_tasks[account_id].cancel()
+        del forwarding_tasks[account_id]
+
+    if account_id in auto_reply_clients:
+        try:
+            await auto_reply_clients[account_id].disconnect()
+        except:
+            pass
+        del auto_reply_clients[account_id]
+
+    await event.answer("Stopped!")
+    await send_log(account_id, "Forwarding stopped")
+    await event.edit("Forwarding stopped!", buttons=[[Button.inline("Back", f"acc_{account_id}")]])
+
+
+@callback_route(prefix="clearlogs_")
+async def cb_clearlogs(event, uid, data, payload):
+    account_id = payload
+    update_account_settings(account_id, {'logs_chat_id': None})
+    await event.answer("Logs disabled!", alert=True)
+    await event.edit("**Logs Disabled**\n\nLogs will no longer be sent in DM.", buttons=[
+        [Button.inline("Back", f"acc_{account_id}")]
+    ])
+
+
+@callback_route(prefix="logs_")
+async def cb_logs(event, uid, data, payload):
+    account_id = payload
+
+    # Logs are now free for everyone
+
+    settings = get_account_settings(account_id)
+    logs_chat = settings.get('logs_chat_id')
+
+    if logs_chat:
+        text = (
+            "**Logs Configuration**\n\n"
+            f"Status: Enabled\nDM Target: `{logs_chat}`\n\n"
+            "Logs will be sent in your DM with View Message links."
+        )
+        buttons = [
+            [Button.inline("Disable DM Logs", f"clearlogs_{account_id}")],
+            [Button.inline("Back", f"acc_{account_id}")]
+        ]
+    else:
+        text = (
+            "**Logs Configuration**\n\n"
+            "Status: Disabled\n\n"
+            "Enable logs to receive them directly in DM."
+        )
+        buttons = [
+            [Button.inline("Enable DM Logs", f"enablelogs_{account_id}")],
+            [Button.inline("Back", f"acc_{account_id}")]
+        ]
+
+    await event.edit(text, parse_mode='html', buttons=buttons)
+
+
+@callback_route(prefix="delete_")
+async def cb_delete(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    await event.edit(
+        "**Delete this account?**\n\nAll data will be removed!",
+        buttons=[
+            [Button.inline("Yes", f"confirm_{account_id}"), Button.inline("No", f"acc_{account_id}")]
+        ]
+    )
+
+
+@callback_route(prefix="confirm_")
+async def cb_confirm(event, uid, data, payload):
+    account_id = data.split("_")[1]
+    acc = get_account_by_id(account_id)
+
+    if acc:
+        from bson.objectid import ObjectId
+        accounts_col.delete_one({'_id': ObjectId(account_id)})
+        account_topics_col.delete_many({'account_id': account_id})
+        account_settings_col.delete_many({'account_id': account_id})
+        account_stats_col.delete_many({'account_id': account_id})
+        account_auto_groups_col.delete_many({'account_id': account_id})
+        account_failed_groups_col.delete_many({'account_id': account_id})
+        logger_tokens_col.delete_many({'account_id': account_id})
+
+        if account_id in forwarding_tasks:
+            forwarding_tasks[account_id].cancel()
+            del forwarding_tasks[account_id]
+        forget_target_health(account_id)
+
+        if account_id in auto_reply_clients:
+            try:
+                await auto_reply_clients[account_id].disconnect()
+            except:
+                pass
+            del auto_reply_clients[account_id]
+
+    await event.answer("Deleted!")
+    await event.edit("**Dashboard**", buttons=account_list_keyboard(uid))
+
+
+@callback_route(exact="host")
+async def cb_host(event, uid, data, payload):
+    if not is_approved(uid):
+        approve_user(uid)
+
+    accounts = get_user_accounts(uid)
+    max_accounts = get_user_max_accounts(uid)
+
+    if len(accounts) >= max_accounts:
+        if is_premium(uid):
+            await event.answer(f"Limit reached ({max_accounts})", alert=True)
+        else:
+            await event.answer("Upgrade to Premium for more accounts!", alert=True)
+        return
+
+    await end_login(uid)
+    user_states[uid] = new_login_state(action='phone')
+    await event.respond("Send phone with country code:\n\nExample: `+919876543210`")
+
+
+@callback_route(prefix="otp_")
+async def cb_otp(event, uid, data, payload):
+    if uid not in user_states or user_states[uid].get('action') != 'otp':
+        return
+
+    digit = data.split("_")[1]
+    otp = user_states[uid].get('otp', '')
+
+    if digit == "cancel":
+        await end_login(uid)
+        await event.answer("Cancelled!")
+        await event.delete()
+        return
+    elif digit == "back":
+        otp = otp[:-1]
+    else:
+        otp += digit
+
+    user_states[uid]['otp'] = otp
+
+    if len(otp) == 5:
+        await event.edit(f"Code: `{otp}`\n\nVerifying...")
+
+        try:
+            client = user_states[uid]['client']
+            await client.sign_in(user_states[uid]['phone'], otp, phone_code_hash=user_states[uid]['hash'])
+
+            me = await client.get_me()
+            session = client.session.save()
+            encrypted = cipher_suite.encrypt(session.encode()).decode()
+
+            result = accounts_col.insert_one({
+                'owner_id': uid,
+                'phone': user_states[uid]['phone'],
+                'name': me.first_name or 'Unknown',
+                'session': encrypted,
+                'is_forwarding': False,
+                'proxy_key': user_states[uid].get('proxy_key'),
+                'added_at': datetime.now()
+            })
+
+            account_id = str(result.inserted_id)
+            count = await fetch_groups(client, account_id, user_states[uid]['phone'])
+            await end_login(uid)
+
+            account_log.info("Added account, fetched %d groups", count, extra={'user_id': uid})
             await event.edit(
-                "**Delete this account?**\n\nAll data will be removed!",
-                buttons=[
-                    [Button.inline("Yes", f"confirm_{account_id}"), Button.inline("No", f"acc_{account_id}")]
-                ]
+                f"**Account Added!**\n\n{me.first_name}\nFound {count} groups",
+                buttons=account_list_keyboard(uid)
             )
-            return
-        
-        if data.startswith("confirm_"):
-            account_id = data.split("_")[1]
-            acc = get_account_by_id(account_id)
-            
-            if acc:
-                from bson.objectid import ObjectId
-                accounts_col.delete_one({'_id': ObjectId(account_id)})
-                account_topics_col.delete_many({'account_id': account_id})
-                account_settings_col.delete_many({'account_id': account_id})
-                account_stats_col.delete_many({'account_id': account_id})
-                account_auto_groups_col.delete_many({'account_id': account_id})
-                account_failed_groups_col.delete_many({'account_id': account_id})
-                logger_tokens_col.delete_many({'account_id': account_id})
-                
-                if account_id in forwarding_tasks:
-                    forwarding_tasks[account_id].cancel()
-                    del forwarding_tasks[account_id]
-                
-                if account_id in auto_reply_clients:
-                    try:
-                        await auto_reply_clients[account_id].disconnect()
-                    except:
-                        pass
-                    del auto_reply_clients[account_id]
-            
-            await event.answer("Deleted!")
-            await event.edit("**Dashboard**", buttons=account_list_keyboard(uid))
-            return
-        
-        if data == "host":
-            if not is_approved(uid):
-                approve_user(uid)
-            
-            accounts = get_user_accounts(uid)
-            max_accounts = get_user_max_accounts(uid)
-            
-            if len(accounts) >= max_accounts:
-                if is_premium(uid):
-                    await event.answer(f"Limit reached ({max_accounts})", alert=True)
-                else:
-                    await event.answer("Upgrade to Premium for more accounts!", alert=True)
-                return
-            
-            user_states[uid] = {'action': 'phone'}
-            await event.respond("Send phone with country code:\n\nExample: `+919876543210`")
-            return
-        
-        if data.startswith("otp_"):
-            if uid not in user_states or user_states[uid].get('action') != 'otp':
-                return
-            
-            digit = data.split("_")[1]
-            otp = user_states[uid].get('otp', '')
-            
-            if digit == "cancel":
-                if 'client' in user_states[uid]:
-                    await user_states[uid]['client'].disconnect()
-                del user_states[uid]
-                await event.answer("Cancelled!")
-                await event.delete()
-                return
-            elif digit == "back":
-                otp = otp[:-1]
-            else:
-                otp += digit
-            
-            user_states[uid]['otp'] = otp
-            
-            if len(otp) == 5:
-                await event.edit(f"Code: `{otp}`\n\nVerifying...")
-                
-                try:
-                    client = user_states[uid]['client']
-                    await client.sign_in(user_states[uid]['phone'], otp, phone_code_hash=user_states[uid]['hash'])
-                    
-                    me = await client.get_me()
-                    session = client.session.save()
-                    encrypted = cipher_suite.encrypt(session.encode()).decode()
-                    
-                    result = accounts_col.insert_one({
-                        'owner_id': uid,
-                        'phone': user_states[uid]['phone'],
-                        'name': me.first_name or 'Unknown',
-                        'session': encrypted,
-                        'is_forwarding': False,
-                        'added_at': datetime.now()
-                    })
-                    
-                    account_id = str(result.inserted_id)
-                    count = await fetch_groups(client, account_id, user_states[uid]['phone'])
-                    await client.disconnect()
-                    
-                    del user_states[uid]
-                    
-                    print(f"[ACCOUNT] Added account for user {uid}, fetched {count} groups")
-                    await event.edit(
-                        f"**Account Added!**\n\n{me.first_name}\nFound {count} groups",
-                        buttons=account_list_keyboard(uid)
-                    )
-                    
-                except SessionPasswordNeededError:
-                    user_states[uid]['action'] = '2fa'
-                    await event.edit("**2FA Required**\n\nSend your password:")
-                except PhoneCodeInvalidError:
-                    user_states[uid]['otp'] = ''
-                    await event.edit("Wrong code! Try again:", buttons=otp_keyboard())
-                except Exception as e:
-                    await event.edit(f"Error: {str(e)[:100]}")
-                    if 'client' in user_states[uid]:
-                        await user_states[uid]['client'].disconnect()
-                    del user_states[uid]
-            else:
-                await event.edit(f"Code: `{otp}{'_' * (5-len(otp))}`", buttons=otp_keyboard())
-            return
-    
-    except MessageNotModifiedError:
-        pass
-    except Exception as e:
-        print(f"Callback error: {e}")
-        await event.answer("Error!", alert=True)
+
+        except SessionPasswordNeededError:
+            user_states[uid]['action'] = '2fa'
+            await event.edit("**2FA Required**\n\nSend your password:")
+        except PhoneCodeInvalidError:
+            user_states[uid]['otp'] = ''
+            await event.edit("Wrong code! Try again:", buttons=otp_keyboard())
+        except Exception as e:
+            await event.edit(f"Error: {str(e)[:100]}")
+            await end_login(uid)
+    else:
+        await event.edit(f"Code: `{otp}{'_' * (5-len(otp))}`", buttons=otp_keyboard())
 
 @main_bot.on(events.NewMessage)
 async def text_handler(event):
@@ -4630,6 +7006,7 @@ async def text_handler(event):
     text = event.text.strip()
     
     if text.startswith('/'):
+        name_current_route(None)  # timed under its /command handler
         return
     
     if uid not in user_states:
@@ -4643,18 +7020,8 @@ async def text_handler(event):
             del user_states[uid]
             return
         
-        users = get_all_users()
-        sent = 0
-        failed = 0
-        for u in users:
-            try:
-                await main_bot.send_message(u['user_id'], f"**Announcement**\n\n{text}")
-                sent += 1
-            except:
-                failed += 1
-        
         del user_states[uid]
-        await event.respond(f"Broadcast complete!\nSent: {sent}\nFailed: {failed}")
+        await start_broadcast(event, 'text', text=f"**Announcement**\n\n{text}")
         return
     
     if action == 'custom_autoreply':
@@ -4828,6 +7195,10 @@ async def text_handler(event):
             await event.respond(f"Account limit reached ({max_accounts})!")
             return
         
+        if login_capacity_reached(uid):
+            await event.respond("Too many logins in progress right now. Please try again in a few minutes.")
+            return
+        
         # Typewriter effect: progressive updates
         status_msg = await event.respond("Connecting...")
         await asyncio.sleep(0.6)
@@ -4836,11 +7207,13 @@ async def text_handler(event):
         await status_msg.edit("Sending OTP...")
         
         try:
-            proxy = get_next_proxy()
-            proxy_info = f" via proxy" if proxy else ""
-            print(f"[OTP] Sending code to {text}{proxy_info}")
+            proxy = await asyncio.to_thread(pick_proxy)
+            proxy_key = _proxy_key(proxy) if proxy else None
+            proxy_info = f" via proxy {proxy_key}" if proxy else ""
+            login_log.info("Sending code to %s%s", text, proxy_info, extra={'user_id': uid})
             
-            client = TelegramClient(StringSession(), CONFIG['api_id'], CONFIG['api_hash'], proxy=proxy)
+            client = TelegramClient(StringSession(), CONFIG['api_id'], CONFIG['api_hash'], proxy=_proxy_tuple(proxy) if proxy else None)
+            await begin_login(uid, client)
             await client.connect()
             
             sent = await client.send_code_request(text)
@@ -4848,13 +7221,13 @@ async def text_handler(event):
             await asyncio.sleep(0.5)
             await status_msg.edit("OTP Sent!")
             
-            user_states[uid] = {
-                'action': 'otp',
-                'client': client,
-                'phone': text,
-                'hash': sent.phone_code_hash,
-                'proxy': proxy
-            }
+            user_states[uid] = new_login_state(
+                action='otp',
+                client=client,
+                phone=text,
+                hash=sent.phone_code_hash,
+                proxy_key=proxy_key
+            )
             
             await asyncio.sleep(0.4)
             await event.respond(
@@ -4866,10 +7239,10 @@ async def text_handler(event):
             
         except PhoneNumberInvalidError:
             await status_msg.edit("Invalid phone number!")
-            del user_states[uid]
+            await end_login(uid)
         except Exception as e:
             await status_msg.edit(f"Failed to send OTP: {str(e)[:100]}")
-            del user_states[uid]
+            await end_login(uid)
     
     elif action == 'otp':
         # Accept code in format: code1234 (remove "code" prefix)
@@ -4898,14 +7271,13 @@ async def text_handler(event):
                 'name': me.first_name or 'Unknown',
                 'session': encrypted,
                 'is_forwarding': False,
+                'proxy_key': state.get('proxy_key'),
                 'added_at': datetime.now()
             })
             
             account_id = str(result.inserted_id)
             count = await fetch_groups(client, account_id, state['phone'])
-            await client.disconnect()
-            
-            del user_states[uid]
+            await end_login(uid)
             
             # NEW: Show professional plan selection after login (with image)
             plan_msg = (
@@ -4938,14 +7310,10 @@ async def text_handler(event):
             await event.respond("Invalid code! Try again:")
         except PhoneCodeExpiredError:
             await event.respond("Code expired! Use /start to retry.")
-            if 'client' in state:
-                await state['client'].disconnect()
-            del user_states[uid]
+            await end_login(uid)
         except Exception as e:
             await event.respond(f"Error: {str(e)[:100]}")
-            if 'client' in state:
-                await state['client'].disconnect()
-            del user_states[uid]
+            await end_login(uid)
     
     elif action == '2fa':
         try:
@@ -4962,16 +7330,15 @@ async def text_handler(event):
                 'name': me.first_name or 'Unknown',
                 'session': encrypted,
                 'is_forwarding': False,
+                'proxy_key': state.get('proxy_key'),
                 'added_at': datetime.now()
             })
             
             account_id = str(result.inserted_id)
             count = await fetch_groups(client, account_id, state['phone'])
-            await client.disconnect()
-            
-            del user_states[uid]
+            await end_login(uid)
             
-            print(f"[ACCOUNT] Added account for user {uid}, fetched {count} groups")
+            account_log.info("Added account, fetched %d groups", count, extra={'user_id': uid})
             
             # NEW: Show professional plan selection after 2FA login (with image)
             plan_msg = (
@@ -4997,9 +7364,7 @@ async def text_handler(event):
             await event.respond("Wrong password! Try again:")
         except Exception as e:
             await event.respond(f"Error: {str(e)[:100]}")
-            if 'client' in state:
-                await state['client'].disconnect()
-            del user_states[uid]
+            await end_login(uid)
     
     elif action == 'add_links':
         account_id = state['account_id']
@@ -5154,66 +7519,61 @@ async def logger_handler(event):
         await event.respond(f"Cannot send to that chat!\nMake sure I'm admin.\n\nError: {str(e)[:50]}")
 
 async def forwarder_loop(account_id, selected_topic, user_id):
-    print(f"[{account_id}] Starting forwarder (topic: {selected_topic})")
+    fields = {'account_id': str(account_id), 'user_id': user_id}
+    flog = logging.LoggerAdapter(forwarding_log, fields)
+    slog = logging.LoggerAdapter(send_log_sampled, fields)
+    flog.info("Starting forwarder (topic: %s)", selected_topic)
     
     acc = get_account_by_id(account_id)
     if not acc:
         return
     
-    tier_settings = get_user_tier_settings(user_id)
-    
     await send_log(account_id, f"Forwarding started\nAccount: {acc['phone']}\nTopic: {selected_topic}")
     
     while True:
         try:
             acc = get_account_by_id(account_id)
             if not acc or not acc.get('is_forwarding'):
-                print(f"[{account_id}] Stopped")
+                flog.info("Stopped")
                 break
             
             settings = get_account_settings(account_id)
-            msg_delay = max(settings.get('msg_delay', 30), tier_settings['msg_delay'])
-            group_delay = max(settings.get('group_delay', 90), tier_settings['group_delay'])
-            round_delay = max(settings.get('round_delay', 3600), tier_settings['round_delay'])
-            auto_reply_msg = settings.get('auto_reply', MESSAGES['auto_reply'])
-            reply_cooldown = settings.get('reply_cooldown', 300)
+            ent = resolve_entitlements(user_id)
+            account_tiers[str(account_id)] = ent['plan']
+            msg_delay = max(settings.get('msg_delay', 30), ent['msg_delay'])
+            group_delay = max(settings.get('group_delay', 90), ent['group_delay'])
+            round_delay = max(settings.get('round_delay', 3600), ent['round_delay'])
             
             try:
-                session = cipher_suite.decrypt(acc['session'].encode()).decode()
-                client = TelegramClient(StringSession(session), CONFIG['api_id'], CONFIG['api_hash'])
+                client = await account_client(acc)
                 await client.connect()
                 
                 if not await client.is_user_authorized():
-                    print(f"[{account_id}] Session expired")
+                    flog.warning("Session expired")
                     await send_log(account_id, "Session expired!")
                     await asyncio.sleep(60)
                     continue
                 
                 await client.start()
                 
-                ads = []
-                async for msg in client.iter_messages('me', limit=10):
-                    if msg.text or msg.media:
-                        ads.append(msg)
-                ads.reverse()
+                ads = await load_ad_units(client)
                 
                 if not ads:
-                    print(f"[{account_id}] No ads in Saved Messages")
+                    flog.info("No ads in Saved Messages")
                     await send_log(account_id, "No ads found in Saved Messages!")
                     await client.disconnect()
                     await asyncio.sleep(60)
                     continue
                 
                 all_targets = []
-                max_topics = tier_settings.get('max_topics', 3)
+                max_topics = ent['max_topics']
                 
                 if selected_topic != "all" and selected_topic in TOPICS[:max_topics]:
                     topic_links = list(account_topics_col.find({'account_id': account_id, 'topic': selected_topic}))
                     for t in topic_links:
                         group_key = t['url']
                         group_name = t.get('url', 'Unknown')
-                        if not is_group_failed(account_id, group_key):
-                            all_targets.append({'type': 'topic', 'data': t, 'key': group_key, 'name': group_name})
+                        all_targets.append({'type': 'topic', 'data': t, 'key': group_key, 'name': group_name})
                 
                 auto_groups = list(account_auto_groups_col.find({'account_id': account_id}))
                 topic_peers = set()
@@ -5226,16 +7586,20 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                 for g in auto_groups:
                     group_key = str(g['group_id'])
                     group_name = g.get('title', 'Unknown')
-                    if group_key not in topic_peers and not is_group_failed(account_id, group_key):
+                    if group_key not in topic_peers:
                         all_targets.append({'type': 'auto', 'data': g, 'key': group_key, 'name': group_name})
                 
+                # Healthiest groups first; groups in error backoff sit this round out
+                load_target_health(account_id)
+                all_targets, backed_off = order_targets(account_id, all_targets)
+                
                 active_waits = get_active_flood_waits(account_id)
-                print(f"[{account_id}] Forwarding to {len(all_targets)} groups (flood waits: {active_waits})")
-                await send_log(account_id, f"Starting round\nGroups: {len(all_targets)}\nFlood waits: {active_waits}")
+                flog.info("Forwarding to %d groups (flood waits: %s, backing off: %d)", len(all_targets), active_waits, backed_off)
+                await send_log(account_id, f"Starting round\nGroups: {len(all_targets)}\nFlood waits: {active_waits}\nBacking off: {backed_off}")
                 
                 sent = 0
                 failed = 0
-                skipped = 0
+                skipped = backed_off
                 
                 for i, target in enumerate(all_targets):
                     try:
@@ -5250,10 +7614,10 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                         if wait_remaining > 0:
                             skipped += 1
                             mins = wait_remaining // 60
-                            print(f"[{account_id}] Skipped {group_name} (wait: {mins}m)")
+                            flog.debug("Skipped %s (wait: %sm)", group_name, mins)
                             continue
                         
-                        msg = ads[i % len(ads)]
+                        unit = ads[i % len(ads)]
                         
                         sent_msg_id = None
                         current_topic_id = None
@@ -5270,18 +7634,7 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                             current_entity = await client.get_entity(peer)
                             group_name = getattr(current_entity, 'title', group_name)[:30]
                             
-                            if current_topic_id:
-                                sent_msg_id = await forward_message(client, current_entity, msg.id, msg.peer_id, current_topic_id)
-                            else:
-                                result = await client.forward_messages(current_entity, msg.id, 'me')
-                                if result:
-                                        if isinstance(result, list):
-                                            sent_msg_id = result[0].id if len(result) > 0 else None
-
-                                        else:
-
-
-                                            sent_msg_id = result.id
+                            sent_msg_id = await forward_message(client, current_entity, [m.id for m in unit], 'me', current_topic_id)
                         else:
                             data = target['data']
                             group_id = data['group_id']
@@ -5311,18 +7664,12 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                                 except:
                                     current_entity = await client.get_entity(int('-100' + str(group_id)))
                             
-                            result = await client.forward_messages(current_entity, msg.id, 'me')
-                            if result:
-                                if result:
-                                    if isinstance(result, list):
-                                        sent_msg_id = result[0].id if len(result) > 0 else None
-                                    else:
-                                        sent_msg_id = result.id
-
-                                    sent_msg_id = result.id
+                            sent_msg_id = await forward_message(client, current_entity, [m.id for m in unit], 'me')
                         
                         sent += 1
-                        print(f"[{account_id}] Sent to {group_name} ({i+1}/{len(all_targets)})")
+                        slog.info("Sent to %s (%d/%d)", group_name, i + 1, len(all_targets))
+                        record_delivery(account_id, user_id, group_key, group_name, sent=1)
+                        record_target_outcome(account_id, group_key, 'sent', group_name)
                         
                         if sent_msg_id and current_entity:
                             view_link = build_message_link(current_entity, sent_msg_id, current_topic_id)
@@ -5332,7 +7679,7 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                         await asyncio.sleep(msg_delay)
                         
                         if (i + 1) % 10 == 0:
-                            print(f"[{account_id}] Group pause ({group_delay}s)")
+                            flog.debug("Group pause (%ss)", group_delay)
                             await asyncio.sleep(group_delay)
                         
                     except FloodWaitError as e:
@@ -5341,15 +7688,19 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                         failed += 1
                         
                         set_flood_wait(account_id, group_key, group_name, wait_secs)
+                        record_delivery(account_id, user_id, group_key, group_name, failed=1, flood_wait_s=wait_secs)
+                        record_target_outcome(account_id, group_key, 'flood', group_name)
                         
-                        print(f"[{account_id}] FloodWait {mins}m in {group_name}")
+                        flog.warning("FloodWait %sm in %s", mins, group_name)
                         await asyncio.sleep(msg_delay)
                         
                     except (ChannelPrivateError, ChatWriteForbiddenError, UserBannedInChannelError) as e:
                         failed += 1
                         mark_group_failed(account_id, target['key'], str(e))
+                        record_delivery(account_id, user_id, group_key, group_name, failed=1, permanent_fail=1)
+                        record_target_outcome(account_id, group_key, 'blocked', group_name)
                         error_type = type(e).__name__
-                        print(f"[{account_id}] Failed {group_name}: {error_type}")
+                        flog.warning("Failed %s: %s", group_name, error_type)
                         await asyncio.sleep(msg_delay)
                         
                     except Exception as e:
@@ -5360,12 +7711,18 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                             wait_secs = int(wait_match.group(1))
                             failed += 1
                             set_flood_wait(account_id, group_key, group_name, wait_secs)
+                            record_delivery(account_id, user_id, group_key, group_name, failed=1, flood_wait_s=wait_secs)
+                            record_target_outcome(account_id, group_key, 'flood', group_name)
                         elif 'Could not find' in error_str or 'entity' in error_str.lower():
                             failed += 1
                             mark_group_failed(account_id, target['key'], error_str[:100])
+                            record_delivery(account_id, user_id, group_key, group_name, failed=1, permanent_fail=1)
+                            record_target_outcome(account_id, group_key, 'blocked', group_name)
                         else:
                             failed += 1
-                            print(f"[{account_id}] Error {group_name}: {error_str[:50]}")
+                            flog.warning("Error %s: %.50s", group_name, error_str)
+                            record_delivery(account_id, user_id, group_key, group_name, failed=1)
+                            record_target_outcome(account_id, group_key, 'error', group_name)
                         
                         await asyncio.sleep(msg_delay)
                 
@@ -5374,18 +7731,18 @@ async def forwarder_loop(account_id, selected_topic, user_id):
                 log_msg = f"Round complete!\n\nSent: {sent}\nFailed: {failed}\nSkipped: {skipped}\nNext round: {round_delay}s"
                 await send_log(account_id, log_msg)
                 
-                print(f"[{account_id}] Round done! Sent: {sent}, Failed: {failed}")
-                print(f"[{account_id}] Waiting {round_delay}s...")
+                flog.info("Round done! Sent: %d, Failed: %d", sent, failed)
+                flog.debug("Waiting %ss", round_delay)
                 
                 await asyncio.sleep(round_delay)
                 await client.disconnect()
                 
             except Exception as e:
-                print(f"[{account_id}] Loop error: {e}")
+                flog.exception("Loop error: %s", e)
                 await asyncio.sleep(60)
                 
         except Exception as e:
-            print(f"[{account_id}] Outer error: {e}")
+            flog.exception("Outer error: %s", e)
             await asyncio.sleep(60)
     
     if account_id in forwarding_tasks:
@@ -5398,32 +7755,53 @@ async def forwarder_loop(account_id, selected_topic, user_id):
         del auto_reply_clients[account_id]
     
     await send_log(account_id, "Forwarding ended")
-    print(f"[{account_id}] Forwarder ended")
+    flog.info("Forwarder ended")
 
 async def main():
-    print("\n" + "="*50)
-    print("Starting Ads Bot...")
-    print("="*50)
+    log.info("Starting Ads Bot...")
     
     try:
         await main_bot.start(bot_token=CONFIG['bot_token'])
         me = await main_bot.get_me()
-        print(f"Main: @{me.username}")
+        log.info("Main: @%s", me.username)
     except Exception as e:
-        print(f"Main bot failed: {e}")
+        log.critical("Main bot failed: %s", e)
         return
     
     try:
         if CONFIG['logger_bot_token']:
             await logger_bot.start(bot_token=CONFIG['logger_bot_token'])
             me = await logger_bot.get_me()
-            print(f"Logger: @{me.username}")
+            log.info("Logger: @%s", me.username)
     except Exception as e:
-        print(f"Logger failed: {e}")
+        log.error("Logger failed: %s", e)
     
-    print("="*50)
-    print("Bot running!")
-    print("="*50 + "\n")
+    await resolve_forcejoin_entities()
+    
+    if HTTP_SERVER['enabled']:
+        try:
+            await start_http_server()
+        except Exception as e:
+            http_log.error("Server failed to start: %s", e)
+    
+    try:
+        ensure_indexes()
+    except Exception as e:
+        log.error("Index setup failed: %s", e)
+    
+    if PROXIES:
+        asyncio.create_task(proxy_health_loop())
+    asyncio.create_task(login_reaper_loop())
+    asyncio.create_task(resume_broadcast_jobs())
+    asyncio.create_task(premium_expiry_loop())
+    asyncio.create_task(expiry_notice_loop())
+    asyncio.create_task(metrics_flush_loop())
+    asyncio.create_task(target_health_flush_loop())
+    asyncio.create_task(loop_lag_probe())
+    start_loop_watchdog()
+    asyncio.create_task(system_sampler_loop())
+    
+    log.info("Bot running!")
     
     await asyncio.gather(
         main_bot.run_until_disconnected(),
@@ -5433,9 +7811,8 @@ async def main():
 
 # ===== ADMIN: Grant Premium Commands =====
 
-@main_bot.on(events.CallbackQuery(pattern=b"^admin_grant_premium$"))
-async def admin_grant_premium_menu(event):
-    uid = event.sender_id
+@callback_route(exact="admin_grant_premium")
+async def admin_grant_premium_menu(event, uid, data, payload):
     if not is_admin(uid):
         await event.answer("Admin only", alert=True)
         return
@@ -5595,8 +7972,8 @@ if __name__ == '__main__':
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\nStopped")
+        log.info("Stopped")
     except Exception as e:
-        print(f"Error: {e}")
+        log.critical("Error: %s", e)
     finally:
         mongo_client.close()
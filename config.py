@@ -174,6 +174,9 @@ FORCE_JOIN = {
         'FORCE_JOIN_MESSAGE',
         "**Access Locked**\n\nPlease join our **Channel** and **Group** to use this bot.\n\nAfter joining, click **Verify**."
     ),
+
+    # Seconds a passed membership check is trusted before re-checking with Telegram
+    'member_ttl': int(os.getenv('FORCE_JOIN_MEMBER_TTL', '600')),
 }
 
 # Plan selection screen image
@@ -185,7 +188,7 @@ OXAPAY_CONFIG = {
     'merchant_api_key': os.getenv('OXAPAY_MERCHANT_KEY', ''),  # Your Oxapay merchant key (only one needed!)
     'api_url': 'https://api.oxapay.com/merchants/request',
     'webhook_url': os.getenv('OXAPAY_WEBHOOK_URL', 'https://webhook-adsye.onrender.com/oxapay/webhook'),  
-    'webhook_secret': os.getenv('WEBHOOK_SECRET', 'isKQlLSdYlJ0bcorMf_LQfWOJJM9Kr_q8AV79qY8M24'),  
+    'webhook_secret': os.getenv('WEBHOOK_SECRET', ''),  
     'currencies': ['USDT', 'BTC', 'ETH', 'LTC', 'TRX'],  
 }
 
@@ -222,3 +225,160 @@ if proxy_env:
                 'password': parts[4] if len(parts) > 4 else None
             }
             PROXIES.append(proxy)
+
+# Proxy pool health checks (applies to every account client the bot creates)
+# - probe_interval: seconds between background liveness/latency probes
+# - probe_timeout: seconds before a probe counts as failed
+# - max_latency: handshake latency (seconds) above which a proxy is considered degraded
+# - max_failures: consecutive failed probes before a proxy is taken out of rotation
+# - probe_host/probe_port: Telegram DC used as the handshake target
+PROXY_POOL = {
+    'probe_interval': int(os.getenv('PROXY_PROBE_INTERVAL', '300')),
+    'probe_timeout': float(os.getenv('PROXY_PROBE_TIMEOUT', '10')),
+    'max_latency': float(os.getenv('PROXY_MAX_LATENCY', '3')),
+    'max_failures': int(os.getenv('PROXY_MAX_FAILURES', '2')),
+    'probe_host': os.getenv('PROXY_PROBE_HOST', '149.154.167.51'),
+    'probe_port': int(os.getenv('PROXY_PROBE_PORT', '443')),
+}
+
+# Pending /add logins (each holds a live, connected TelegramClient until OTP/2FA completes)
+# - ttl: seconds before an unfinished login is disconnected and dropped
+# - max_pending: global cap on logins waiting for OTP/2FA at the same time
+# - reap_interval: seconds between background sweeps for expired logins
+LOGIN_SESSIONS = {
+    'ttl': int(os.getenv('LOGIN_TTL', '600')),
+    'max_pending': int(os.getenv('LOGIN_MAX_PENDING', '100')),
+    'reap_interval': int(os.getenv('LOGIN_REAP_INTERVAL', '30')),
+}
+
+# Admin broadcasts (/bd, /broadcast, admin panel) run as resumable background jobs
+# - rate: messages per second across all senders (Bot API allows ~30/s globally)
+# - workers: concurrent senders per job
+# - batch_size: users fetched per cursor page
+# - checkpoint_every: sends between resume checkpoints (a restart re-sends at most about
+#   this many plus `workers` users)
+# - progress_interval: seconds between progress message edits
+# - max_retries: FloodWait retries per recipient before counting it as failed
+BROADCAST = {
+    'rate': float(os.getenv('BROADCAST_RATE', '25')),
+    'workers': int(os.getenv('BROADCAST_WORKERS', '8')),
+    'batch_size': int(os.getenv('BROADCAST_BATCH_SIZE', '500')),
+    'checkpoint_every': int(os.getenv('BROADCAST_CHECKPOINT_EVERY', '25')),
+    'progress_interval': int(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5')),
+    'max_retries': int(os.getenv('BROADCAST_MAX_RETRIES', '3')),
+}
+
+# Outgoing HTTP to payment providers (one pooled keep-alive session, run off the event loop)
+# - connect_timeout / timeouts: connect timeout, and read timeout per endpoint (seconds)
+# - retries / backoff: extra attempts with jittered exponential backoff; non-idempotent
+#   calls (invoice creation) only retry when the request never reached the server
+# - breaker_failures / breaker_cooldown: consecutive failures that open a provider's circuit,
+#   and seconds calls fail fast before the provider is tried again
+HTTP_CLIENT = {
+    'pool_size': int(os.getenv('HTTP_POOL_SIZE', '10')),
+    'connect_timeout': float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+    'timeouts': {
+        'upi/create': float(os.getenv('HTTP_TIMEOUT_UPI_CREATE', '15')),
+        'upi/verify': float(os.getenv('HTTP_TIMEOUT_UPI_VERIFY', '8')),
+        'oxapay/invoice': float(os.getenv('HTTP_TIMEOUT_OXAPAY', '15')),
+    },
+    'retries': int(os.getenv('HTTP_RETRIES', '2')),
+    'backoff': float(os.getenv('HTTP_BACKOFF', '0.5')),
+    'breaker_failures': int(os.getenv('HTTP_BREAKER_FAILURES', '5')),
+    'breaker_cooldown': int(os.getenv('HTTP_BREAKER_COOLDOWN', '60')),
+}
+
+# Embedded HTTP server (payment gateway webhooks)
+# - enabled/host/port: where the bot listens; expose it publicly (or via a reverse proxy)
+# - upi_notification_url: sent to the UPI gateway as notification_url on invoice creation
+# - upi_secret: HMAC-SHA256 key for the UPI gateway's X-Signature header; /upi/webhook is
+#   disabled while it is unset. Oxapay callbacks are signed with the merchant key
+#   (HMAC-SHA512, HMAC header); /oxapay/webhook is disabled without one
+# - max_body: largest request body accepted, in bytes
+# - metrics_token: if set, GET /metrics (Prometheus text format) requires
+#   "Authorization: Bearer <token>"
+HTTP_SERVER = {
+    'enabled': os.getenv('HTTP_SERVER_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'on'),
+    'host': os.getenv('HTTP_SERVER_HOST', '0.0.0.0'),
+    'port': int(os.getenv('HTTP_SERVER_PORT', os.getenv('PORT', '8080'))),
+    'upi_notification_url': os.getenv('UPI_NOTIFICATION_URL', 'ADSYEads.site'),
+    'upi_secret': os.getenv('UPI_WEBHOOK_SECRET', ''),
+    'max_body': int(os.getenv('HTTP_SERVER_MAX_BODY', '65536')),
+    'metrics_token': os.getenv('METRICS_TOKEN', ''),
+}
+
+# Slow button actions (refresh, start all, payment verify) answer the tap at once and finish
+# in the background, editing the message with the result
+# - per_user: background callback jobs one user may have running at a time
+CALLBACK_JOBS = {
+    'per_user': int(os.getenv('CALLBACK_JOBS_PER_USER', '2')),
+}
+
+# Per-route latency stats for the main bot (shown to admins in /ping)
+# - samples: most recent calls kept per route for the p50/p95/p99 histograms
+# - top: slowest routes (by p95) listed in /ping; "/ping routes" lists all of them
+ROUTE_STATS = {
+    'samples': int(os.getenv('ROUTE_STATS_SAMPLES', '512')),
+    'top': int(os.getenv('ROUTE_STATS_TOP', '5')),
+}
+
+# Logging (bot.py writes through a queue; a background thread does the actual I/O)
+# - level: DEBUG for per-decision detail (e.g. start-all-ads checks); costs nothing when off
+# - format: 'text' (key=value fields) or 'json' (one object per line, for log collectors)
+# - send_sample: keep 1 of every N per-send forwarding lines (1 = log every send)
+# - queue_size: records buffered for the writer thread; newer records are dropped when full
+LOGGING = {
+    'level': os.getenv('LOG_LEVEL', 'INFO').upper(),
+    'format': os.getenv('LOG_FORMAT', 'text').lower(),
+    'send_sample': max(1, int(os.getenv('LOG_SEND_SAMPLE', '20'))),
+    'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+}
+
+# Premium expiry sweeper (downgrades expired users, sends reminders before expiry)
+# - sweep_interval: seconds between sweeps (one indexed users query each)
+# - remind_before_hours: send one reminder when expiry is this close
+# - batch_size: users downgraded per bulk write
+PREMIUM_EXPIRY = {
+    'sweep_interval': int(os.getenv('PREMIUM_SWEEP_INTERVAL', '300')),
+    'remind_before_hours': int(os.getenv('PREMIUM_REMIND_BEFORE_HOURS', '72')),
+    'batch_size': int(os.getenv('PREMIUM_SWEEP_BATCH', '500')),
+}
+
+# Hourly delivery metrics (per account and per target group, shown in Analytics)
+# - flush_interval: seconds between buffered $inc flushes to Mongo
+# - retention_days: hourly buckets older than this are removed by a TTL index
+# - shard: worker/shard label on every series exported at /metrics
+# - loop_lag_interval: seconds between event-loop lag probes
+# - block_threshold: a watchdog thread samples the loop's stack when it has not run for this
+#   many seconds; /blocking lists the worst offenders
+# - block_top: entries shown by /blocking
+# - system_interval / system_samples: a background sampler records CPU, RSS, open fds, task
+#   counts and loop lag every system_interval seconds, keeping the last system_samples
+#   (/ping reads the newest one and draws trends from the rest)
+# - counts_interval: seconds between background refreshes of the user/account counts in /ping
+METRICS = {
+    'flush_interval': int(os.getenv('METRICS_FLUSH_INTERVAL', '15')),
+    'retention_days': int(os.getenv('METRICS_RETENTION_DAYS', '35')),
+    'shard': os.getenv('SHARD_ID', '0'),
+    'loop_lag_interval': float(os.getenv('LOOP_LAG_INTERVAL', '0.5')),
+    'block_threshold': float(os.getenv('BLOCK_THRESHOLD', '0.25')),
+    'block_top': int(os.getenv('BLOCK_TOP', '5')),
+    'system_interval': float(os.getenv('SYSTEM_SAMPLE_INTERVAL', '5')),
+    'system_samples': int(os.getenv('SYSTEM_SAMPLES', '120')),
+    'counts_interval': int(os.getenv('PING_COUNTS_INTERVAL', '60')),
+}
+
+# Per-(account, group) health scores used to order forwarding rounds
+# - alpha: weight of the newest outcome in the moving average (0-1)
+# - initial: score of a group with no history
+# - backoff_base / permanent_backoff: first retry delay (seconds) after repeated errors /
+#   after a ban or write-forbidden error; doubles per further failure up to backoff_max
+# - flush_interval: seconds between writes of changed scores to Mongo
+TARGET_HEALTH = {
+    'alpha': float(os.getenv('HEALTH_ALPHA', '0.3')),
+    'initial': float(os.getenv('HEALTH_INITIAL', '0.75')),
+    'backoff_base': int(os.getenv('HEALTH_BACKOFF_BASE', '1800')),
+    'permanent_backoff': int(os.getenv('HEALTH_PERMANENT_BACKOFF', '21600')),
+    'backoff_max': int(os.getenv('HEALTH_BACKOFF_MAX', '604800')),
+    'flush_interval': int(os.getenv('HEALTH_FLUSH_INTERVAL', '60')),
+}
@@ -29,6 +29,7 @@ INTEGRATION GUIDE FOR OTHER BOTS:
    from pyrogram import Client, filters
    from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
    from pyrogram.enums import ParseMode
+   import asyncio
    import requests
    import qrcode
    import os
@@ -80,7 +81,9 @@ INTEGRATION GUIDE FOR OTHER BOTS:
    User scans & pays → Clicks verify → Payment verified → Credits added
 
 10. ERROR HANDLING:
-    - Network timeouts (15s)
+    - Requests run in a worker thread (asyncio.to_thread) on a pooled keep-alive
+      session, so a slow gateway never blocks the bot's event loop
+    - Network timeouts (5s connect / 15s read)
     - Gateway connection errors
     - Invalid responses
     - All errors logged automatically
@@ -92,6 +95,10 @@ INTEGRATION GUIDE FOR OTHER BOTS:
 # Gateway API Base URL - Change this to your gateway provider
 GATEWAY_URL = "https://oddus-gateway.vercel.app"
 
+# Shared keep-alive session (connection pooling across gateway calls)
+GATEWAY_SESSION = requests.Session()
+GATEWAY_TIMEOUT = (5, 15)  # (connect, read) seconds
+
 
 
 
@@ -135,7 +142,9 @@ async def _call_gateway(endpoint, payload):
             print(f"Error: {result}")
     
     Integration Notes:
-        - Timeout is set to 15 seconds to prevent hanging
+        - The blocking HTTP call runs via asyncio.to_thread() so other handlers
+          keep running while the gateway responds
+        - Timeout is 5s to connect and 15s to read, to prevent hanging
         - Logs all errors automatically using the 'log' instance
         - Returns False on any exception or non-200 status code
         - Validates that response has 'status': 'success' field
@@ -144,8 +153,8 @@ async def _call_gateway(endpoint, payload):
         # Construct full API URL
         url = f"{GATEWAY_URL}/{endpoint}"
         
-        # Make POST request with JSON payload and 15-second timeout
-        resp = requests.post(url, json=payload, timeout=15)
+        # POST on the pooled session in a worker thread (never blocks the event loop)
+        resp = await asyncio.to_thread(GATEWAY_SESSION.post, url, json=payload, timeout=GATEWAY_TIMEOUT)
         
         # Check if request was successful (HTTP 200)
         if resp.status_code == 200:
@@ -0,0 +1,697 @@
+"""Benchmark the forwarding loops offline against fake Telegram and Mongo backends.
+
+Usage (from the repo root):
+    python tools/bench_forwarding.py [--loop run|forwarder|callbacks] [--accounts 15] [--groups 200]
+                                     [--rounds 3] [--latency 0] [--flood-rate 0.01]
+                                     [--forbidden-rate 0.02] [--topic-share 0.25]
+                                     [--delay-scale 0] [--tracemalloc] [--verbose]
+
+Every account forwards to --groups target groups (the first --topic-share of them are forum
+topics added by link, the rest auto-joined groups) for --rounds rounds. Nothing leaves the
+process: account_client() returns a FakeClient whose RPCs take --latency seconds and whose
+forwards fail with FloodWait (--flood-rate, per attempt) or ChatWriteForbidden (a fixed
+--forbidden-rate share of the groups), and every *_col collection is an in-memory
+FakeCollection that counts operations. Bot delays (msg/group/round) are multiplied by
+--delay-scale, so 0 runs the rounds back to back.
+
+--loop callbacks presses buttons instead: every round taps each account's menu and stats
+(CALLBACK_TAPS), then Start All and Stop All, through the same callback router and handler
+wrapper main_bot uses. It reports time, Mongo ops and RPCs per tap for each route. Answers and
+edits count as RPCs.
+
+Reports sends/sec, Mongo ops and RPCs per send, CPU time per send and peak memory. The fakes'
+own work is included in the CPU and memory numbers, so compare runs with each other (before
+and after a change) rather than reading them as production figures.
+
+Importing bot needs the usual runtime deps (telethon, pymongo, ...) but no network:
+MONGO_URI defaults to a local URI with a short server-selection timeout.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=200')
+
+from bson.objectid import ObjectId  # noqa: E402
+from pymongo.collection import Collection  # noqa: E402
+from telethon.errors import ChatWriteForbiddenError, FloodWaitError  # noqa: E402
+from telethon.tl.functions.messages import ForwardMessagesRequest  # noqa: E402
+from telethon.tl.types import InputPeerChannel  # noqa: E402
+
+import bot  # noqa: E402
+
+counters = Counter()  # 'mongo', 'mongo:<collection>.<method>', 'rpc', 'rpc:<request>', outcomes
+tap_stats = {}  # {callback route: Counter('taps', 'ms', 'mongo', 'rpc')}, --loop callbacks only
+
+
+# ===================== In-memory Mongo =====================
+
+_MISSING = object()
+
+
+def _compare(value, op, arg):
+    if op == '$exists':
+        return (value is not _MISSING) == bool(arg)
+    if op == '$ne':
+        return value != arg
+    if op == '$in':
+        return value in arg
+    if op == '$nin':
+        return value not in arg
+    if value is _MISSING or value is None:
+        return False
+    if op == '$gt':
+        return value > arg
+    if op == '$gte':
+        return value >= arg
+    if op == '$lt':
+        return value < arg
+    if op == '$lte':
+        return value <= arg
+    raise NotImplementedError(f"query operator {op}")
+
+
+def _expr(doc, expr):
+    """$expr with a single $eq/$ne over field references ('$field') and literals."""
+    (op, (a, b)), = expr.items()
+    a, b = (doc.get(v[1:]) if isinstance(v, str) and v.startswith('$') else v for v in (a, b))
+    if op == '$eq':
+        return a == b
+    if op == '$ne':
+        return a != b
+    raise NotImplementedError(f"$expr operator {op}")
+
+
+def _matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == '$or':
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == '$and':
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == '$expr':
+            if not _expr(doc, cond):
+                return False
+            continue
+        value = doc.get(key, _MISSING)
+        if isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond):
+            if not all(_compare(value, op, arg) for op, arg in cond.items() if op != '$options'):
+                return False
+        elif value != cond and not (isinstance(value, list) and cond in value):
+            return False
+    return True
+
+
+def _apply_update(doc, update, inserting):
+    for op, fields in update.items():
+        if op == '$set' or (op == '$setOnInsert' and inserting):
+            doc.update(fields)
+        elif op == '$setOnInsert':
+            continue
+        elif op == '$inc':
+            for k, v in fields.items():
+                doc[k] = doc.get(k, 0) + v
+        elif op == '$unset':
+            for k in fields:
+                doc.pop(k, None)
+        elif op in ('$max', '$min'):
+            for k, v in fields.items():
+                if k not in doc or (v > doc[k] if op == '$max' else v < doc[k]):
+                    doc[k] = v
+        elif op == '$push':
+            for k, v in fields.items():
+                items = doc.setdefault(k, [])
+                if isinstance(v, dict) and '$each' in v:
+                    items.extend(v['$each'])
+                    if '$slice' in v:
+                        doc[k] = items[v['$slice']:] if v['$slice'] < 0 else items[:v['$slice']]
+                else:
+                    items.append(v)
+        else:
+            raise NotImplementedError(f"update operator {op}")
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self._iter = None
+
+    def sort(self, key, direction=1):
+        if isinstance(key, list):
+            for k, d in reversed(key):
+                self.docs.sort(key=lambda doc: doc.get(k) or 0, reverse=d < 0)
+        else:
+            self.docs.sort(key=lambda doc: doc.get(key) or 0, reverse=direction < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def close(self):
+        self._iter = iter(())
+
+    def __iter__(self):
+        # One pass, like a real cursor (the expiry sweep reads it in islice batches)
+        return self
+
+    def __next__(self):
+        if self._iter is None:
+            self._iter = iter(self.docs)
+        return next(self._iter)
+
+
+class FakeCollection:
+    """The subset of pymongo's Collection the bot uses; every call is one counted op.
+
+    Plain equality queries go through hash indexes built on first use (and dropped when an
+    update touches one of their fields), so the fake stays O(1) per op like indexed Mongo.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.indexes = {}  # {sorted field names: {values: [docs]}, or None when not indexable}
+
+    def _count(self, method):
+        counters['mongo'] += 1
+        counters[f"mongo:{self.name}.{method}"] += 1
+
+    def _index(self, fields):
+        if fields not in self.indexes:
+            index = {}
+            for doc in self.docs:
+                values = tuple(doc.get(f, _MISSING) for f in fields)
+                if any(isinstance(v, list) for v in values):
+                    index = None
+                    break
+                index.setdefault(values, []).append(doc)
+            self.indexes[fields] = index
+        return self.indexes[fields]
+
+    def _find(self, query):
+        fields = tuple(sorted(query or ()))
+        if fields and not any(f.startswith('$') for f in fields):
+            values = tuple(query[f] for f in fields)
+            try:
+                hash(values)  # operator dicts are unhashable and take the scan below
+            except TypeError:
+                pass
+            else:
+                index = self._index(fields)
+                if index is not None:
+                    return list(index.get(values, ()))
+        return [doc for doc in self.docs if _matches(doc, query)]
+
+    def _insert(self, doc):
+        """Add a document without counting an op (also used to seed the scenario)."""
+        doc = dict(doc)
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(doc)
+        for fields in list(self.indexes):
+            values = tuple(doc.get(f, _MISSING) for f in fields)
+            if self.indexes[fields] is None or any(isinstance(v, list) for v in values):
+                self.indexes.pop(fields)
+            else:
+                self.indexes[fields].setdefault(values, []).append(doc)
+        return doc
+
+    def _touched(self, fields):
+        """Drop the indexes over fields that were just modified in place."""
+        fields = set(fields)
+        self.indexes = {k: v for k, v in self.indexes.items() if not fields & set(k)}
+
+    def _update(self, query, update, upsert, many):
+        found = self._find(query)
+        if not many:
+            found = found[:1]
+        for doc in found:
+            _apply_update(doc, update, inserting=False)
+        if found:
+            self._touched(k for fields in update.values() for k in fields)
+        elif upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+            _apply_update(doc, update, inserting=True)
+            self._insert(doc)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found), upserted_id=None)
+
+    def _delete(self, found):
+        gone = {id(doc) for doc in found}
+        self.docs = [doc for doc in self.docs if id(doc) not in gone]
+        self.indexes = {}
+        return SimpleNamespace(deleted_count=len(gone))
+
+    def find_one(self, query=None, projection=None, *args, **kwargs):
+        self._count('find_one')
+        found = self._find(query)
+        return dict(found[0]) if found else None
+
+    def find(self, query=None, projection=None, *args, **kwargs):
+        self._count('find')
+        return FakeCursor([dict(doc) for doc in self._find(query)])
+
+    def count_documents(self, query, **kwargs):
+        self._count('count_documents')
+        return len(self._find(query))
+
+    def insert_one(self, doc):
+        self._count('insert_one')
+        doc.setdefault('_id', ObjectId())
+        self._insert(doc)
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    def insert_many(self, docs, **kwargs):
+        self._count('insert_many')
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+            self._insert(doc)
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        self._count('update_one')
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False, **kwargs):
+        self._count('update_many')
+        return self._update(query, update, upsert, many=True)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=False, **kwargs):
+        """Returns the document before the update, or after it with ReturnDocument.AFTER (True)."""
+        self._count('find_one_and_update')
+        found = self._find(query)[:1]
+        if found:
+            doc = found[0]
+            before = dict(doc)
+            _apply_update(doc, update, inserting=False)
+            self._touched(k for fields in update.values() for k in fields)
+        elif upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
+            _apply_update(doc, update, inserting=True)
+            doc, before = self._insert(doc), None
+        else:
+            return None
+        return dict(doc) if return_document else before
+
+    def delete_one(self, query):
+        self._count('delete_one')
+        return self._delete(self._find(query)[:1])
+
+    def delete_many(self, query):
+        self._count('delete_many')
+        return self._delete(self._find(query))
+
+    def bulk_write(self, requests, ordered=True):
+        self._count('bulk_write')
+        for op in requests:
+            self._update(op._filter, op._doc, op._upsert, many=False)
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+
+def install_fake_mongo():
+    """Swap every module-level *_col collection in bot for an empty FakeCollection."""
+    fakes = {}
+    for name, value in list(vars(bot).items()):
+        if name.endswith('_col') and isinstance(value, (Collection, FakeCollection)):
+            fakes[name] = FakeCollection(value.name)
+            setattr(bot, name, fakes[name])
+    return fakes
+
+
+# ===================== Fake Telegram =====================
+
+class Scenario:
+    """Target groups shared by every account, plus the failure model."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.by_username = {}
+        self.by_id = {}
+        self.groups = []
+        n_topics = round(args.groups * args.topic_share)
+        for j in range(args.groups):
+            group_id = 1_000_000 + j
+            forum = j < n_topics
+            username = f"bench_forum_{j}" if forum else (f"bench_group_{j}" if j % 2 == 0 else None)
+            entity = SimpleNamespace(id=group_id, title=f"Bench group {j}", username=username, forum=forum)
+            self.by_id[group_id] = self.by_id[int(f"-100{group_id}")] = entity
+            if username:
+                self.by_username[username] = entity
+            self.groups.append(entity)
+        forbidden = round(args.groups * args.forbidden_rate)
+        self.forbidden = {g.id for g in self.rng.sample(self.groups, forbidden)}
+        self.rounds_started = Counter()
+        self.on_round = None  # optional async hook(account_id, round), run as each round loads its ads
+        self.next_msg_id = 1
+
+    def ads(self):
+        # Two single-message ads and one three-photo album, as load_ad_units() sees them
+        album = [SimpleNamespace(id=10 + k, text='' if k else 'Album ad', media=True, grouped_id=77) for k in range(3)]
+        singles = [SimpleNamespace(id=k, text=f"Ad {k}", media=None, grouped_id=None) for k in (1, 2)]
+        return list(reversed(singles + album))  # newest first
+
+
+class FakeClient:
+    """Stands in for TelegramClient: counts RPCs, sleeps --latency and injects errors."""
+
+    def __init__(self, scenario, acc):
+        self.scenario = scenario
+        self.acc = acc
+        self.resolved = set()
+
+    async def _rpc(self, name):
+        counters['rpc'] += 1
+        counters[f"rpc:{name}"] += 1
+        if self.scenario.args.latency:
+            await asyncio.sleep(self.scenario.args.latency)
+
+    async def connect(self):
+        counters['connects'] += 1
+
+    async def disconnect(self):
+        pass
+
+    async def start(self):
+        return self
+
+    async def is_user_authorized(self):
+        await self._rpc('GetStateRequest')
+        return True
+
+    def set_proxy(self, proxy):
+        pass
+
+    def on(self, *args, **kwargs):
+        return lambda handler: handler
+
+    async def iter_messages(self, entity, limit=None):
+        account_id = self.acc['_id']
+        self.scenario.rounds_started[account_id] += 1
+        if self.scenario.rounds_started[account_id] > self.scenario.args.rounds:
+            # Done: stop the account the way /stop does (not counted as a bot op)
+            for doc in bot.accounts_col.docs:
+                if doc['_id'] == account_id:
+                    doc['is_forwarding'] = False
+            bot.accounts_col._touched(['is_forwarding'])
+            return
+        if self.scenario.on_round:
+            await self.scenario.on_round(account_id, self.scenario.rounds_started[account_id])
+        await self._rpc('GetHistoryRequest')
+        for msg in self.scenario.ads()[:limit]:
+            yield msg
+
+    async def get_entity(self, peer):
+        if isinstance(peer, str):
+            entity = self.scenario.by_username.get(peer.lstrip('@'))
+            if entity is not None and peer not in self.resolved:
+                await self._rpc('ResolveUsernameRequest')
+                self.resolved.add(peer)
+        else:
+            entity = self.scenario.by_id.get(peer)
+        if entity is None:
+            raise ValueError(f"Could not find the input entity for {peer!r}")
+        return entity
+
+    async def __call__(self, request):
+        return await self._call(None, request)
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        await self._rpc(type(request).__name__)
+        if not isinstance(request, ForwardMessagesRequest):
+            return None
+        scenario = self.scenario
+        peer = request.to_peer
+        group_id = peer.channel_id if isinstance(peer, InputPeerChannel) else peer.id
+        counters['attempts'] += 1
+        if group_id in scenario.forbidden:
+            counters['forbidden'] += 1
+            raise ChatWriteForbiddenError(request=request)
+        if scenario.rng.random() < scenario.args.flood_rate:
+            counters['flood'] += 1
+            raise FloodWaitError(request=request, capture=scenario.rng.randint(30, 600))
+        counters['sent'] += 1
+        if request.top_msg_id:
+            counters['topic_sends'] += 1
+        first = scenario.next_msg_id
+        scenario.next_msg_id += len(request.id)
+        return SimpleNamespace(updates=[
+            SimpleNamespace(message=SimpleNamespace(id=first + k)) for k in range(len(request.id))
+        ])
+
+
+class ScaledAsyncio:
+    """bot's view of asyncio with every sleep multiplied by --delay-scale."""
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay, result=None):
+        return await asyncio.sleep(delay * self.scale, result)
+
+
+# ===================== Scenario setup =====================
+
+def seed_data(scenario, args):
+    """One Dominion user owning --accounts accounts, each targeting every scenario group."""
+    user_id = 10_001
+    bot.users_col._insert({
+        '_id': ObjectId(), 'user_id': user_id, 'tier': 'premium', 'plan_name': 'dominion',
+        'max_accounts': max(15, args.accounts), 'approved': True, 'forwarding_mode': 'both',
+        'premium_expires_at': datetime.now() + timedelta(days=30), 'created_at': datetime.now(),
+    })
+    topic = bot.TOPICS[0]
+    account_ids = []
+    for i in range(args.accounts):
+        account_id = ObjectId()
+        account_ids.append(account_id)
+        bot.accounts_col._insert({
+            '_id': account_id, 'owner_id': user_id, 'phone': f"+1555{i:07d}", 'session': '',
+            'is_forwarding': True, 'added_at': datetime.now(),
+        })
+        owner_key = str(account_id)  # both loops look groups up by the string id first
+        for j, g in enumerate(scenario.groups):
+            if g.forum:
+                link = f"https://t.me/{g.username}/{1 + j % 5}"
+                bot.account_topics_col._insert({
+                    '_id': ObjectId(), 'account_id': owner_key, 'topic': topic,
+                    'link': link, 'url': link, 'title': g.title,
+                })
+            else:
+                bot.account_auto_groups_col._insert({
+                    '_id': ObjectId(), 'account_id': owner_key, 'group_id': g.id,
+                    'access_hash': g.id * 7919, 'username': g.username, 'title': g.title,
+                })
+    return user_id, account_ids, topic
+
+
+# ===================== Callback taps =====================
+
+# Pressed for every account, every round; each round then ends with Start All / Stop All
+CALLBACK_TAPS = ('acc_{account}', 'stats_{account}')
+
+
+class FakeCallbackEvent:
+    """A button tap as the callback router sees it; answers and edits count as Bot API RPCs."""
+
+    def __init__(self, user_id, data):
+        self.sender_id = self.chat_id = user_id
+        self.data = data.encode()
+        self.replies = []
+        self.finished = None  # (perf_counter, counters copy) at the last answer/edit
+
+    def _reply(self, request, text):
+        counters['rpc'] += 1
+        counters[f"rpc:{request}"] += 1
+        self.replies.append(text)
+        self.finished = time.perf_counter(), counters.copy()
+
+    async def answer(self, text=None, **kwargs):
+        self._reply('SetBotCallbackAnswerRequest', text)
+
+    async def edit(self, text=None, **kwargs):
+        self._reply('EditMessageRequest', text)
+
+    async def respond(self, text=None, **kwargs):
+        self._reply('SendMessageRequest', text)
+
+    async def delete(self):
+        self._reply('DeleteMessagesRequest', None)
+
+
+dispatch_callback = bot._timed_handler('callback', bot.callback)  # as main_bot registers it
+
+
+async def tap(user_id, data):
+    """Press one button through the callback router and charge it to its route in tap_stats.
+
+    A tap is measured up to its last answer/edit, including work answer_then_run() finishes
+    in the background, but not the forwarding loops it starts.
+    """
+    event = FakeCallbackEvent(user_id, data)
+    route, _ = bot.match_callback_route(data)
+    started, before = time.perf_counter(), counters.copy()
+    await dispatch_callback(event)
+    await asyncio.gather(*bot.callback_jobs.get(user_id, ()))
+    finished, after = event.finished or (time.perf_counter(), counters.copy())
+    stats = tap_stats.setdefault(route['name'] if route else data, Counter())
+    stats['taps'] += 1
+    stats['ms'] += (finished - started) * 1000
+    for key in ('mongo', 'rpc'):
+        stats[key] += after[key] - before[key]
+    return event
+
+
+async def run_callbacks(args, user_id, account_ids):
+    bot.forcejoin_passed_until[user_id] = float('inf')  # membership already verified
+    for doc in bot.accounts_col.docs:
+        doc['is_forwarding'] = False  # idle, so Start All has every account to start
+    bot.accounts_col._touched(['is_forwarding'])
+    for _ in range(args.rounds):
+        for account_id in account_ids:
+            for data in CALLBACK_TAPS:
+                await tap(user_id, data.format(account=account_id))
+        await tap(user_id, 'start_all_ads')
+        loops = list(bot.forwarding_tasks.values())
+        await tap(user_id, 'stop_all_ads')
+        await asyncio.gather(*loops, return_exceptions=True)
+
+
+def install_fake_client(scenario):
+    async def fake_account_client(acc, session=None):
+        client = FakeClient(scenario, acc)
+        bot._patch_client_rpc_timing(client)
+        return client
+
+    bot.account_client = fake_account_client
+
+
+async def run(args):
+    scenario = Scenario(args)
+    fakes = install_fake_mongo()
+    user_id, account_ids, topic = seed_data(scenario, args)
+    install_fake_client(scenario)
+    bot.asyncio = ScaledAsyncio(args.delay_scale)
+    counters.clear()
+
+    tap_stats.clear()
+
+    started_wall, started_cpu = time.perf_counter(), time.process_time()
+    if args.loop == 'callbacks':
+        tasks = [run_callbacks(args, user_id, account_ids)]
+    elif args.loop == 'run':
+        tasks = [bot.run_forwarding_loop(user_id, account_id) for account_id in account_ids]
+    else:
+        tasks = [bot.forwarder_loop(str(account_id), topic, user_id) for account_id in account_ids]
+    try:
+        # A loop stuck on a repeating error retries with its delays scaled away; don't spin forever
+        await asyncio.wait_for(asyncio.gather(*tasks), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"warning: loops still running after {args.timeout:g}s (rerun with --log-level INFO)")
+    # Periodic batched writes, charged to this run
+    bot.flush_metrics()
+    bot.flush_target_health()
+    wall = time.perf_counter() - started_wall
+    cpu = time.process_time() - started_cpu
+    return wall, cpu, fakes
+
+
+def report_memory(traced_peak):
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = peak_rss / (1024 ** 2) if sys.platform == 'darwin' else peak_rss / 1024
+    line = f"memory     peak RSS {peak_rss:.1f}MB"
+    if traced_peak is not None:
+        line += f", peak Python heap during run {traced_peak / (1024 ** 2):.1f}MB"
+    print(line)
+
+
+def report_callbacks(args, wall, cpu, traced_peak):
+    taps = sum(s['taps'] for s in tap_stats.values()) or 1
+    print(f"scenario   callbacks: {args.accounts} accounts x {args.groups} groups x {args.rounds} rounds, "
+          f"latency {args.latency * 1000:g}ms")
+    print(f"wall       {wall:.2f}s  {taps} taps  (loops started by Start All included in wall/cpu)")
+    print(f"cpu        {cpu / taps * 1e6:,.0f}us/tap  ({cpu:.2f}s total)")
+    print()
+    print(f"  {'route':<28}{'taps':>7}{'ms/tap':>10}{'mongo/tap':>11}{'rpc/tap':>9}")
+    for name, s in sorted(tap_stats.items(), key=lambda kv: -kv[1]['ms'] / kv[1]['taps']):
+        n = s['taps']
+        print(f"  {'cb:' + name:<28}{n:>7}{s['ms'] / n:>10.2f}{s['mongo'] / n:>11.1f}{s['rpc'] / n:>9.1f}")
+    print()
+    report_memory(traced_peak)
+
+
+def report(args, wall, cpu, traced_peak):
+    if args.loop == 'callbacks':
+        return report_callbacks(args, wall, cpu, traced_peak)
+    sent = counters['sent'] or 1
+    attempts = counters['attempts']
+    print(f"scenario   {args.loop} loop: {args.accounts} accounts x {args.groups} groups x {args.rounds} rounds, "
+          f"latency {args.latency * 1000:g}ms, delay scale {args.delay_scale:g}")
+    print(f"attempts   {attempts}  (sent {counters['sent']}, topics {counters['topic_sends']}, "
+          f"flood {counters['flood']}, forbidden {counters['forbidden']})")
+    print(f"wall       {wall:.2f}s  {counters['sent'] / wall:,.0f} sends/s")
+    print(f"cpu        {cpu / sent * 1e6:,.0f}us/send  ({cpu:.2f}s total)")
+    print(f"mongo      {counters['mongo'] / sent:.2f} ops/send  ({counters['mongo']} ops)")
+    print(f"rpc        {counters['rpc'] / sent:.2f} rpcs/send  ({counters['rpc']} rpcs, {counters['connects']} connects)")
+    report_memory(traced_peak)
+    if args.verbose:
+        for prefix in ('mongo:', 'rpc:'):
+            print()
+            for key, n in sorted(((k, n) for k, n in counters.items() if k.startswith(prefix)), key=lambda kv: -kv[1]):
+                print(f"  {key[len(prefix):]:<44}{n:>9}{n / sent:>9.2f}/send")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loop', choices=('run', 'forwarder', 'callbacks'), default='run',
+                        help='run_forwarding_loop (Start Ads), forwarder_loop (per-topic) or button taps')
+    parser.add_argument('--accounts', type=int, default=15)
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per fake RPC')
+    parser.add_argument('--flood-rate', type=float, default=0.01)
+    parser.add_argument('--forbidden-rate', type=float, default=0.02)
+    parser.add_argument('--topic-share', type=float, default=0.25)
+    parser.add_argument('--delay-scale', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300, help='give up on the loops after this many seconds')
+    parser.add_argument('--tracemalloc', action='store_true', help='also trace the Python heap peak (slower)')
+    parser.add_argument('--log-level', default='ERROR')
+    parser.add_argument('--verbose', action='store_true', help='break ops down per collection and RPC type')
+    args = parser.parse_args()
+
+    logging.getLogger('adsye').setLevel(args.log_level.upper())
+    if args.tracemalloc:
+        tracemalloc.start()
+    wall, cpu, _ = asyncio.run(run(args))
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    report(args, wall, cpu, traced_peak)
+
+
+if __name__ == '__main__':
+    main()
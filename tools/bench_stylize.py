@@ -0,0 +1,164 @@
+"""Benchmark the stylization engine against the legacy char-by-char implementation.
+
+Usage (from the repo root):
+    python tools/bench_stylize.py [--rounds N]
+
+Importing bot needs the usual runtime deps (telethon, pymongo, ...) but no network:
+MONGO_URI defaults to a local URI with a short server-selection timeout.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=200')
+
+import bot  # noqa: E402
+
+
+# ===================== Legacy engine (pre-tokenizer, kept for comparison) =====================
+
+def legacy_to_monospace_char(ch: str) -> str:
+    o = ord(ch)
+    if 0x41 <= o <= 0x5A:  # A-Z
+        return chr(0x1D670 + (o - 0x41))
+    if 0x61 <= o <= 0x7A:  # a-z
+        return chr(0x1D68A + (o - 0x61))
+    if 0x30 <= o <= 0x39:  # 0-9
+        return chr(0x1D7F6 + (o - 0x30))
+    return ch
+
+
+def legacy_from_monospace_char(ch: str) -> str:
+    o = ord(ch)
+    if 0x1D670 <= o <= 0x1D689:  # A-Z
+        return chr(0x41 + (o - 0x1D670))
+    if 0x1D68A <= o <= 0x1D6A3:  # a-z
+        return chr(0x61 + (o - 0x1D68A))
+    if 0x1D7F6 <= o <= 0x1D7FF:  # 0-9
+        return chr(0x30 + (o - 0x1D7F6))
+    return ch
+
+
+def legacy_stylize_plain(text: str) -> str:
+    if not text:
+        return text
+    return ''.join(legacy_to_monospace_char(c) for c in str(text))
+
+
+def legacy_stylize_html(html: str) -> str:
+    if not html:
+        return html
+
+    s = str(html)
+    out = []
+
+    in_entity = False
+    in_code = False
+
+    i = 0
+    while i < len(s):
+        ch = s[i]
+
+        if ch == '<':
+            j = s.find('>', i + 1)
+            if j == -1:
+                out.append(legacy_to_monospace_char(ch) if not in_code else ch)
+                i += 1
+                continue
+
+            tag = s[i:j + 1]
+            norm_tag = ''.join(legacy_from_monospace_char(c) for c in tag)
+
+            lower = norm_tag.lower()
+            if lower.startswith('<code'):
+                in_code = True
+            elif lower.startswith('</code'):
+                in_code = False
+            elif lower.startswith('<pre'):
+                in_code = True
+            elif lower.startswith('</pre'):
+                in_code = False
+
+            out.append(norm_tag)
+            i = j + 1
+            continue
+
+        if ch == '&':
+            in_entity = True
+            out.append(ch)
+            i += 1
+            continue
+
+        if in_entity:
+            out.append(ch)
+            if ch == ';':
+                in_entity = False
+            i += 1
+            continue
+
+        out.append(legacy_to_monospace_char(ch) if not in_code else ch)
+        i += 1
+
+    return ''.join(out)
+
+
+# ===================== Sample messages =====================
+
+def sample_html(repeat: int = 40) -> str:
+    block = (
+        "<b>📊 Account Analytics</b>\n\n"
+        "<blockquote>Groups: <b>128</b> | Sent: <b>4096</b> | Failed: <b>12</b></blockquote>\n"
+        "Use <code>/start</code> or open <a href=\"https://t.me/example_bot\">the bot</a> &amp; pick a plan.\n"
+        "<pre>raw log line 42: FloodWait 30s</pre>\n"
+        "Tom &lt;admin&gt; said: 3 &gt; 2\n"
+    )
+    return block * repeat
+
+
+def sample_markdown(repeat: int = 40) -> str:
+    block = (
+        "**Your ad is live** in __42 groups__!\n"
+        "Open [the dashboard](https://example.com/dash?id=1) or https://t.me/example_channel.\n"
+        "Run `/status` to check, contact @example_support for help.\n"
+        "```\nsent=120 failed=3 flood=1\n```\n"
+    )
+    return block * repeat
+
+
+def sample_emoji(repeat: int = 40) -> str:
+    block = "🔥🚀 Big SALE 50% OFF ✨ — только сегодня! 🎉 Join now 👉 مرحبا 2024 🎁\n"
+    return block * repeat
+
+
+def bench(fn, arg, rounds: int) -> float:
+    """Best-of-5 mean runtime per call, in microseconds."""
+    times = timeit.repeat(lambda: fn(arg), number=rounds, repeat=5)
+    return min(times) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [
+        ('html', sample_html(), legacy_stylize_html, bot._stylize_html),
+        ('markdown', sample_markdown(), legacy_stylize_plain, bot._stylize_markdown),
+        ('emoji/plain', sample_emoji(), legacy_stylize_plain, bot._stylize_plain),
+        ('button label', '🚀 Start Ads', legacy_stylize_plain, bot._stylize_plain),
+    ]
+
+    print(f"{'case':<14}{'chars':>8}{'legacy us':>12}{'new us':>10}{'speedup':>9}  output")
+    for name, text, old, new in cases:
+        t_old = bench(old, text, args.rounds)
+        t_new = bench(new, text, args.rounds)
+        # Markdown intentionally differs (links/code are preserved); the others must match.
+        same = 'same' if old(text) == new(text) else 'differs'
+        print(f"{name:<14}{len(text):>8}{t_old:>12.1f}{t_new:>10.1f}{t_old / t_new:>8.1f}x  {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Offline regression checks for the forwarding loops, on the fakes from bench_forwarding.py.
+
+Usage (from the repo root):
+    python tools/check_forwarding.py [-k NAME]
+
+Each check starts the loops the way a user does (the /go handler, wrapped like every main-bot
+handler), changes state while a round is running and asserts which delays the next round
+slept with. Delays are recorded, not slept. Exits non-zero if any check fails.
+
+Importing bot needs the usual runtime deps (telethon, pymongo, ...) but no network:
+MONGO_URI defaults to a local URI with a short server-selection timeout.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_forwarding import (  # noqa: E402
+    Scenario, ScaledAsyncio, bot, install_fake_client, install_fake_mongo, seed_data,
+)
+
+
+class RecordingAsyncio(ScaledAsyncio):
+    """Records every bot sleep with the round it happened in, then sleeps 0."""
+
+    def __init__(self, scenario):
+        super().__init__(0)
+        self.scenario = scenario
+        self.sleeps = []  # (round, delay)
+
+    async def sleep(self, delay, result=None):
+        self.sleeps.append((sum(self.scenario.rounds_started.values()), delay))
+        return await super().sleep(delay, result)
+
+    def delays(self, round_no):
+        return {delay for r, delay in self.sleeps if r == round_no}
+
+
+class FakeEvent:
+    def __init__(self, user_id):
+        self.sender_id = user_id
+        self.replies = []
+
+    async def respond(self, text, **kwargs):
+        self.replies.append(text)
+
+
+async def _allow(event):
+    return True
+
+
+async def start_and_run(on_round, plan='dominion', groups=12, rounds=2):
+    """Seed one user with one stopped account, /go, and run the loop to completion."""
+    args = SimpleNamespace(accounts=1, groups=groups, rounds=rounds, latency=0, flood_rate=0,
+                           forbidden_rate=0, topic_share=0, delay_scale=0, seed=1, loop='run')
+    scenario = Scenario(args)
+    install_fake_mongo()
+    user_id, account_ids, _ = seed_data(scenario, args)
+    bot.users_col.update_one({'user_id': user_id}, {'$set': {'plan_name': plan}})
+    bot.accounts_col.update_many({'owner_id': user_id}, {'$set': {'is_forwarding': False}})
+    for state in (bot.forwarding_tasks, bot.target_health, bot._target_health_loaded):
+        state.clear()
+
+    install_fake_client(scenario)
+    recorder = bot.asyncio = RecordingAsyncio(scenario)
+    scenario.on_round = lambda account_id, round_no: on_round(user_id, round_no)
+    bot.enforce_forcejoin_or_prompt = _allow
+
+    # Through the handler wrapper, so the loop is started from inside a tap's context
+    await bot._timed_handler('/go', bot.cmd_go)(FakeEvent(user_id))
+    tasks = list(bot.forwarding_tasks.values())
+    assert tasks, "/go started no forwarding loop"
+    await asyncio.wait_for(asyncio.gather(*tasks), 60)
+    return user_id, recorder
+
+
+def expect_plan_delays(recorder, round_no, plan_key, previous_key):
+    delays = recorder.delays(round_no)
+    plan, previous = bot.PLANS[plan_key], bot.PLANS[previous_key]
+    for field in ('msg_delay', 'round_delay'):
+        assert plan[field] in delays, f"round {round_no}: no {plan_key} {field} ({plan[field]}s) in {sorted(delays)}"
+        assert previous[field] == plan[field] or previous[field] not in delays, \
+            f"round {round_no}: still sleeping {previous_key} {field} ({previous[field]}s)"
+
+
+async def check_plan_change_between_rounds():
+    async def downgrade(user_id, round_no):
+        if round_no == 1:
+            bot.users_col.update_one({'user_id': user_id}, {'$set': {'plan_name': 'grow'}})
+
+    _, recorder = await start_and_run(downgrade)
+    expect_plan_delays(recorder, 1, 'dominion', 'grow')
+    expect_plan_delays(recorder, 2, 'grow', 'dominion')
+
+
+async def check_expiry_sweep_reaches_running_loop():
+    async def expire_and_sweep(user_id, round_no):
+        if round_no == 1:
+            expired = datetime.now() - timedelta(minutes=1)
+            bot.users_col.update_one({'user_id': user_id}, {'$set': {'premium_expires_at': expired}})
+            # In its own context, like premium_expiry_loop: forget_entitlements() there must
+            # not be what clears the loop's memo
+            await asyncio.create_task(bot.sweep_premium_expiry(), context=contextvars.Context())
+            user = bot.users_col.find_one({'user_id': user_id})
+            assert user['tier'] == 'free', f"sweep left tier {user['tier']!r}"
+
+    _, recorder = await start_and_run(expire_and_sweep, plan='prime')
+    expect_plan_delays(recorder, 1, 'prime', 'scout')
+    expect_plan_delays(recorder, 2, 'scout', 'prime')
+
+
+CHECKS = [
+    check_plan_change_between_rounds,
+    check_expiry_sweep_reaches_running_loop,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', help='only run checks whose name contains this')
+    args = parser.parse_args()
+
+    logging.getLogger('adsye').setLevel(logging.ERROR)
+    failed = 0
+    for check in CHECKS:
+        if args.k and args.k not in check.__name__:
+            continue
+        try:
+            asyncio.run(check())
+            print(f"ok    {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL  {check.__name__}: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
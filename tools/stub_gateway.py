@@ -0,0 +1,147 @@
+"""Local stand-in for the UPI gateway and Oxapay callbacks, for testing payment webhooks.
+
+Serve a fake UPI gateway (point the bot at it with GATEWAY_URL=http://127.0.0.1:9000 and
+UPI_NOTIFICATION_URL=http://127.0.0.1:8080/upi/webhook, HTTP_SERVER_ENABLED=true):
+    python tools/stub_gateway.py serve [--port 9000] [--pay-after 10]
+
+Every invoice created through /api/v1/upi/create is "paid" --pay-after seconds later: the
+stub POSTs a signed callback to the invoice's notification_url, and /api/v1/upi/verify
+starts answering "paid".
+
+Fire a single signed callback at the bot:
+    python tools/stub_gateway.py send upi <pay_id> --amount 69
+    python tools/stub_gateway.py send oxapay <track_id> --amount 5
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import HTTP_SERVER, OXAPAY_CONFIG  # noqa: E402
+
+BOT_URL = f"http://127.0.0.1:{HTTP_SERVER['port']}"
+
+invoices = {}  # {pay_id: {'amount', 'notification_url', 'paid'}}
+
+
+def upi_secret():
+    if not HTTP_SERVER['upi_secret']:
+        sys.exit("[stub] set UPI_WEBHOOK_SECRET (the bot disables /upi/webhook without it)")
+    return HTTP_SERVER['upi_secret']
+
+
+def post_callback(url, payload, header, secret, digest):
+    body = json.dumps(payload).encode()
+    signature = hmac.new(secret.encode(), body, digest).hexdigest()
+    req = Request(url, data=body, method='POST',
+                  headers={'Content-Type': 'application/json', header: signature})
+    try:
+        with urlopen(req, timeout=10) as resp:
+            print(f"[stub] {url} -> {resp.status} {resp.read().decode()}")
+    except Exception as e:
+        print(f"[stub] {url} -> {e}")
+
+
+def send_upi(pay_id, amount, url=None):
+    payload = {'status': 'paid', 'pay_id': pay_id}
+    if amount is not None:
+        payload['amount'] = amount
+    post_callback(url or f"{BOT_URL}/upi/webhook", payload, 'X-Signature', upi_secret(), hashlib.sha256)
+
+
+def send_oxapay(track_id, amount, url=None):
+    payload = {'status': 'Paid', 'trackId': track_id, 'type': 'payment'}
+    if amount is not None:
+        payload['amount'] = amount
+    post_callback(url or f"{BOT_URL}/oxapay/webhook", payload, 'HMAC',
+                  OXAPAY_CONFIG.get('merchant_api_key') or '', hashlib.sha512)
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    pay_after = 10.0
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.path == '/api/v1/upi/create':
+            pay_id = f"stub_{uuid.uuid4().hex[:12]}"
+            amount = payload.get('price_amount')
+            invoices[pay_id] = {'amount': amount, 'notification_url': payload.get('notification_url'), 'paid': False}
+            threading.Thread(target=self._pay_later, args=(pay_id,), daemon=True).start()
+            self._json(200, {
+                'status': 'success',
+                'pay_id': pay_id,
+                'upi_link': f"upi://pay?pa=stub@upi&am={amount}&tn={pay_id}",
+                'amount': amount,
+            })
+        elif self.path == '/api/v1/upi/verify':
+            invoice = invoices.get(payload.get('pay_id'))
+            if not invoice:
+                self._json(200, {'status': 'invalid'})
+            else:
+                self._json(200, {'status': 'paid' if invoice['paid'] else 'pending', 'amount': invoice['amount']})
+        else:
+            self._json(404, {'status': 'error', 'message': 'not found'})
+
+    def _pay_later(self, pay_id):
+        time.sleep(self.pay_after)
+        invoice = invoices[pay_id]
+        invoice['paid'] = True
+        url = invoice.get('notification_url') or ''
+        if url.startswith('http'):
+            send_upi(pay_id, invoice['amount'], url)
+        else:
+            print(f"[stub] {pay_id} paid (notification_url {url!r} is not a URL, skipping callback)")
+
+    def log_message(self, fmt, *args):
+        print(f"[stub] {self.command} {self.path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    serve = sub.add_parser('serve', help='run the fake UPI gateway')
+    serve.add_argument('--port', type=int, default=9000)
+    serve.add_argument('--pay-after', type=float, default=10.0)
+
+    send = sub.add_parser('send', help='send one signed callback to the bot')
+    send.add_argument('provider', choices=('upi', 'oxapay'))
+    send.add_argument('invoice_id')
+    send.add_argument('--amount', type=float)
+    send.add_argument('--url', help=f"callback URL (default {BOT_URL}/<provider>/webhook)")
+
+    args = parser.parse_args()
+    if args.cmd == 'serve' or args.provider == 'upi':
+        upi_secret()  # fail fast instead of signing callbacks the bot will reject
+    if args.cmd == 'send':
+        (send_upi if args.provider == 'upi' else send_oxapay)(args.invoice_id, args.amount, args.url)
+        return
+
+    GatewayHandler.pay_after = args.pay_after
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), GatewayHandler)
+    print(f"[stub] UPI gateway on http://127.0.0.1:{args.port} (invoices paid after {args.pay_after}s)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()